@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+Статистика использования бота.
+
+События (просмотр модели, сравнение, расчет, выбор языка) только
+увеличивают счетчики в памяти: общие итоги и кольцо поминутных счетчиков
+за последний час. Фоновая задача раз в flush_interval секунд записывает
+накопленные приращения в SQLite одной транзакцией (по дням) и заранее
+готовит сводку, поэтому отчет для администратора не требует вычислений.
+Итоги из файла загружаются при запуске; top() подсказывает, какие модели
+и сравнения стоит держать прогретыми в кэшах.
+"""
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from collections import Counter, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Сколько ждать, пока файл занят записью состояний или другого процесса (busy_timeout), секунды
+BUSY_TIMEOUT = 30.0
+
+# Виды событий
+VIEW = "view"
+CATEGORY = "category"
+COMPARE = "compare"
+CALC_START = "calc_start"
+CALC_DONE = "calc_done"
+LANGUAGE = "language"
+
+
+class Analytics:
+    """
+    Счетчики событий в памяти с периодической записью в SQLite.
+
+    :param path: файл SQLite (может совпадать с файлом состояний)
+    :param flush_interval: период записи и обновления сводки, секунды
+    :param window_minutes: длина окна «за последнее время», минуты
+    :param top_size: сколько позиций показывать в сводке
+    """
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS analytics ("
+        " day TEXT NOT NULL,"
+        " kind TEXT NOT NULL,"
+        " key TEXT NOT NULL,"
+        " count INTEGER NOT NULL,"
+        " PRIMARY KEY (day, kind, key))"
+    )
+    UPSERT = (
+        "INSERT INTO analytics (day, kind, key, count) VALUES (?, ?, ?, ?)"
+        " ON CONFLICT (day, kind, key) DO UPDATE SET count = count + excluded.count"
+    )
+
+    def __init__(self, path: str, flush_interval: float = 60.0, window_minutes: int = 60, top_size: int = 10):
+        self.flush_interval = flush_interval
+        self.window_minutes = window_minutes
+        self.top_size = top_size
+
+        self.totals: Dict[str, Counter] = {}
+        self._pending: Counter = Counter()
+        # Кольцо поминутных счетчиков: (номер минуты, счетчик по (вид, ключ))
+        self._minutes: Deque[Tuple[int, Counter]] = deque(maxlen=window_minutes)
+        self._flush_task: Optional[asyncio.Task] = None
+        self._write_lock = threading.Lock()
+
+        # Файл открывается и итоги загружаются в start(), а не при импорте
+        self.path = path
+        self._db: Optional[sqlite3.Connection] = None
+        self.summary: Dict[str, Any] = self.summarize()
+
+    # ---------- Запись событий ----------
+
+    def record(self, kind: str, key: str):
+        """Учитывает одно событие"""
+        counter = self.totals.get(kind)
+        if counter is None:
+            counter = self.totals[kind] = Counter()
+        counter[key] += 1
+        self._pending[(kind, key)] += 1
+
+        minute = int(time.time() // 60)
+        if not self._minutes or self._minutes[-1][0] != minute:
+            self._minutes.append((minute, Counter()))
+        self._minutes[-1][1][(kind, key)] += 1
+
+    # ---------- Чтение ----------
+
+    def top(self, kind: str, n: Optional[int] = None) -> List[Tuple[str, int]]:
+        """Самые частые ключи события за все время"""
+        return self.totals.get(kind, Counter()).most_common(n or self.top_size)
+
+    def recent(self, kind: str, n: Optional[int] = None) -> List[Tuple[str, int]]:
+        """Самые частые ключи события за последние window_minutes минут"""
+        oldest = int(time.time() // 60) - self.window_minutes
+        counter: Counter = Counter()
+        for minute, events in self._minutes:
+            if minute > oldest:
+                for (event_kind, key), count in events.items():
+                    if event_kind == kind:
+                        counter[key] += count
+        return counter.most_common(n or self.top_size)
+
+    def summarize(self) -> Dict[str, Any]:
+        """Сводка для отчета; строится при каждой записи на диск"""
+        started = sum(self.totals.get(CALC_START, Counter()).values())
+        done = sum(self.totals.get(CALC_DONE, Counter()).values())
+        return {
+            "views": self.top(VIEW),
+            "recent_views": self.recent(VIEW),
+            "categories": self.top(CATEGORY),
+            "comparisons": self.top(COMPARE),
+            "calculations": self.top(CALC_DONE),
+            "calc_started": started,
+            "calc_done": done,
+            "languages": dict(self.totals.get(LANGUAGE, Counter())),
+            "built_at": time.time(),
+        }
+
+    # ---------- Фоновая запись на диск ----------
+
+    def start(self):
+        """Запускает фоновую задачу: загрузка итогов из файла, затем периодическая запись"""
+        if self._flush_task is None:
+            self._flush_task = asyncio.get_event_loop().create_task(self._flush_loop())
+
+    def _open(self) -> List[tuple]:
+        with self._write_lock:
+            if self._db is not None:
+                return []
+            db = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(self.SCHEMA)
+            db.commit()
+            self._db = db
+            return db.execute("SELECT kind, key, SUM(count) FROM analytics GROUP BY kind, key").fetchall()
+
+    async def _load(self):
+        """Открывает файл в фоновом потоке и добавляет сохраненные итоги к накопленным с запуска"""
+        rows = await asyncio.get_event_loop().run_in_executor(None, self._open)
+        for kind, key, count in rows:
+            self.totals.setdefault(kind, Counter())[key] += count
+        self.summary = self.summarize()
+
+    async def _flush_loop(self):
+        try:
+            await self._load()
+        except Exception as e:
+            logger.error(f"Ошибка загрузки статистики: {e}", exc_info=True)
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка записи статистики: {e}", exc_info=True)
+
+    async def flush(self):
+        """Записывает накопленные приращения одной транзакцией и обновляет сводку"""
+        self.summary = self.summarize()
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, Counter()
+        day = time.strftime("%Y-%m-%d")
+        rows = [(day, kind, key, count) for (kind, key), count in batch.items()]
+        try:
+            await asyncio.get_event_loop().run_in_executor(None, self._write, rows)
+        except Exception:
+            self._pending.update(batch)
+            raise
+
+    def _write(self, rows: List[tuple]):
+        self._open()
+        with self._write_lock:
+            with self._db:
+                self._db.executemany(self.UPSERT, rows)
+
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush()
+        with self._write_lock:
+            if self._db is not None:
+                self._db.close()
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+Микро-бенчмарк фильтров каталога.
+
+Сравнивает стоимость фильтра compare_model_handler на одно обновление:
+старый вариант (список имён собирается заново) против индекса каталога.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_catalog
+"""
+import timeit
+from typing import Any, Dict, List
+
+from main import build_catalog_index
+
+SIZES = (10, 100, 1000, 5000)
+REPEATS = 2000
+
+
+def make_catalog(size: int, categories: int = 10) -> Dict[str, List[Dict[str, Any]]]:
+    """Генерирует синтетический каталог заданного размера"""
+    models: Dict[str, List[Dict[str, Any]]] = {f"Категория {c}": [] for c in range(categories)}
+    for i in range(size):
+        models[f"Категория {i % categories}"].append({
+            "name": f"JCB {i:05d}",
+            "price": f"{1_000_000 + i:,} сум".replace(",", " "),
+            "image": f"https://example.com/{i}.webp",
+            "specs": {"Масса": f"{7000 + i} кг"},
+        })
+    return models
+
+
+def old_filter(models: Dict[str, List[Dict[str, Any]]], text: str) -> bool:
+    return text in [model["name"] for items in models.values() for model in items]
+
+
+def old_lookup(models: Dict[str, List[Dict[str, Any]]], text: str):
+    return next((item for items in models.values() for item in items if item["name"] == text), None)
+
+
+def run():
+    print(f"{'models':>8} {'filter old, µs':>16} {'filter new, µs':>16} "
+          f"{'lookup old, µs':>16} {'lookup new, µs':>16}")
+    for size in SIZES:
+        models = make_catalog(size)
+        catalog = build_catalog_index(models)
+        miss = "неизвестный текст"
+        last = catalog.ordered_names[-1]
+
+        old_f = timeit.timeit(lambda: old_filter(models, miss), number=REPEATS)
+        new_f = timeit.timeit(lambda: miss in catalog.names, number=REPEATS)
+        old_l = timeit.timeit(lambda: old_lookup(models, last), number=REPEATS)
+        new_l = timeit.timeit(lambda: catalog.by_name.get(last), number=REPEATS)
+
+        print(f"{size:>8} {old_f / REPEATS * 1e6:>16.3f} {new_f / REPEATS * 1e6:>16.3f} "
+              f"{old_l / REPEATS * 1e6:>16.3f} {new_l / REPEATS * 1e6:>16.3f}")
+
+
+if __name__ == "__main__":
+    run()
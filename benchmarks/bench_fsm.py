@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк обращений к хранилищу FSM.
+
+Прогоняет через диспетчер main полные сценарии калькулятора (от /start до
+результата) и считает вызовы хранилища состояний: чтения (get_state,
+get_data) и записи (set_state, set_data, update_data, apply_changes).
+Сравниваются прямая работа с хранилищем и единица работы
+(UnitOfWorkStorage), которая читает состояние один раз за обновление и
+записывает изменения одной операцией.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_fsm --users 500
+"""
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter
+from functools import wraps
+
+from aiogram import types
+
+from benchmarks import replay
+
+READS = ("get_state", "get_data")
+WRITES = ("set_state", "set_data", "update_data", "apply_changes")
+
+
+def count_calls(storage, counter: Counter):
+    """Подменяет методы хранилища на экземпляре, чтобы считать их вызовы"""
+    for name in READS + WRITES:
+        method = getattr(storage, name)
+
+        def counted(*args, __method=method, __name=name, **kwargs):
+            counter[__name] += 1
+            return __method(*args, **kwargs)
+
+        setattr(storage, name, wraps(method)(counted))
+
+
+async def run_flows(dp, users: int, first_user_id: int, seed: int) -> float:
+    rng = random.Random(seed)
+    streams = {first_user_id + i: replay.scenario_texts("calculator", rng) for i in range(users)}
+    started = time.perf_counter()
+    for batch in replay.interleave(streams, batch_size=100):
+        await dp.process_updates([types.Update(**raw) for raw in batch])
+    return time.perf_counter() - started
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Обращения к хранилищу FSM за сценарий калькулятора")
+    parser.add_argument("--users", type=int, default=500, help="число сценариев калькулятора")
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args(argv)
+
+
+def run(argv=None):
+    args = parse_args(argv)
+    main = replay.main
+    dp = main.dp
+    replay.install_bot(dp, replay.make_stub_bot())
+    counter: Counter = Counter()
+    count_calls(main.storage, counter)
+
+    loop = asyncio.get_event_loop()
+    variants = (("напрямую", main.storage), ("единица работы", main.fsm_storage))
+    print(f"{'вариант':<15} {'чтений':>7} {'записей':>8} {'сценариев/с':>12}  (на один сценарий)")
+    for offset, (name, fsm_storage) in enumerate(variants):
+        dp.storage = fsm_storage
+        counter.clear()
+        elapsed = loop.run_until_complete(run_flows(dp, args.users, 1_000_000 * (offset + 1), args.seed))
+        reads = sum(counter[op] for op in READS) / args.users
+        writes = sum(counter[op] for op in WRITES) / args.users
+        print(f"{name:<15} {reads:>7.1f} {writes:>8.1f} {args.users / elapsed:>12.0f}")
+    loop.run_until_complete(main.storage.close())
+    loop.run_until_complete(main.storage.wait_closed())
+
+
+if __name__ == "__main__":
+    run()
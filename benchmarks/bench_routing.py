@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк маршрутизации текстовых сообщений.
+
+До: цепочка lambda-фильтров, каждый из которых вызывает get_user/get_text
+или собирает список моделей. После: один поиск в таблице ROUTES в
+RoutingMiddleware и сравнение готового маршрута в фильтрах.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_routing
+"""
+import timeit
+
+import main
+
+REPEATS = 20000
+USER_ID = 1
+
+
+def old_filters():
+    """Фильтры обработчиков в исходном порядке регистрации"""
+    return [
+        lambda m: m in ["🇷🇺 Русский", "🇺🇿 O‘zbekcha"],
+        lambda m: m == main.get_text(USER_ID, "catalog"),
+        lambda m: m in main.DATA.models.keys(),
+        lambda m: m == main.get_text(USER_ID, "calculator"),
+        lambda m: m == main.get_text(USER_ID, "compare"),
+        lambda m: m in [model["name"] for models in main.DATA.models.values() for model in models],
+        lambda m: m.startswith("📞"),
+        lambda m: m.startswith("🔒"),
+    ]
+
+
+NEW_ROUTES = ("language", "catalog", "category", "calculator", "compare", "model", "contact", "policy")
+
+
+def old_dispatch(filters, text):
+    for check in filters:
+        if check(text):
+            return check
+    return None
+
+
+def new_dispatch(text):
+    route = main.resolve_route(text)
+    for expected in NEW_ROUTES:
+        if route == expected:
+            return expected
+    return None
+
+
+def run():
+    filters = old_filters()
+    samples = {
+        "язык": "🇷🇺 Русский",
+        "каталог": main.get_text(USER_ID, "catalog"),
+        "модель": main.DATA.catalog.ordered_names[-1],
+        "политика": main.DATA.texts["ru"]["menu"][-1],
+        "неизвестный": "просто текст",
+    }
+    print(f"{'сообщение':>12} {'до, µs':>10} {'после, µs':>10}")
+    for label, text in samples.items():
+        before = timeit.timeit(lambda: old_dispatch(filters, text), number=REPEATS)
+        after = timeit.timeit(lambda: new_dispatch(text), number=REPEATS)
+        print(f"{label:>12} {before / REPEATS * 1e6:>10.3f} {after / REPEATS * 1e6:>10.3f}")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк пакетного расчета экономии.
+
+Считает сетки сценариев (расход × цена топлива × аренда × срок) размером
+10^5–10^6 одним вызовом calculate_savings и сравнивает со скалярным циклом.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_savings
+"""
+import time
+
+import numpy as np
+
+from savings import calculate_savings
+
+BASE = {
+    "fuel_per_day": 40.0,
+    "fuel_price": 12000.0,
+    "days_per_month": 22.0,
+    "months_total": 12.0,
+    "rent_per_month": 30_000_000.0,
+    "operator_salary": 5_000_000.0,
+    "service_cost": 10_000_000.0,
+    "price": 1_027_000_000.0,
+}
+GRIDS = ((10, 10, 100, 10), (10, 50, 100, 10), (10, 100, 100, 10))
+LOOP_SAMPLE = 2000
+
+
+def make_grid(fuel_n: int, price_n: int, rent_n: int, months_n: int) -> dict:
+    grid = dict(BASE)
+    grid["fuel_per_day"] = np.linspace(20, 60, fuel_n)[:, None, None, None]
+    grid["fuel_price"] = np.linspace(8000, 16000, price_n)[None, :, None, None]
+    grid["rent_per_month"] = np.linspace(15e6, 45e6, rent_n)[None, None, :, None]
+    grid["months_total"] = np.linspace(6, 60, months_n)[None, None, None, :]
+    return grid
+
+
+def run():
+    # Стоимость одного скалярного сценария через тот же движок
+    start = time.perf_counter()
+    for _ in range(LOOP_SAMPLE):
+        calculate_savings(**BASE)
+    scalar = (time.perf_counter() - start) / LOOP_SAMPLE
+
+    print(f"скалярный сценарий: {scalar * 1e6:.1f} µs")
+    print(f"{'сценариев':>12} {'сетка, мс':>10} {'на сценарий, ns':>16} {'цикл (оценка), с':>18}")
+    for shape in GRIDS:
+        grid = make_grid(*shape)
+        start = time.perf_counter()
+        result = calculate_savings(**grid)
+        elapsed = time.perf_counter() - start
+        count = result["saving"].size
+        print(f"{count:>12,} {elapsed * 1e3:>10.1f} {elapsed / count * 1e9:>16.1f} {scalar * count:>18.1f}")
+
+
+if __name__ == "__main__":
+    run()
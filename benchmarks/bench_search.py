@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк поиска моделей.
+
+Строит индекс поиска по каталогу, дополненному синтетическими моделями
+до 10^2–10^4 штук, и измеряет время построения индекса и одного
+запроса — без кэша и из кэша (после первого поиска, который в большом
+индексе импортирует NumPy).
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_search
+"""
+import json
+import random
+import time
+from typing import Any, Dict, List
+
+from main import build_catalog_index, build_search_index
+
+SIZES = (100, 1000, 10000)
+QUERIES = ("3cx pro", "4cx sitemastr", "36c", "мини экскаватор", "ssl 155", "телескоп")
+REPEATS = 200
+SERIES = ("CX", "DX", "JS", "SSL", "HT", "TM", "LC", "VM", "CT", "MX")
+SUFFIXES = ("Eco", "PRO", "PLUS", "Sitemaster", "Compact", "Turbo", "HD", "T4F")
+
+
+def make_catalog(size: int, seed: int = 1) -> Dict[str, List[Dict[str, Any]]]:
+    """Дополняет models.json синтетическими моделями до заданного числа"""
+    rng = random.Random(seed)
+    with open("models.json", encoding="utf-8") as f:
+        models = json.load(f)
+    originals = [(category, model) for category, items in models.items() for model in items]
+    for i in range(size - len(originals)):
+        category, model = rng.choice(originals)
+        name = f"JCB {rng.choice(SERIES)}{rng.randint(10, 999)} {rng.choice(SUFFIXES)} {i}"
+        models[category].append(dict(model, name=name))
+    return models
+
+
+def run():
+    print(f"{'моделей':>8} {'индекс, мс':>11} {'запрос, µs':>11} {'из кэша, µs':>12}")
+    for size in SIZES:
+        catalog = build_catalog_index(make_catalog(size))
+        start = time.perf_counter()
+        index = build_search_index(catalog)
+        built = time.perf_counter() - start
+        # Первый поиск по большому индексу импортирует NumPy и строит массивы: в замер не входит
+        index.search(QUERIES[0])
+
+        start = time.perf_counter()
+        for _ in range(REPEATS):
+            index._cache.clear()
+            for query in QUERIES:
+                index.search(query)
+        uncached = (time.perf_counter() - start) / (REPEATS * len(QUERIES))
+
+        start = time.perf_counter()
+        for _ in range(REPEATS):
+            for query in QUERIES:
+                index.search(query)
+        cached = (time.perf_counter() - start) / (REPEATS * len(QUERIES))
+        print(f"{size:>8} {built * 1e3:>11.1f} {uncached * 1e6:>11.1f} {cached * 1e6:>12.2f}")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк масштабирования на несколько процессов.
+
+Поток обновлений из офлайн-бенчмарка (benchmarks.replay) раскладывается
+через WorkerPool по рабочим процессам, как это делает фронт-процесс бота;
+в каждом процессе работает полный диспетчер main с заглушкой Bot API.
+Для каждого числа процессов выводится пропускная способность, ускорение
+относительно одного процесса и распределение обновлений по процессам.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_sharding --users 4000 --workers 1,2,4
+"""
+import argparse
+import asyncio
+import os
+import queue as queue_module
+import time
+from typing import Any, Dict, List
+
+import multiprocessing
+
+from sharding import WorkerPool, run_worker_loop
+
+# Сколько ждать запуска рабочих процессов, секунды
+STARTUP_TIMEOUT = 60.0
+
+
+def bench_worker(index: int, updates, heartbeat, results):
+    """Рабочий процесс бенчмарка: диспетчер main с заглушкой Bot API"""
+    from aiogram import types
+
+    from benchmarks import replay
+
+    dp = replay.main.dp
+    replay.install_bot(dp, replay.make_stub_bot())
+    stats = {"updates": 0, "first": 0.0, "last": 0.0}
+
+    async def handle(raw: Dict[str, Any]):
+        if not stats["first"]:
+            stats["first"] = time.time()
+        await dp.process_updates([types.Update(**raw)])
+        stats["updates"] += 1
+        stats["last"] = time.time()
+
+    asyncio.get_event_loop().run_until_complete(run_worker_loop(updates, heartbeat, handle))
+    results.put((index, stats))
+
+
+def run_once(workers: int, updates: List[Dict[str, Any]]) -> Dict[str, Any]:
+    results = multiprocessing.get_context("spawn").Queue()
+    pool = WorkerPool(bench_worker, workers, queue_size=10000, args=(results,))
+    pool.start()
+    deadline = time.time() + STARTUP_TIMEOUT
+    while not pool.ready:
+        if time.time() > deadline:
+            pool.stop(timeout=1)
+            raise RuntimeError("рабочие процессы не запустились")
+        time.sleep(0.05)
+
+    started = time.time()
+    for raw in updates:
+        while not pool.dispatch(raw):
+            time.sleep(0.001)
+    pool.stop(timeout=300)
+
+    per_worker = {}
+    for _ in range(workers):
+        try:
+            index, stats = results.get(timeout=5)
+        except queue_module.Empty:
+            break
+        per_worker[index] = stats
+    finished = max((stats["last"] for stats in per_worker.values()), default=started)
+    elapsed = finished - started
+    processed = sum(stats["updates"] for stats in per_worker.values())
+    return {
+        "workers": workers,
+        "updates": processed,
+        "seconds": elapsed,
+        "updates_per_second": processed / elapsed if elapsed else 0.0,
+        "per_worker": [per_worker.get(index, {}).get("updates", 0) for index in range(workers)],
+    }
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Масштабирование обработки обновлений на несколько процессов")
+    parser.add_argument("--users", type=int, default=4000, help="число виртуальных пользователей")
+    parser.add_argument("--workers", default="1,2,4", help="числа процессов через запятую")
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args(argv)
+
+
+def run(argv=None):
+    from benchmarks import replay
+
+    args = parse_args(argv)
+    streams = replay.generate_streams(args.users, args.seed)
+    updates = [raw for batch in replay.interleave(streams, batch_size=len(streams)) for raw in batch]
+    counts = [int(value) for value in args.workers.split(",")]
+
+    print(f"обновлений: {len(updates)}, ядер: {os.cpu_count()}")
+    if max(counts) > (os.cpu_count() or 1):
+        print("внимание: процессов больше, чем ядер — линейного роста не будет")
+    print(f"{'процессов':>9} {'обн./с':>9} {'ускорение':>10}  распределение")
+    base = None
+    for workers in counts:
+        result = run_once(workers, updates)
+        base = base or result["updates_per_second"]
+        speedup = result["updates_per_second"] / base if base else 0.0
+        print(f"{workers:>9} {result['updates_per_second']:>9.0f} {speedup:>9.2f}x  {result['per_worker']}")
+
+
+if __name__ == "__main__":
+    run()
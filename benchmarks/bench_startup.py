@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк холодного запуска.
+
+Каждый замер — отдельный процесс Python: импорт main (загрузка снимка
+данных, создание Bot и диспетчера) и обработка первого обновления /start
+заглушкой Bot API из benchmarks.replay. Время считается от запуска
+процесса. Отдельно выводится время выполнения самого модуля main без
+импорта aiogram и aiohttp, которое не зависит от бота. Выводятся
+медианы и разброс.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_startup --runs 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+STARTED_ENV = "BENCH_STARTED"
+
+
+def child():
+    """Замер внутри дочернего процесса, результат — одна строка JSON в stdout"""
+    started = float(os.environ[STARTED_ENV])
+    import aiohttp.web  # noqa: F401
+    from aiogram import types
+    dependencies = time.time()
+
+    from benchmarks import replay
+    imported = time.time()
+
+    dp = replay.main.dp
+    replay.install_bot(dp, replay.make_stub_bot())
+    update = types.Update(**replay.UpdateFactory().message(1, "/start"))
+    asyncio.get_event_loop().run_until_complete(dp.process_updates([update]))
+    answered = time.time()
+    print(json.dumps({
+        "import": imported - started, "main": imported - dependencies, "first_update": answered - started
+    }))
+
+
+def measure() -> Dict[str, float]:
+    env = dict(os.environ, LOG_FILE="")
+    env[STARTED_ENV] = repr(time.time())
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_startup", "--child"],
+        env=env, check=True, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+    ).stdout
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Время холодного запуска бота")
+    parser.add_argument("--runs", type=int, default=10, help="число замеров")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def run(argv=None):
+    args = parse_args(argv)
+    if args.child:
+        child()
+        return
+
+    samples: List[Dict[str, float]] = [measure() for _ in range(args.runs)]
+
+    print(f"{'':>8} {'импорт, мс':>11} {'из них main, мс':>16} {'первый ответ, мс':>17}")
+    for name, pick in (("медиана", statistics.median), ("мин", min), ("макс", max)):
+        imported = pick(sample["import"] for sample in samples)
+        own = pick(sample["main"] for sample in samples)
+        answered = pick(sample["first_update"] for sample in samples)
+        print(f"{name:>8} {imported * 1e3:>11.0f} {own * 1e3:>16.1f} {answered * 1e3:>17.0f}")
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+Проверка и бенчмарк режима webhook.
+
+Импортирует main в режиме BOT_MODE=webhook, поднимает aiohttp-приложение
+create_webhook_app на локальном порту (с on_startup, который вызывает
+setWebhook) и отправляет на WEBHOOK_PATH синтетические Update в формате
+JSON, как Telegram; ответы бота уходят в заглушку Bot API из
+benchmarks.replay. Сначала проверяются вызов setWebhook при запуске и коды
+ответа: 200 для корректного обновления, 400 для некорректного тела, 403
+при неверном секрете и 503, когда в обработке WEBHOOK_MAX_PENDING
+обновлений. Затем через webhook прогоняется поток обновлений
+benchmarks.replay и выводятся время подтверждения (ответа 200) и
+пропускная способность. При несовпадении проверок процесс завершается
+с кодом 1.
+
+Поток отправляет клиент в отдельном процессе, как внешний Telegram.
+Время подтверждения — это в основном разбор HTTP-запросов пачки: сам
+ответ 200 не ждет обработки, но цикл событий бота один, и запрос пачки
+из --batch-size ждет, пока цикл разберет запросы перед ним и выполнит
+уже запущенную обработку. Это ограничение одного процесса; под нагрузкой
+время подтверждения снижает BOT_WORKERS > 1, где webhook принимает
+фронт-процесс, а обновления обрабатывают рабочие процессы.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_webhook --users 1000 --max-pending 200
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Tuple
+
+SECRET = "bench-secret"
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Проверка и бенчмарк режима webhook")
+    parser.add_argument("--users", type=int, default=1000, help="число виртуальных пользователей")
+    parser.add_argument("--batch-size", type=int, default=100, help="одновременных запросов к webhook")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--api-latency", type=float, default=0.0, help="задержка ответа API, секунды")
+    parser.add_argument("--max-pending", type=int, default=200, help="WEBHOOK_MAX_PENDING")
+    return parser.parse_args(argv)
+
+
+async def wait_processed(pending: set):
+    while pending:
+        await asyncio.wait(list(pending))
+
+
+async def check_statuses(client, main, factory) -> List[Tuple[str, int, int]]:
+    """Коды ответа webhook в типичных и ошибочных случаях: (проверка, ожидалось, получено)"""
+    path = main.Config.WEBHOOK_PATH
+    headers = {SECRET_HEADER: SECRET}
+    checks = [("вызовов setWebhook при запуске", 1, main.dp.bot.api_calls["setWebhook"])]
+
+    response = await client.post(path, json=factory.message(1, "/start"), headers=headers)
+    checks.append(("корректное обновление", 200, response.status))
+    response = await client.post(path, json=factory.message(1, "/start"), headers={SECRET_HEADER: "wrong"})
+    checks.append(("неверный секрет", 403, response.status))
+    response = await client.post(path, json=factory.message(1, "/start"))
+    checks.append(("без секрета", 403, response.status))
+    response = await client.post(path, data=b"{not json", headers=headers)
+    checks.append(("тело не JSON", 400, response.status))
+    response = await client.post(path, json=[1, 2, 3], headers=headers)
+    checks.append(("JSON не объект Update", 400, response.status))
+    await wait_processed(client.server.app["pending_updates"])
+
+    # Медленный API держит обновления в обработке, пока очередь не заполнится
+    bot = main.dp.bot
+    latency, bot.api_latency = bot.api_latency, 1.0
+    limit = main.Config.WEBHOOK_MAX_PENDING
+    statuses = []
+    for user_id in range(limit + 10):
+        response = await client.post(path, json=factory.message(10 + user_id, "/start"), headers=headers)
+        statuses.append(response.status)
+    checks.append((f"первые {limit} при заполнении очереди", 200, max(statuses[:limit])))
+    checks.append(("сверх WEBHOOK_MAX_PENDING", 503, min(statuses[limit:])))
+    await wait_processed(client.server.app["pending_updates"])
+    bot.api_latency = latency
+    response = await client.post(path, json=factory.message(1, "/start"), headers=headers)
+    checks.append(("после разбора очереди", 200, response.status))
+    await wait_processed(client.server.app["pending_updates"])
+    return checks
+
+
+def post_stream(url: str, batches: List[List[Dict[str, Any]]]) -> Dict[str, Any]:
+    """
+    Отправляет пачки обновлений на webhook, каждая пачка — одновременными запросами.
+    Выполняется в отдельном процессе, чтобы время подтверждения не включало
+    работу клиента в цикле событий и под GIL бота.
+    """
+    from aiohttp import ClientSession, TCPConnector
+
+    headers = {SECRET_HEADER: SECRET}
+    acks: List[float] = []
+    rejected = 0
+
+    async def post(session, raw: Dict[str, Any]):
+        nonlocal rejected
+        started = time.perf_counter()
+        async with session.post(url, json=raw, headers=headers) as response:
+            acks.append(time.perf_counter() - started)
+            if response.status != 200:
+                rejected += 1
+
+    async def send() -> float:
+        started = time.perf_counter()
+        async with ClientSession(connector=TCPConnector(limit=0)) as session:
+            for batch in batches:
+                await asyncio.gather(*(post(session, raw) for raw in batch))
+        return time.perf_counter() - started
+
+    acked = asyncio.new_event_loop().run_until_complete(send())
+    acks.sort()
+    return {"updates": sum(len(batch) for batch in batches), "rejected": rejected, "acked": acked, "acks": acks}
+
+
+async def run_benchmark(args: argparse.Namespace, main, replay) -> Tuple[List[Tuple[str, int, int]], Dict[str, Any]]:
+    from aiohttp.test_utils import TestClient, TestServer
+
+    bot = replay.make_stub_bot(args.api_latency)
+    replay.install_bot(main.dp, bot)
+    # on_startup и on_shutdown обращаются к модульному bot
+    main.bot = bot
+    app = main.create_webhook_app(main.dp)
+    async with TestClient(TestServer(app)) as client:
+        factory = replay.UpdateFactory()
+        checks = await check_statuses(client, main, factory)
+        batches = replay.interleave(replay.generate_streams(args.users, args.seed), args.batch_size)
+        started = time.perf_counter()
+        with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as executor:
+            result = await asyncio.get_event_loop().run_in_executor(
+                executor, post_stream, str(client.make_url(main.Config.WEBHOOK_PATH)), batches
+            )
+        await wait_processed(client.server.app["pending_updates"])
+        result["processed"] = time.perf_counter() - started
+    return checks, result
+
+
+def run(argv=None):
+    args = parse_args(argv)
+    # Config читается при импорте main, поэтому окружение задается до него
+    os.environ.setdefault("BOT_TOKEN", "123456:webhook-bench")
+    os.environ.setdefault("LOG_FILE", "")
+    os.environ["BOT_MODE"] = "webhook"
+    os.environ["WEBHOOK_HOST"] = "https://webhook-bench.invalid"
+    os.environ["WEBHOOK_SECRET"] = SECRET
+    os.environ["WEBHOOK_MAX_PENDING"] = str(args.max_pending)
+    os.environ["BACKLOG_MODE"] = "drop"
+    os.environ["RELOAD_INTERVAL"] = "0"
+    from benchmarks import replay
+    main = replay.main
+    logging.getLogger("aiohttp.access").setLevel(logging.WARNING)
+
+    checks, result = asyncio.get_event_loop().run_until_complete(run_benchmark(args, main, replay))
+
+    print(f"{'проверка':<38} {'ожидалось':>9} {'получено':>9}")
+    for name, expected, actual in checks:
+        print(f"{name:<38} {expected:>9} {actual:>9}{'' if expected == actual else '  ОШИБКА'}")
+
+    acks = result["acks"]
+    print(f"\nобновлений: {result['updates']}, отклонено: {result['rejected']}, "
+          f"подтверждено за {result['acked']:.2f} с, обработано за {result['processed']:.2f} с "
+          f"({result['updates'] / result['processed']:.0f} обновлений/с)")
+    print(f"подтверждение: p50 {replay.percentile(acks, 50) * 1000:.1f} мс, "
+          f"p95 {replay.percentile(acks, 95) * 1000:.1f} мс, p99 {replay.percentile(acks, 99) * 1000:.1f} мс")
+    if any(expected != actual for _, expected, actual in checks):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    run()
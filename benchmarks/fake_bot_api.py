@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+Локальная заглушка Telegram Bot API для нагрузочных тестов.
+
+HTTP-сервер aiohttp отвечает на запросы /bot<token>/<method> так же, как
+api.telegram.org, на методы, которые использует бот: sendMessage, sendPhoto,
+edit*, deleteMessage, answerCallbackQuery, answerInlineQuery, getUpdates,
+setWebhook, deleteWebhook, getWebhookInfo, getMe. Остальные методы
+возвращают True. Можно задать задержку ответа и долю ответов 429
+(Too Many Requests); обновления для getUpdates кладутся в очередь через
+FakeBotAPI.enqueue или POST /_updates, счетчики запросов — GET /_stats.
+
+Запуск отдельно (бот подключается через API_SERVER=http://127.0.0.1:8081):
+    python -m benchmarks.fake_bot_api --port 8081 --latency 0.05 --rate-limit 0.01
+"""
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter, deque
+from typing import Any, Callable, Deque, Dict, List
+
+from aiohttp import web
+
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "UHM JCB", "username": "uhm_test_bot"}
+
+
+class FakeBotAPI:
+    """
+    Состояние заглушки Bot API.
+
+    :param latency: задержка ответа, секунды
+    :param jitter: случайная добавка к задержке, от 0 до jitter секунд
+    :param rate_limit: доля запросов с ответом 429
+    :param retry_after: retry_after в ответе 429, секунды
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, rate_limit: float = 0.0,
+                 retry_after: int = 1, seed: int = 1):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.calls: Counter = Counter()
+        self.rate_limited: Counter = Counter()
+        self.webhook_url = ""
+        self._rng = random.Random(seed)
+        self._updates: Deque[Dict[str, Any]] = deque()
+        self._next_update_id = 1
+        self._new_updates = asyncio.Event()
+        self._message_id = 0
+        self._methods: Dict[str, Callable[[Dict[str, str]], Any]] = {
+            "sendmessage": self._message,
+            "sendphoto": self._photo_message,
+            "editmessagemedia": self._photo_message,
+            "editmessagetext": self._message,
+            "editmessagecaption": self._photo_message,
+            "editmessagereplymarkup": self._message,
+            "getme": lambda params: BOT_USER,
+            "getwebhookinfo": lambda params: {
+                "url": self.webhook_url, "has_custom_certificate": False,
+                "pending_update_count": len(self._updates),
+            },
+            "setwebhook": self._set_webhook,
+            "deletewebhook": self._delete_webhook,
+        }
+
+    def enqueue(self, update: Dict[str, Any]) -> int:
+        """Кладет обновление в очередь getUpdates; update_id назначается, если его нет"""
+        update = dict(update)
+        update.setdefault("update_id", self._next_update_id)
+        self._next_update_id = max(self._next_update_id, update["update_id"]) + 1
+        self._updates.append(update)
+        self._new_updates.set()
+        return update["update_id"]
+
+    # ---------- Методы Bot API ----------
+
+    def _message(self, params: Dict[str, str]) -> Dict[str, Any]:
+        self._message_id += 1
+        chat_id = int(params.get("chat_id", 0))
+        message = {
+            "message_id": int(params.get("message_id", self._message_id)),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+        }
+        if "text" in params:
+            message["text"] = params["text"]
+        return message
+
+    def _photo_message(self, params: Dict[str, str]) -> Dict[str, Any]:
+        message = self._message(params)
+        file_id = f"fake-photo-{message['message_id']}"
+        message["photo"] = [{"file_id": file_id, "file_unique_id": file_id, "width": 800, "height": 600}]
+        if "caption" in params:
+            message["caption"] = params["caption"]
+        return message
+
+    def _set_webhook(self, params: Dict[str, str]) -> bool:
+        self.webhook_url = params.get("url", "")
+        if params.get("drop_pending_updates") in ("true", "True", "1"):
+            self._updates.clear()
+        return True
+
+    def _delete_webhook(self, params: Dict[str, str]) -> bool:
+        self.webhook_url = ""
+        if params.get("drop_pending_updates") in ("true", "True", "1"):
+            self._updates.clear()
+        return True
+
+    async def _get_updates(self, params: Dict[str, str]) -> List[Dict[str, Any]]:
+        # Запрос с offset подтверждает все обновления до него
+        offset = int(params.get("offset", 0))
+        while self._updates and self._updates[0]["update_id"] < offset:
+            self._updates.popleft()
+        if not self._updates and float(params.get("timeout", 0)) > 0:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), float(params["timeout"]))
+            except asyncio.TimeoutError:
+                pass
+        limit = int(params.get("limit", 100))
+        return list(self._updates)[:limit]
+
+    # ---------- HTTP ----------
+
+    async def handle_method(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        params = {key: str(value) for key, value in (await request.post()).items()}
+        self.calls[method] += 1
+
+        if method == "getupdates":
+            return web.json_response({"ok": True, "result": await self._get_updates(params)})
+
+        delay = self.latency + (self._rng.random() * self.jitter if self.jitter else 0.0)
+        if delay:
+            await asyncio.sleep(delay)
+        if self.rate_limit and self._rng.random() < self.rate_limit:
+            self.rate_limited[method] += 1
+            return web.json_response({
+                "ok": False, "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }, status=429)
+
+        handler = self._methods.get(method)
+        result = handler(params) if handler is not None else True
+        return web.json_response({"ok": True, "result": result})
+
+    async def handle_enqueue(self, request: web.Request) -> web.Response:
+        payload = await request.json()
+        updates = payload if isinstance(payload, list) else [payload]
+        return web.json_response({"update_ids": [self.enqueue(update) for update in updates]})
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            "calls": dict(self.calls),
+            "rate_limited": dict(self.rate_limited),
+            "pending_updates": len(self._updates),
+        })
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle_method)
+        app.router.add_get("/bot{token}/{method}", self.handle_method)
+        app.router.add_post("/_updates", self.handle_enqueue)
+        app.router.add_get("/_stats", self.handle_stats)
+        return app
+
+
+async def start_fake_bot_api(api: FakeBotAPI, host: str = "127.0.0.1", port: int = 0) -> web.AppRunner:
+    """Запускает заглушку в текущем цикле событий; фактический порт — runner.addresses[0][1]"""
+    runner = web.AppRunner(api.create_app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Локальная заглушка Telegram Bot API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа, секунды")
+    parser.add_argument("--jitter", type=float, default=0.0, help="случайная добавка к задержке, секунды")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="доля ответов 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry_after в ответах 429, секунды")
+    return parser.parse_args(argv)
+
+
+def run(argv=None):
+    args = parse_args(argv)
+    api = FakeBotAPI(args.latency, args.jitter, args.rate_limit, args.retry_after)
+    print(f"Заглушка Bot API: http://{args.host}:{args.port} (API_SERVER для бота)")
+    web.run_app(api.create_app(), host=args.host, port=args.port, access_log=None, print=None)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+Сквозной нагрузочный тест без Telegram.
+
+Запускает локальную заглушку Bot API (benchmarks.fake_bot_api) и прогоняет
+через диспетчер main поток обновлений из benchmarks.replay; все ответы
+бота уходят настоящим HTTP-клиентом (ScheduledBot с пулом соединений из
+Config) в заглушку. Выводит пропускную способность, задержки по
+обработчикам, число запросов к API, ответов 429 и новых/повторно
+использованных соединений. Настройки пула берутся из переменных окружения
+API_* (см. README), их можно менять между прогонами.
+
+Запуск из корня репозитория:
+    python -m benchmarks.load_test --users 1000 --latency 0.05 --rate-limit 0.01
+"""
+import argparse
+import asyncio
+import os
+import resource
+
+from benchmarks.fake_bot_api import FakeBotAPI, start_fake_bot_api
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Сквозной нагрузочный тест с заглушкой Bot API")
+    parser.add_argument("--users", type=int, default=1000, help="число виртуальных пользователей")
+    parser.add_argument("--batch-size", type=int, default=100, help="обновлений в одной пачке (как getUpdates)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.05, help="задержка ответа заглушки, секунды")
+    parser.add_argument("--jitter", type=float, default=0.0, help="случайная добавка к задержке, секунды")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="доля ответов 429")
+    parser.add_argument("--rate-limits", action="store_true", help="оставить реальные лимиты планировщика")
+    return parser.parse_args(argv)
+
+
+def run(argv=None):
+    args = parse_args(argv)
+    loop = asyncio.get_event_loop()
+    api = FakeBotAPI(args.latency, args.jitter, args.rate_limit, seed=args.seed)
+    runner = loop.run_until_complete(start_fake_bot_api(api))
+    host, port = runner.addresses[0][:2]
+
+    # Config читается при импорте main, поэтому окружение задается до него
+    os.environ["API_SERVER"] = f"http://{host}:{port}"
+    os.environ.setdefault("BOT_TOKEN", "123456:load-test")
+    os.environ.setdefault("LOG_FILE", "")
+    if not args.rate_limits:
+        for name in ("SEND_GLOBAL_RATE", "SEND_CHAT_RATE", "SEND_CHAT_BURST"):
+            os.environ[name] = "1e9"
+    from benchmarks import replay
+    main = replay.main
+
+    replay.install_bot(main.dp, main.bot)
+    main.dp.middleware.setup(replay.HandlerTimingMiddleware())
+    batches = replay.interleave(replay.generate_streams(args.users, args.seed), args.batch_size)
+    try:
+        result = loop.run_until_complete(replay.replay(main.dp, batches))
+    finally:
+        loop.run_until_complete(main.close_bot_session())
+        loop.run_until_complete(main.storage.close())
+        loop.run_until_complete(main.storage.wait_closed())
+        loop.run_until_complete(runner.cleanup())
+
+    result["peak_memory_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    replay.print_report(result)
+    requests = sum(api.calls.values())
+    print(f"\nзапросов к API: {requests} ({requests / result['seconds']:.0f}/с), "
+          f"ответов 429: {sum(api.rate_limited.values())}")
+    print(f"соединений: новых {main.bot.connections_created}, повторно {main.bot.connections_reused}, "
+          f"установка в среднем {main.bot.connect_seconds / max(main.bot.connections_created, 1) * 1000:.1f} мс")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,335 @@
+# -*- coding: utf-8 -*-
+"""
+Офлайн-бенчмарк диспетчера: воспроизведение синтетических обновлений.
+
+Собирает dp из main с заглушкой Bot, которая отвечает на запросы к API
+локально, и прогоняет через диспетчер поток Update от тысяч виртуальных
+пользователей: полный расчет в калькуляторе (9 шагов CalculatorStates),
+просмотр каталога, сравнение моделей и произвольный текст. Обновления
+подаются пачками, как при polling: в одной пачке не больше одного
+обновления от пользователя, пачка обрабатывается параллельно.
+
+Результат — p50/p95/p99 времени обработки одного обновления по
+обработчикам, пропускная способность и время пачки отдельной строкой,
+пиковая память; с --output сохраняется в JSON, с --baseline
+сравнивается с предыдущим прогоном.
+
+Запуск из корня репозитория:
+    python -m benchmarks.replay --users 2000 --output replay.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+# Изолируем файлы состояния бенчмарка от рабочих файлов бота
+_TMP_DIR = tempfile.mkdtemp(prefix="uhm_replay_")
+os.environ.setdefault("STATE_DB_PATH", os.path.join(_TMP_DIR, "state.sqlite3"))
+os.environ.setdefault("PHOTO_CACHE_FILE", os.path.join(_TMP_DIR, "photo_cache.json"))
+
+from aiogram import Bot, Dispatcher, types  # noqa: E402
+from aiogram.dispatcher.handler import current_handler  # noqa: E402
+from aiogram.dispatcher.middlewares import BaseMiddleware  # noqa: E402
+
+import main  # noqa: E402
+from outbound import ScheduledBot, SendScheduler  # noqa: E402
+
+# Доля сценариев в потоке (сумма весов не обязана быть 1)
+SCENARIO_WEIGHTS = {
+    "calculator": 0.35,
+    "catalog": 0.3,
+    "compare": 0.25,
+    "unknown": 0.1,
+}
+NO_HANDLER = "(нет обработчика)"
+
+
+class StubBot(ScheduledBot):
+    """Bot, который не ходит в сеть: запросы к API выполняются локально"""
+
+    def __init__(self, *args, api_latency: float = 0.0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.api_latency = api_latency
+        self.api_calls: Dict[str, int] = defaultdict(int)
+        self._message_id = 0
+
+    async def perform_request(self, method: str, data: Optional[Dict] = None, files: Optional[Dict] = None,
+                              **kwargs):
+        self.api_calls[method] += 1
+        if self.api_latency:
+            await asyncio.sleep(self.api_latency)
+        data = data or {}
+        if not method.startswith(("send", "edit")):
+            return True
+
+        self._message_id += 1
+        result: Dict[str, Any] = {
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": int(data.get("chat_id", 0)), "type": "private"},
+        }
+        if "text" in data:
+            result["text"] = data["text"]
+        if method in ("sendPhoto", "editMessageMedia"):
+            result["photo"] = [{"file_id": f"stub-{self._message_id}", "file_unique_id": f"u{self._message_id}",
+                                "width": 800, "height": 600}]
+        return result
+
+
+def make_stub_bot(api_latency: float = 0.0, rate_limits: bool = False) -> StubBot:
+    """Создает заглушку Bot; без rate_limits ограничения скорости планировщика снимаются"""
+    if rate_limits:
+        scheduler = SendScheduler(
+            global_rate=main.Config.SEND_GLOBAL_RATE,
+            chat_rate=main.Config.SEND_CHAT_RATE,
+            chat_burst=main.Config.SEND_CHAT_BURST
+        )
+    else:
+        scheduler = SendScheduler(global_rate=1e9, chat_rate=1e9, chat_burst=1e9)
+    return StubBot(token=main.Config.BOT_TOKEN, parse_mode="HTML", scheduler=scheduler, api_latency=api_latency)
+
+
+def install_bot(dp: Dispatcher, bot: Bot):
+    """Подключает бота к диспетчеру и делает его текущим"""
+    dp.bot = bot
+    Bot.set_current(bot)
+    Dispatcher.set_current(dp)
+
+
+class UpdateFactory:
+    """Создает синтетические Update с последовательными идентификаторами"""
+
+    def __init__(self):
+        self.update_id = 0
+
+    def message(self, user_id: int, text: str) -> Dict[str, Any]:
+        self.update_id += 1
+        payload: Dict[str, Any] = {
+            "message_id": self.update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"},
+            "text": text,
+        }
+        if text.startswith("/"):
+            payload["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return {"update_id": self.update_id, "message": payload}
+
+
+def scenario_texts(kind: str, rng: random.Random) -> List[str]:
+    """Тексты сообщений одного сценария пользователя"""
+    snapshot = main.DATA
+    texts = snapshot.texts["ru"]
+    names = snapshot.catalog.ordered_names
+    start = ["/start", "🇷🇺 Русский"]
+
+    if kind == "calculator":
+        return start + [
+            texts["calculator"], rng.choice(names),
+            str(rng.randint(6, 12)), str(rng.randint(18, 26)), str(rng.randint(6, 36)),
+            str(rng.randint(20, 40) * 1_000_000), str(rng.randint(3, 8) * 1_000_000),
+            str(rng.randint(20, 60)), str(rng.randint(10, 14) * 1000), str(rng.randint(5, 20) * 1_000_000),
+        ]
+    if kind == "catalog":
+        return start + [texts["catalog"], rng.choice(snapshot.catalog.ordered_categories)]
+    if kind == "compare":
+        first, second = rng.sample(names, 2)
+        return start + [texts["compare"], first, second]
+    return start + ["где купить запчасти?"]
+
+
+def generate_streams(users: int, seed: int = 1, first_user_id: int = 1_000_000) -> Dict[int, List[str]]:
+    """Генерирует сценарии для пользователей в соответствии с SCENARIO_WEIGHTS"""
+    rng = random.Random(seed)
+    kinds = list(SCENARIO_WEIGHTS)
+    weights = list(SCENARIO_WEIGHTS.values())
+    return {
+        first_user_id + i: scenario_texts(rng.choices(kinds, weights)[0], rng)
+        for i in range(users)
+    }
+
+
+def interleave(streams: Dict[int, List[str]], batch_size: int) -> List[List[Dict[str, Any]]]:
+    """Раскладывает потоки пользователей в пачки: не больше одного обновления пользователя в пачке"""
+    factory = UpdateFactory()
+    cursors = {user_id: 0 for user_id in streams}
+    active = list(streams)
+    batches = []
+    while active:
+        batch, still_active = [], []
+        for user_id in active:
+            if len(batch) < batch_size:
+                batch.append(factory.message(user_id, streams[user_id][cursors[user_id]]))
+                cursors[user_id] += 1
+            if cursors[user_id] < len(streams[user_id]):
+                still_active.append(user_id)
+        # Пользователи, не попавшие в пачку, идут первыми в следующей
+        active = still_active
+        batches.append(batch)
+    return batches
+
+
+class HandlerTimingMiddleware(BaseMiddleware):
+    """
+    Запоминает, какой обработчик обработал обновление, и время его обработки.
+    Подключается последним: отсчет начинается после того, как ChatOrderMiddleware
+    дождалась очереди чата, и заканчивается после записи FSM, так что в
+    задержку не входит ожидание других обновлений пачки.
+    """
+
+    async def on_pre_process_update(self, update: types.Update, data: dict):
+        update.conf["timing_started"] = time.perf_counter()
+
+    async def on_process_message(self, message: types.Message, data: dict):
+        update = types.Update.get_current()
+        if update is not None:
+            update.conf["handler"] = current_handler.get().__name__
+
+    async def on_post_process_update(self, update: types.Update, results: list, data: dict):
+        started = update.conf.get("timing_started")
+        if started is not None:
+            update.conf["handler_seconds"] = time.perf_counter() - started
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(latencies: Dict[str, List[float]]) -> Dict[str, Dict[str, float]]:
+    summary = {}
+    for handler, values in sorted(latencies.items()):
+        values.sort()
+        summary[handler] = {
+            "count": len(values),
+            "p50_ms": percentile(values, 50) * 1000,
+            "p95_ms": percentile(values, 95) * 1000,
+            "p99_ms": percentile(values, 99) * 1000,
+        }
+    return summary
+
+
+async def replay(dp: Dispatcher, batches: List[List[Dict[str, Any]]]) -> Dict[str, Any]:
+    """
+    Прогоняет пачки обновлений через диспетчер и собирает статистику.
+    Задержки по обработчикам берутся из HandlerTimingMiddleware (время
+    обработки одного обновления), время пачки целиком считается отдельно.
+    """
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    batch_seconds: List[float] = []
+
+    async def process(raw: Dict[str, Any]):
+        update = types.Update(**raw)
+        await dp.process_updates([update])
+        seconds = update.conf.get("handler_seconds")
+        if seconds is not None:
+            latencies[update.conf.get("handler", NO_HANDLER)].append(seconds)
+
+    total = sum(len(batch) for batch in batches)
+    started = time.perf_counter()
+    for batch in batches:
+        batch_started = time.perf_counter()
+        await asyncio.gather(*(process(raw) for raw in batch))
+        batch_seconds.append(time.perf_counter() - batch_started)
+    elapsed = time.perf_counter() - started
+
+    batch_seconds.sort()
+    return {
+        "updates": total,
+        "seconds": elapsed,
+        "updates_per_second": total / elapsed if elapsed else 0.0,
+        "batches": {
+            "count": len(batch_seconds),
+            "p50_ms": percentile(batch_seconds, 50) * 1000,
+            "p95_ms": percentile(batch_seconds, 95) * 1000,
+        },
+        "handlers": summarize(latencies),
+    }
+
+
+def print_report(result: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None):
+    print(f"обновлений: {result['updates']}, за {result['seconds']:.2f} с, "
+          f"{result['updates_per_second']:.0f} обновлений/с, "
+          f"пик памяти: {result['peak_memory_mb']:.1f} МБ")
+    if baseline:
+        change = result["updates_per_second"] / baseline["updates_per_second"] - 1
+        print(f"пропускная способность относительно базового прогона: {change:+.1%}")
+    batches = result["batches"]
+    print(f"пачек: {batches['count']}, время пачки p50 {batches['p50_ms']:.1f} мс, p95 {batches['p95_ms']:.1f} мс")
+    print(f"{'обработчик':<28} {'кол-во':>7} {'p50, мс':>9} {'p95, мс':>9} {'p99, мс':>9}")
+    for handler, stats in result["handlers"].items():
+        line = (f"{handler:<28} {stats['count']:>7} {stats['p50_ms']:>9.3f} "
+                f"{stats['p95_ms']:>9.3f} {stats['p99_ms']:>9.3f}")
+        base = (baseline or {}).get("handlers", {}).get(handler)
+        if base and base["p95_ms"]:
+            line += f"  (p95 {stats['p95_ms'] / base['p95_ms'] - 1:+.0%})"
+        print(line)
+
+
+async def run_benchmark(users: int, batch_size: int, seed: int, api_latency: float,
+                        rate_limits: bool, trace_memory: bool) -> Dict[str, Any]:
+    dp = main.dp
+    install_bot(dp, make_stub_bot(api_latency, rate_limits))
+    dp.middleware.setup(HandlerTimingMiddleware())
+    batches = interleave(generate_streams(users, seed), batch_size)
+
+    if trace_memory:
+        tracemalloc.start()
+    result = await replay(dp, batches)
+    if trace_memory:
+        result["peak_traced_mb"] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+
+    # ru_maxrss в Linux измеряется в КБ
+    result["peak_memory_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    result["api_calls"] = dict(dp.bot.api_calls)
+    result["config"] = {
+        "users": users, "batch_size": batch_size, "seed": seed,
+        "api_latency": api_latency, "rate_limits": rate_limits,
+        "python": sys.version.split()[0], "timestamp": int(time.time()),
+    }
+    await main.storage.close()
+    await main.storage.wait_closed()
+    return result
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк обработки обновлений")
+    parser.add_argument("--users", type=int, default=2000, help="число виртуальных пользователей")
+    parser.add_argument("--batch-size", type=int, default=100, help="обновлений в одной пачке (как getUpdates)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--api-latency", type=float, default=0.0, help="задержка ответа API, секунды")
+    parser.add_argument("--rate-limits", action="store_true", help="оставить реальные лимиты планировщика")
+    parser.add_argument("--trace-memory", action="store_true", help="учитывать аллокации через tracemalloc")
+    parser.add_argument("--output", help="сохранить результат в JSON")
+    parser.add_argument("--baseline", help="JSON предыдущего прогона для сравнения")
+    return parser.parse_args(argv)
+
+
+def run(argv=None):
+    args = parse_args(argv)
+    result = asyncio.get_event_loop().run_until_complete(run_benchmark(
+        args.users, args.batch_size, args.seed, args.api_latency, args.rate_limits, args.trace_memory
+    ))
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+Неблокирующее логирование.
+
+Обработчики в цикле событий только кладут запись в очередь в памяти, а
+форматирование, запись в файл с ротацией и вывод в консоль выполняет
+фоновый поток QueueListener. При переполнении очереди записи отбрасываются,
+а не тормозят обработку обновлений; серии одинаковых ошибок прореживаются.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import time
+from typing import Dict, List, Optional, Tuple
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler, который не блокируется и не пишет в stderr при переполнении очереди"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self.sampler: Optional["BurstSampler"] = None
+        self.listener: Optional[logging.handlers.QueueListener] = None
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Подставляем аргументы сразу, а traceback форматирует уже фоновый поток
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class BurstSampler(logging.Filter):
+    """
+    Прореживает серии одинаковых ошибок.
+
+    Одинаковыми считаются записи из одного места вызова (логгер, файл и строка)
+    с тем же типом исключения: текст сообщения не учитывается, потому что в
+    f-строки подставлены идентификаторы пользователей и другие данные. За окно window секунд пропускаются первые limit таких записей,
+    остальные отбрасываются; число отброшенных дописывается к первой записи
+    следующего окна.
+    """
+
+    def __init__(self, limit: int = 5, window: float = 60.0, level: int = logging.ERROR):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self.level = level
+        self.suppressed = 0
+        self._window_end = 0.0
+        self._seen: Dict[Tuple, List[int]] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < self.level or self.limit <= 0:
+            return True
+        now = time.monotonic()
+        if now >= self._window_end:
+            carried = {key: counts[1] for key, counts in self._seen.items() if counts[1]}
+            self._seen = {key: [0, suppressed] for key, suppressed in carried.items()}
+            self._window_end = now + self.window
+
+        exc_type = record.exc_info[0].__name__ if record.exc_info and record.exc_info[0] else None
+        key = (record.name, record.pathname, record.lineno, exc_type)
+        counts = self._seen.setdefault(key, [0, 0])
+        counts[0] += 1
+        if counts[0] > self.limit:
+            counts[1] += 1
+            self.suppressed += 1
+            return False
+        if counts[1]:
+            record.msg = f"{record.msg} [подавлено похожих сообщений: {counts[1]}]"
+            counts[1] = 0
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Форматирует запись как одну строку JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def setup_logging(level: str = "INFO", log_file: str = "bot.log", log_format: str = "text",
+                  rotation: str = "size", max_bytes: int = 10 * 1024 * 1024, backup_count: int = 5,
+                  rotate_when: str = "midnight", queue_size: int = 10000, burst_limit: int = 5,
+                  burst_window: float = 60.0) -> DroppingQueueHandler:
+    """
+    Настраивает корневой логгер на запись через очередь и фоновый поток.
+
+    :param log_file: файл журнала; пустая строка — только консоль
+    :param log_format: text или json (одна запись JSON на строку)
+    :param rotation: size — по размеру max_bytes, time — по расписанию rotate_when
+    :param queue_size: предел очереди записей, сверх него записи отбрасываются
+    :param burst_limit: сколько одинаковых ошибок пропускать за burst_window секунд; 0 — без ограничения
+    :return: обработчик очереди (счетчики отброшенных и прореженных записей: dropped, sampler.suppressed)
+    """
+    formatter = JsonFormatter() if log_format == "json" else logging.Formatter(TEXT_FORMAT)
+    handlers: List[logging.Handler] = [logging.StreamHandler()]
+    if log_file:
+        if rotation == "time":
+            handlers.append(logging.handlers.TimedRotatingFileHandler(
+                log_file, when=rotate_when, backupCount=backup_count, encoding="utf-8", delay=True
+            ))
+        else:
+            handlers.append(logging.handlers.RotatingFileHandler(
+                log_file, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True
+            ))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue: queue.Queue = queue.Queue(queue_size)
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.sampler = BurstSampler(burst_limit, burst_window)
+    queue_handler.addFilter(queue_handler.sampler)
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level.upper())
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    # Дописываем оставшиеся в очереди записи при завершении процесса
+    atexit.register(listener.stop)
+    queue_handler.listener = listener
+    return queue_handler
+
@@ -2,38 +2,50 @@
 # -*- coding: utf-8 -*-
 import os
 import json
+import time
+import asyncio
+import re
+import hashlib
 import logging
-from typing import Dict, List, Any, Optional, Set
+import math
+import signal
+from contextvars import ContextVar
+from types import MappingProxyType
+from typing import Dict, List, Any, Awaitable, Callable, Optional, Set, FrozenSet, Mapping, NamedTuple, Tuple
 
+import aiohttp
+from aiohttp import web
 from aiogram import Bot, Dispatcher, types, executor
-from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
-from aiogram.contrib.fsm_storage.memory import MemoryStorage
+from aiogram.bot.api import TELEGRAM_PRODUCTION, TelegramAPIServer
+from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton, InputMediaPhoto
+from aiogram.types import InlineQueryResultArticle, InputTextMessageContent
 from aiogram.dispatcher import FSMContext
+from aiogram.dispatcher.filters import BoundFilter
 from aiogram.dispatcher.filters.state import State, StatesGroup
-from aiogram.utils.exceptions import TelegramAPIError
+from aiogram.dispatcher.handler import current_handler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+from aiogram.utils.callback_data import CallbackData
+from aiogram.utils.exceptions import TelegramAPIError, BadRequest, MessageNotModified
 from dotenv import load_dotenv
+
+from analytics import CALC_DONE, CALC_START, CATEGORY, COMPARE, LANGUAGE, VIEW, Analytics
+from logging_config import setup_logging
+from metrics import Metrics, start_metrics_server
+from outbound import ScheduledBot, SendScheduler
+from search import SearchIndex
+from sharding import WORKER_INDEX_ENV, ChatSerializer, WorkerPool, run_worker_loop, update_date
+from storage import UnitOfWorkStorage, UserData, UserStateStorage
 load_dotenv()
 
 # ==================== КОНФИГУРАЦИЯ И НАСТРОЙКИ ====================
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("bot.log"),
-        logging.StreamHandler()
-    ]
-)
-logger = logging.getLogger(__name__)
-
 # Загрузка переменных окружения
 load_dotenv()
 
 class Config:
     BOT_TOKEN = os.getenv("BOT_TOKEN")
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
-    ADMIN_IDS = set(map(int, os.getenv("ADMIN_IDS", "").split(','))) if os.getenv("@UHMLT") else set()
+    ADMIN_IDS = {int(uid) for uid in os.getenv("ADMIN_IDS", "").split(',') if uid.strip()}
     CONTACT_MANAGER = os.getenv("CONTACT_MANAGER", "@UHMLT")
     CONTACT_PHONE = os.getenv("CONTACT_PHONE", "+998 90 977 31 35")
     POLICY_URL = os.getenv("POLICY_URL", "https://uhmlandtech.uz/uhm/")
@@ -42,23 +54,97 @@ class Config:
         'facebook': os.getenv("FACEBOOK_URL", "https://www.facebook.com/uhmtashkent"),
         'telegram': os.getenv("TELEGRAM_URL", "https://t.me/uhmuz")
     }
+    PHOTO_CACHE_FILE = os.getenv("PHOTO_CACHE_FILE", "photo_cache.json")
+    STATE_DB_PATH = os.getenv("STATE_DB_PATH", "bot_state.sqlite3")
+    USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+    USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "3600"))
+    STATE_FLUSH_INTERVAL = float(os.getenv("STATE_FLUSH_INTERVAL", "2"))
+    ANALYTICS_FLUSH_INTERVAL = float(os.getenv("ANALYTICS_FLUSH_INTERVAL", "60"))
+    BOT_MODE = os.getenv("BOT_MODE", "polling")
+    WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "")
+    WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+    WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+    WEBAPP_HOST = os.getenv("WEBAPP_HOST", "0.0.0.0")
+    WEBAPP_PORT = int(os.getenv("PORT", "8080"))
+    # max_connections для setWebhook: Telegram принимает от 1 до 100
+    WEBHOOK_MAX_CONNECTIONS = max(1, min(int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40")), 100))
+    WEBHOOK_MAX_PENDING = int(os.getenv("WEBHOOK_MAX_PENDING", "1000"))
+    MAX_CONCURRENT_UPDATES = int(os.getenv("MAX_CONCURRENT_UPDATES", "64"))
+    BACKLOG_MODE = os.getenv("BACKLOG_MODE", "drain")
+    BACKLOG_MAX_AGE = float(os.getenv("BACKLOG_MAX_AGE", "900"))
+    SEND_GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", "30"))
+    SEND_CHAT_RATE = float(os.getenv("SEND_CHAT_RATE", "1"))
+    SEND_CHAT_BURST = float(os.getenv("SEND_CHAT_BURST", "5"))
+    SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", "3"))
+    API_SERVER = os.getenv("API_SERVER", "")
+    API_CONNECTIONS_LIMIT = int(os.getenv("API_CONNECTIONS_LIMIT", "100"))
+    API_CONNECTIONS_PER_HOST = int(os.getenv("API_CONNECTIONS_PER_HOST", "0"))
+    API_KEEPALIVE_TIMEOUT = float(os.getenv("API_KEEPALIVE_TIMEOUT", "60"))
+    API_DNS_CACHE_TTL = int(os.getenv("API_DNS_CACHE_TTL", "300"))
+    API_TIMEOUT = float(os.getenv("API_TIMEOUT", "60"))
+    API_CONNECT_TIMEOUT = float(os.getenv("API_CONNECT_TIMEOUT", "10"))
+    COMPARE_MAX_MODELS = max(2, int(os.getenv("COMPARE_MAX_MODELS", "2")))
+    RELOAD_INTERVAL = float(os.getenv("RELOAD_INTERVAL", "30"))
+    METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+    METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+    SEARCH_LIMIT = int(os.getenv("SEARCH_LIMIT", "5"))
+    INLINE_RESULTS_LIMIT = int(os.getenv("INLINE_RESULTS_LIMIT", "20"))
+    INLINE_CACHE_TIME = int(os.getenv("INLINE_CACHE_TIME", "300"))
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+    LOG_FILE = os.getenv("LOG_FILE", "bot.log")
+    LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+    LOG_ROTATION = os.getenv("LOG_ROTATION", "size")
+    LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+    LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+    LOG_ROTATE_WHEN = os.getenv("LOG_ROTATE_WHEN", "midnight")
+    LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+    LOG_BURST_LIMIT = int(os.getenv("LOG_BURST_LIMIT", "5"))
+    LOG_BURST_WINDOW = float(os.getenv("LOG_BURST_WINDOW", "60"))
+    BOT_WORKERS = max(1, int(os.getenv("BOT_WORKERS", "1")))
+    WORKER_HEARTBEAT_TIMEOUT = float(os.getenv("WORKER_HEARTBEAT_TIMEOUT", "30"))
+    WORKER_INDEX = os.getenv(WORKER_INDEX_ENV, "")
+
+def worker_file(path: str) -> str:
+    """Имя файла для текущего рабочего процесса: bot.log → bot.w1.log"""
+    if not Config.WORKER_INDEX or not path:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.w{Config.WORKER_INDEX}{ext}"
+
+# У рабочих процессов свои журнал, кэш фото и порт метрик. Файл состояний общий:
+# процессы работают с непересекающимися чатами, а запись в SQLite идет по очереди —
+# WAL не блокирует чтение, но писатель в каждый момент один, остальные ждут busy_timeout
+if Config.WORKER_INDEX:
+    Config.LOG_FILE = worker_file(Config.LOG_FILE)
+    Config.PHOTO_CACHE_FILE = worker_file(Config.PHOTO_CACHE_FILE)
+    if Config.METRICS_PORT:
+        Config.METRICS_PORT += int(Config.WORKER_INDEX) + 1
+
+# Настройка логирования: запись в файл и консоль выполняет фоновый поток
+log_handler = setup_logging(
+    level=Config.LOG_LEVEL,
+    log_file=Config.LOG_FILE,
+    log_format=Config.LOG_FORMAT,
+    rotation=Config.LOG_ROTATION,
+    max_bytes=Config.LOG_MAX_BYTES,
+    backup_count=Config.LOG_BACKUP_COUNT,
+    rotate_when=Config.LOG_ROTATE_WHEN,
+    queue_size=Config.LOG_QUEUE_SIZE,
+    burst_limit=Config.LOG_BURST_LIMIT,
+    burst_window=Config.LOG_BURST_WINDOW
+)
+logger = logging.getLogger(__name__)
 
 # Проверка обязательных конфигураций
 if not Config.BOT_TOKEN:
     raise ValueError("Токен бота не указан в переменных окружения (BOT_TOKEN)")
+if Config.BOT_MODE not in ("polling", "webhook"):
+    raise ValueError(f"Неизвестный режим работы BOT_MODE={Config.BOT_MODE!r} (ожидается polling или webhook)")
+if Config.BOT_MODE == "webhook" and not Config.WEBHOOK_HOST:
+    raise ValueError("Для режима webhook нужен публичный адрес бота (WEBHOOK_HOST)")
 
 # ==================== МОДЕЛИ ДАННЫХ И КОНСТАНТЫ ====================
 
-class UserData:
-    """Класс для хранения данных пользователя"""
-    def __init__(self):
-        self.language: str = 'ru'
-        self.compare_selection: List[str] = []
-        self.calculator_data: Dict[str, Any] = {}
-
-# Глобальное хранилище данных пользователей (в продакшене следует заменить на БД)
-user_data: Dict[int, UserData] = {}
-
 # Конфигурация обязательных ключей в JSON-файлах
 REQUIRED_KEYS = {
     'texts_ru.json': ['start', 'menu', 'unknown', 'back', 'choose_category', 
@@ -67,8 +153,207 @@ REQUIRED_KEYS = {
                      'choose_model', 'calculator', 'catalog', 'compare']
 }
 
+class SpecValue(NamedTuple):
+    """Характеристика модели: текст для вывода и числовые значения с единицами"""
+    text: str
+    quantities: Tuple[Tuple[float, str], ...]
+
+class CatalogIndex(NamedTuple):
+    """Неизменяемый индекс каталога, строится один раз при загрузке данных"""
+    by_name: Mapping[str, Dict[str, Any]]
+    category_of: Mapping[str, str]
+    names: FrozenSet[str]
+    ordered_names: Tuple[str, ...]
+    categories: FrozenSet[str]
+    ordered_categories: Tuple[str, ...]
+    positions: Mapping[str, Tuple[int, int]]
+    prices: Mapping[str, int]
+    specs: Mapping[str, Mapping[str, SpecValue]]
+    version: str
+
+class DataSnapshot(NamedTuple):
+    """
+    Неизменяемый снимок данных бота: тексты, каталог и все производные структуры.
+
+    При перезагрузке строится новый снимок и подменяется целиком, поэтому
+    обработчик, начавший работу со старым снимком, не увидит частично
+    обновленных данных.
+    """
+    texts: Dict[str, Dict[str, Any]]
+    models: Dict[str, List[Dict[str, Any]]]
+    catalog: CatalogIndex
+    routes: Mapping[str, str]
+    keyboards: Mapping[Tuple[str, str], str]
+    comparisons: Dict[Tuple[Tuple[str, ...], str], str]
+    search: SearchIndex
+    inline_results: Dict[str, List[InlineQueryResultArticle]]
+    mtimes: Mapping[str, float]
+    loaded_at: float
+
+# Файлы с данными, при изменении которых бот перезагружает снимок
+DATA_FILES = ("texts_ru.json", "texts_uz.json", "models.json")
+
+# Максимальное число готовых сравнений в кэше одного снимка
+COMPARISON_CACHE_SIZE = 1024
+
+# Максимальное число готовых ответов на inline-запросы в кэше одного снимка
+INLINE_CACHE_SIZE = 1024
+
+# Вес полей модели в поиске: совпадение в названии важнее, чем в категории или характеристиках
+SEARCH_FIELD_WEIGHTS = {"name": 1.0, "category": 0.6, "spec": 0.5}
+
+# Какое значение характеристики лучше при сравнении: "max" или "min" (остальные не отмечаются)
+SPEC_PREFERENCE = {
+    "Мощность": "max",
+    "Макс. глубина копания": "max",
+    "Макс. радиус копания": "max",
+    "Высота выгрузки погрузчика": "max",
+    "Емкость ковша(6 в 1)": "max",
+    "Емкость ковша экс": "max",
+    "Емкость ковша": "max",
+    "Топливный бак": "max",
+    "Глубина копания": "max",
+    "Длина копания": "max",
+    "Грузоподъёмность": "max",
+    "Скорость поворота": "max",
+    "Средний расход": "min",
+}
+
+# Приведение единиц измерения к общему виду: единица → (основная единица, множитель)
+UNIT_ALIASES = {
+    "мм": ("м", 0.001),
+    "см": ("м", 0.01),
+    "к": ("кг", 1.0),
+    "т": ("кг", 1000.0),
+    "л.с": ("л.с.", 1.0),
+}
+
+# Кнопки выбора языка
+LANGUAGE_BUTTONS = ("🇷🇺 Русский", "🇺🇿 O‘zbekcha")
+
+# Ключи текстов кнопок меню и соответствующие им маршруты (в порядке приоритета)
+MENU_ROUTES = (("catalog", "catalog"), ("calculator", "calculator"), ("compare", "compare"))
+
+# Маршруты для кнопок меню, распознаваемых по первому символу
+PREFIX_ROUTES = {"📞": "contact", "🔒": "policy"}
+
+# Кнопки карточки каталога: версия каталога, номер категории, номер модели и действие.
+# Номера указывают на позиции в снимке данных, поэтому хранить состояние просмотра не нужно
+catalog_cb = CallbackData("cat", "version", "category", "index", "action")
+CATALOG_VERSION_LENGTH = 8
+
 # ==================== УТИЛИТЫ И ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ====================
 
+def parse_price(raw: str) -> int:
+    """Преобразует строку цены вида '1 027 000 000 сум' в число"""
+    try:
+        return int(raw.replace(" ", "").replace("сум", ""))
+    except (AttributeError, ValueError):
+        return 0
+
+_SPEC_PART_RE = re.compile(r"^(\d+(?:[.,]\d+)?)(?:\s*[-–]\s*(\d+(?:[.,]\d+)?))?\s*(.*)$")
+
+def parse_spec(raw: Any) -> SpecValue:
+    """
+    Разбирает значение характеристики: '76 л.с. / 55 кВт', '1,1 м³', '0,03-0,21 м³'.
+
+    Запятая считается десятичным разделителем, лишние пробелы и пояснения в скобках
+    отбрасываются, для диапазона берется верхняя граница. Нечисловые значения
+    сохраняются только как текст.
+    """
+    text = " ".join(str(raw).split())
+    quantities = []
+    for part in re.split(r"\s*/\s*(?=\d)", re.sub(r"\(.*?\)", "", text)):
+        match = _SPEC_PART_RE.match(part.strip())
+        if not match:
+            return SpecValue(text, ())
+        low, high, unit = match.groups()
+        value = float((high or low).replace(",", "."))
+        unit, factor = UNIT_ALIASES.get(unit.strip(), (unit.strip(), 1.0))
+        quantities.append((value * factor, unit))
+    return SpecValue(text, tuple(quantities))
+
+def build_catalog_index(models: Dict[str, List[Dict[str, Any]]]) -> CatalogIndex:
+    """Строит индекс каталога: имя → модель, имя → категория, цены"""
+    by_name: Dict[str, Dict[str, Any]] = {}
+    category_of: Dict[str, str] = {}
+    positions: Dict[str, Tuple[int, int]] = {}
+    prices: Dict[str, int] = {}
+    specs: Dict[str, Mapping[str, SpecValue]] = {}
+
+    for category_index, (category, items) in enumerate(models.items()):
+        for index, model in enumerate(items):
+            name = model["name"]
+            if name in by_name:
+                raise ValueError(f"Модель '{name}' встречается в каталоге несколько раз")
+            by_name[name] = model
+            category_of[name] = category
+            positions[name] = (category_index, index)
+            prices[name] = parse_price(model.get("price", ""))
+            specs[name] = MappingProxyType({
+                key: parse_spec(value) for key, value in model.get("specs", {}).items()
+            })
+
+    version = hashlib.sha1(
+        json.dumps(models, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()[:12]
+
+    return CatalogIndex(
+        by_name=MappingProxyType(by_name),
+        category_of=MappingProxyType(category_of),
+        names=frozenset(by_name),
+        ordered_names=tuple(by_name),
+        categories=frozenset(models),
+        ordered_categories=tuple(models),
+        positions=MappingProxyType(positions),
+        prices=MappingProxyType(prices),
+        specs=MappingProxyType(specs),
+        version=version,
+    )
+
+def build_search_index(catalog: CatalogIndex) -> SearchIndex:
+    """Строит индекс поиска по названиям, категориям и характеристикам моделей"""
+    documents = []
+    for name in catalog.ordered_names:
+        fields = [(name, SEARCH_FIELD_WEIGHTS["name"]),
+                  (catalog.category_of[name], SEARCH_FIELD_WEIGHTS["category"])]
+        fields += [(spec.text, SEARCH_FIELD_WEIGHTS["spec"]) for spec in catalog.specs[name].values()]
+        documents.append((name, fields))
+    return SearchIndex(documents)
+
+def build_routes(texts: Dict[str, Dict[str, Any]], catalog: CatalogIndex) -> Mapping[str, str]:
+    """Строит таблицу маршрутизации: текст кнопки → действие"""
+    routes: Dict[str, str] = {}
+
+    for label in LANGUAGE_BUTTONS:
+        routes.setdefault(label, "language")
+    for key, route in MENU_ROUTES[:1]:
+        for lang_texts in texts.values():
+            routes.setdefault(lang_texts[key], route)
+    for category in catalog.categories:
+        routes.setdefault(category, "category")
+    for key, route in MENU_ROUTES[1:]:
+        for lang_texts in texts.values():
+            routes.setdefault(lang_texts[key], route)
+    for name in catalog.ordered_names:
+        routes.setdefault(name, "model")
+    for lang_texts in texts.values():
+        for item in lang_texts.get("menu", []):
+            route = PREFIX_ROUTES.get(item[:1])
+            if route:
+                routes.setdefault(item, route)
+
+    return MappingProxyType(routes)
+
+def resolve_route(text: Optional[str]) -> Optional[str]:
+    """Определяет действие по тексту сообщения одним обращением к таблице"""
+    if not text:
+        return None
+    route = current_data().routes.get(text)
+    if route is None:
+        route = PREFIX_ROUTES.get(text[:1])
+    return route
+
 def load_json_data() -> Dict[str, Any]:
     """Загружает и валидирует данные из JSON файлов"""
     try:
@@ -86,6 +371,14 @@ def load_json_data() -> Dict[str, Any]:
                 if key not in data:
                     raise ValueError(f"Обязательный ключ '{key}' отсутствует в {filename}")
 
+        if not isinstance(models, dict) or not models:
+            raise ValueError("models.json должен содержать хотя бы одну категорию")
+        for category, items in models.items():
+            for model in items:
+                for key in ('name', 'price', 'image'):
+                    if key not in model:
+                        raise ValueError(f"У модели в категории '{category}' нет ключа '{key}' в models.json")
+
         return {
             "TEXTS": {'ru': texts_ru, 'uz': texts_uz},
             "MODELS": models
@@ -94,49 +387,399 @@ def load_json_data() -> Dict[str, Any]:
         logger.error(f"Ошибка загрузки данных: {e}")
         raise
 
+class PhotoCache:
+    """Хранит file_id загруженных в Telegram фотографий по URL изображения"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file_ids: Dict[str, str] = {}
+        self._save_task: Optional[asyncio.Task] = None
+        self._save_pending = False
+        try:
+            with open(path, encoding="utf-8") as f:
+                self._file_ids = dict(json.load(f))
+        except FileNotFoundError:
+            pass
+        except (ValueError, TypeError) as e:
+            logger.warning(f"Кэш фотографий {path} поврежден и будет пересоздан: {e}")
+
+    def get(self, url: str) -> Optional[str]:
+        return self._file_ids.get(url)
+
+    def put(self, url: str, file_id: str):
+        if self._file_ids.get(url) != file_id:
+            self._file_ids[url] = file_id
+            self.save()
+
+    def drop(self, url: str):
+        if self._file_ids.pop(url, None) is not None:
+            self.save()
+
+    def prune(self, urls: Set[str]):
+        """Удаляет записи для изображений, которых больше нет в каталоге"""
+        stale = [url for url in self._file_ids if url not in urls]
+        for url in stale:
+            del self._file_ids[url]
+        if stale:
+            self.save()
+
+    def save(self):
+        """
+        Сохраняет кэш на диск: из цикла событий — в потоке пула, несколько
+        изменений подряд записываются одним файлом; вне цикла — сразу
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._write(dict(self._file_ids))
+            return
+        self._save_pending = True
+        if self._save_task is None or self._save_task.done():
+            self._save_task = loop.create_task(self._save_in_background())
+
+    async def _save_in_background(self):
+        while self._save_pending:
+            self._save_pending = False
+            await asyncio.get_event_loop().run_in_executor(None, self._write, dict(self._file_ids))
+
+    async def close(self):
+        """Дожидается записи последних изменений"""
+        if self._save_task is not None:
+            await self._save_task
+
+    def _write(self, file_ids: Dict[str, str]):
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(file_ids, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.error(f"Не удалось сохранить кэш фотографий: {e}")
+
+photo_cache = PhotoCache(Config.PHOTO_CACHE_FILE)
+
+def best_values(values: List[Optional[SpecValue]], preference: Optional[str]) -> Set[int]:
+    """Возвращает позиции моделей с лучшим значением характеристики"""
+    if preference is None:
+        return set()
+    numeric = [(i, dict((unit, number) for number, unit in value.quantities))
+               for i, value in enumerate(values) if value is not None and value.quantities]
+    if len(numeric) < 2:
+        return set()
+
+    # Сравниваем в единицах, которые есть у всех моделей (например, кВт для мощности)
+    common_units = [unit for _, unit in values[numeric[0][0]].quantities
+                    if all(unit in units for _, units in numeric)]
+    if not common_units:
+        return set()
+    unit = common_units[0]
+    numbers = [units[unit] for _, units in numeric]
+    best = max(numbers) if preference == "max" else min(numbers)
+    if all(number == best for number in numbers):
+        return set()
+    return {i for (i, units) in numeric if units[unit] == best}
+
+def render_comparison(names: Tuple[str, ...], language: str) -> str:
+    """
+    Генерирует текст сравнения N моделей с отметкой лучшего значения в каждой строке.
+
+    Результат кэшируется в снимке данных по (набору моделей, языку), поэтому
+    при перезагрузке каталога кэш начинается заново.
+    """
+    snapshot = current_data()
+    cache_key = (names, language)
+    text = snapshot.comparisons.get(cache_key)
+    if text is None:
+        if len(snapshot.comparisons) >= COMPARISON_CACHE_SIZE:
+            snapshot.comparisons.clear()
+        text = snapshot.comparisons[cache_key] = _render_comparison(snapshot, names, language)
+    return text
+
+def _render_comparison(snapshot: "DataSnapshot", names: Tuple[str, ...], language: str) -> str:
+    catalog = snapshot.catalog
+    specs = [catalog.specs[name] for name in names]
+    text = (
+        f"<b>{lookup_text(snapshot.texts, language, 'comparison_title')}</b>\n\n"
+        + " vs ".join(f"<u>{name}</u>" for name in names)
+        + "\n\n"
+    )
+
+    # Порядок строк определяется порядком характеристик в каталоге
+    keys: Dict[str, None] = {}
+    for model_specs in specs:
+        keys.update(dict.fromkeys(model_specs))
+    common = [key for key in keys if all(key in model_specs for model_specs in specs)]
+    other = [key for key in keys if key not in common]
+
+    def format_rows(rows: List[str]) -> str:
+        block = ""
+        for key in rows:
+            values = [model_specs.get(key) for model_specs in specs]
+            best = best_values(values, SPEC_PREFERENCE.get(key))
+            cells = [
+                (value.text if value is not None else "—") + (" ✅" if i in best else "")
+                for i, value in enumerate(values)
+            ]
+            block += f"• {key}: {' | '.join(cells)}\n"
+        return block
+
+    if common:
+        text += f"📊 <b>{lookup_text(snapshot.texts, language, 'comparison_common')}</b>\n" + format_rows(common) + "\n"
+    if other:
+        text += f"🔹 <b>{lookup_text(snapshot.texts, language, 'comparison_other')}</b>\n" + format_rows(other) + "\n"
+
+    # Цены: дешевле — лучше
+    prices = [catalog.prices[name] for name in names]
+    cheapest = min(prices) if all(prices) and len(set(prices)) > 1 else None
+    text += f"💵 <b>{lookup_text(snapshot.texts, language, 'comparison_prices')}</b>\n"
+    for name, price in zip(names, prices):
+        mark = " ✅" if price == cheapest else ""
+        text += f"• {name}: {catalog.by_name[name]['price']}{mark}\n"
+
+    return text
+
+def lookup_text(texts: Dict[str, Dict[str, Any]], language: str, key: str) -> str:
+    """Ищет текст на указанном языке, при отсутствии — на русском"""
+    return texts.get(language, {}).get(key, texts['ru'].get(key, "❌ Текст не найден"))
+
+def build_menu_keyboard(snapshot_texts: Dict[str, Dict[str, Any]], catalog: CatalogIndex,
+                        language: str) -> ReplyKeyboardMarkup:
+    """Собирает клавиатуру меню"""
+    kb = ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
+    kb.add(*[KeyboardButton(item) for item in snapshot_texts[language]['menu']])
+    return kb
+
+def build_models_keyboard(snapshot_texts: Dict[str, Dict[str, Any]], catalog: CatalogIndex,
+                          language: str) -> ReplyKeyboardMarkup:
+    """Собирает клавиатуру с моделями техники"""
+    kb = ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
+    kb.add(*[KeyboardButton(model) for model in catalog.ordered_names])
+    kb.add(KeyboardButton(lookup_text(snapshot_texts, language, "back")))
+    return kb
+
+def build_categories_keyboard(snapshot_texts: Dict[str, Dict[str, Any]], catalog: CatalogIndex,
+                              language: str) -> ReplyKeyboardMarkup:
+    """Собирает клавиатуру с категориями техники"""
+    kb = ReplyKeyboardMarkup(resize_keyboard=True)
+    kb.add(*[KeyboardButton(category) for category in catalog.ordered_categories])
+    kb.add(KeyboardButton(lookup_text(snapshot_texts, language, "back")))
+    return kb
+
+def build_language_keyboard() -> ReplyKeyboardMarkup:
+    """Собирает клавиатуру выбора языка"""
+    kb = ReplyKeyboardMarkup(resize_keyboard=True)
+    kb.add(*LANGUAGE_BUTTONS)
+    return kb
+
+# Клавиатуры, зависящие от языка и каталога: тип → функция сборки
+KEYBOARD_BUILDERS = {
+    "menu": build_menu_keyboard,
+    "models": build_models_keyboard,
+    "categories": build_categories_keyboard,
+}
+
+def build_keyboards(texts: Dict[str, Dict[str, Any]], catalog: CatalogIndex) -> Mapping[Tuple[str, str], str]:
+    """Заранее собирает и сериализует все клавиатуры для каждого языка"""
+    keyboards = {
+        (kind, language): json.dumps(builder(texts, catalog, language).to_python(), ensure_ascii=False)
+        for kind, builder in KEYBOARD_BUILDERS.items()
+        for language in texts
+    }
+    keyboards[("language", "")] = json.dumps(build_language_keyboard().to_python(), ensure_ascii=False)
+    return MappingProxyType(keyboards)
+
+def data_files_mtimes() -> Dict[str, float]:
+    """Возвращает время изменения файлов с данными"""
+    return {filename: os.stat(filename).st_mtime for filename in DATA_FILES}
+
+def build_snapshot() -> DataSnapshot:
+    """Загружает JSON-файлы и строит по ним полный снимок данных (без обращения к циклу событий)"""
+    mtimes = data_files_mtimes()
+    data = load_json_data()
+    texts, models = data["TEXTS"], data["MODELS"]
+    catalog = build_catalog_index(models)
+    return DataSnapshot(
+        texts=texts,
+        models=models,
+        catalog=catalog,
+        routes=build_routes(texts, catalog),
+        keyboards=build_keyboards(texts, catalog),
+        comparisons={},
+        search=build_search_index(catalog),
+        inline_results={},
+        mtimes=MappingProxyType(mtimes),
+        loaded_at=time.time(),
+    )
+
+# Последний загруженный снимок данных (задается activate_snapshot при запуске и перезагрузке)
+DATA: Optional[DataSnapshot] = None
+# Снимок, который видит обработчик текущего обновления (фиксируется в SnapshotMiddleware)
+_current_data: ContextVar[DataSnapshot] = ContextVar("current_data")
+
+def current_data() -> DataSnapshot:
+    """Возвращает снимок данных текущего обновления, а вне обработки — последний загруженный"""
+    snapshot = _current_data.get(None)
+    return snapshot if snapshot is not None else DATA
+
+def activate_snapshot(snapshot: DataSnapshot):
+    """Атомарно подменяет текущий снимок данных"""
+    global DATA
+    DATA = snapshot
+    photo_cache.prune({model["image"] for model in snapshot.catalog.by_name.values()})
+
 # Загрузка данных
 try:
-    data = load_json_data()
-    TEXTS = data["TEXTS"]
-    MODELS = data["MODELS"]
+    activate_snapshot(build_snapshot())
 except Exception as e:
     logger.critical(f"Критическая ошибка загрузки данных: {e}")
     exit(1)
 
+_savings = None
+
+def savings_module():
+    """
+    Модуль расчета экономии. Импорт NumPy занимает заметную часть запуска, поэтому
+    модуль загружается при первом расчете или в фоне после запуска бота.
+    """
+    global _savings
+    if _savings is None:
+        import savings
+        _savings = savings
+    return _savings
+
 def get_user(uid: int) -> UserData:
-    """Возвращает или создает данные пользователя"""
-    if uid not in user_data:
-        user_data[uid] = UserData()
-    return user_data[uid]
+    """Возвращает или создает данные пользователя (в личном чате chat_id совпадает с user_id)"""
+    return storage.get_record(uid, uid)
+
+def save_user(uid: int):
+    """Помечает измененные данные пользователя для записи на диск"""
+    storage.mark_dirty(uid, uid)
+
+def get_lang_text(language: str, key: str, **kwargs) -> str:
+    """Возвращает текст на указанном языке с подстановкой переменных"""
+    text = lookup_text(current_data().texts, language, key)
+    return text.format(**kwargs) if kwargs else text
 
 def get_text(uid: int, key: str, **kwargs) -> str:
     """Возвращает локализованный текст с подстановкой переменных"""
-    user = get_user(uid)
-    text = TEXTS.get(user.language, {}).get(key, TEXTS['ru'].get(key, "❌ Текст не найден"))
-    return text.format(**kwargs) if kwargs else text
+    return get_lang_text(get_user(uid).language, key, **kwargs)
 
-def create_menu(uid: int) -> ReplyKeyboardMarkup:
-    """Создает клавиатуру меню"""
-    menu_items = TEXTS[get_user(uid).language]['menu']
-    kb = ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
-    kb.add(*[KeyboardButton(item) for item in menu_items])
-    return kb
+def get_keyboard(kind: str, language: str) -> str:
+    """Возвращает готовую сериализованную клавиатуру из текущего снимка данных"""
+    keyboards = current_data().keyboards
+    markup = keyboards.get((kind, language))
+    return markup if markup is not None else keyboards[(kind, "ru")]
 
-def create_models_keyboard(uid: int) -> ReplyKeyboardMarkup:
-    """Создает клавиатуру с моделями техники"""
-    kb = ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
-    models_list = [model["name"] for category in MODELS.values() for model in category]
-    kb.add(*[KeyboardButton(model) for model in models_list])
-    kb.add(KeyboardButton(get_text(uid, "back")))
-    return kb
+def create_menu(uid: int) -> str:
+    """Возвращает клавиатуру меню"""
+    return get_keyboard("menu", get_user(uid).language)
 
-def create_categories_keyboard(uid: int) -> ReplyKeyboardMarkup:
-    """Создает клавиатуру с категориями техники"""
-    kb = ReplyKeyboardMarkup(resize_keyboard=True)
-    kb.add(*[KeyboardButton(category) for category in MODELS.keys()])
-    kb.add(KeyboardButton(get_text(uid, "back")))
+def create_models_keyboard(uid: int) -> str:
+    """Возвращает клавиатуру с моделями техники"""
+    return get_keyboard("models", get_user(uid).language)
+
+def create_categories_keyboard(uid: int) -> str:
+    """Возвращает клавиатуру с категориями техники"""
+    return get_keyboard("categories", get_user(uid).language)
+
+def create_language_keyboard() -> str:
+    """Возвращает клавиатуру выбора языка (не зависит от языка пользователя)"""
+    return current_data().keyboards[("language", "")]
+
+async def send_model_photo(message: types.Message, model: Dict[str, Any], caption: str,
+                           reply_markup=None) -> types.Message:
+    """Отправляет фото модели, повторно используя file_id уже загруженного изображения"""
+    url = model["image"]
+    file_id = photo_cache.get(url)
+    if file_id:
+        try:
+            return await message.answer_photo(file_id, caption=caption, reply_markup=reply_markup)
+        except BadRequest as e:
+            logger.warning(f"Telegram отклонил сохраненный file_id для {url}: {e}")
+            photo_cache.drop(url)
+
+    sent = await message.answer_photo(url, caption=caption, reply_markup=reply_markup)
+    if sent.photo:
+        photo_cache.put(url, sent.photo[-1].file_id)
+    return sent
+
+def model_caption(model: Dict[str, Any], position: int, total: int) -> str:
+    """Формирует подпись карточки модели"""
+    caption = f"<b>{model['name']}</b> — {model['price']} сум\n"
+    if "specs" in model:
+        for spec, value in model["specs"].items():
+            caption += f"\n• <i>{spec}:</i> {value}"
+    if total > 1:
+        caption += f"\n\n{position + 1} / {total}"
+    return caption
+
+def catalog_card_keyboard(language: str, category_index: int, index: int, total: int) -> InlineKeyboardMarkup:
+    """Кнопки карточки: листание по категории, сравнение и расчет"""
+    version = current_data().catalog.version[:CATALOG_VERSION_LENGTH]
+
+    def button(text: str, target: int, action: str) -> InlineKeyboardButton:
+        return InlineKeyboardButton(text, callback_data=catalog_cb.new(
+            version=version, category=category_index, index=target, action=action
+        ))
+
+    kb = InlineKeyboardMarkup(row_width=2)
+    if total > 1:
+        kb.row(button("◀", (index - 1) % total, "show"), button("▶", (index + 1) % total, "show"))
+    kb.row(button(get_lang_text(language, "compare"), index, "compare"),
+           button(get_lang_text(language, "calculator"), index, "calculate"))
     return kb
 
+async def show_catalog_card(message: types.Message, language: str, category_index: int, index: int,
+                            edit: bool = False):
+    """
+    Показывает карточку модели: новым сообщением или заменой фото и подписи в том же
+    сообщении; если заменить нельзя, старая карточка удаляется и отправляется новая
+    """
+    category = current_data().catalog.ordered_categories[category_index]
+    models = current_data().models[category]
+    model = models[index]
+    analytics.record(VIEW, model["name"])
+    caption = model_caption(model, index, len(models))
+    reply_markup = catalog_card_keyboard(language, category_index, index, len(models))
+
+    if edit:
+        if message.photo:
+            try:
+                await edit_card_photo(message, model["image"], caption, reply_markup)
+                return
+            except MessageNotModified:
+                return
+            except BadRequest as e:
+                logger.warning(f"Не удалось заменить фото карточки {model['name']}: {e}")
+        # Карточка без фото (отправка фото не удалась) или замена не прошла: новая карточка вместо старой
+        try:
+            await message.delete()
+        except TelegramAPIError:
+            pass
+
+    try:
+        await send_model_photo(message, model, caption=caption, reply_markup=reply_markup)
+    except Exception as e:
+        logger.error(f"Ошибка отправки фото: {e}")
+        await message.answer(caption, reply_markup=reply_markup)
+
+async def edit_card_photo(message: types.Message, url: str, caption: str, reply_markup: InlineKeyboardMarkup):
+    """Заменяет фото и подпись карточки: по сохраненному file_id, а если его нет или он отклонен — по URL"""
+    file_id = photo_cache.get(url)
+    if file_id:
+        try:
+            await message.edit_media(InputMediaPhoto(file_id, caption=caption), reply_markup=reply_markup)
+            return
+        except MessageNotModified:
+            raise
+        except BadRequest as e:
+            logger.warning(f"Telegram отклонил сохраненный file_id для {url}: {e}")
+            photo_cache.drop(url)
+
+    edited = await message.edit_media(InputMediaPhoto(url, caption=caption), reply_markup=reply_markup)
+    if isinstance(edited, types.Message) and edited.photo:
+        photo_cache.put(url, edited.photo[-1].file_id)
+
 async def delete_previous_messages(bot: Bot, chat_id: int, message_ids: List[int]):
     """Удаляет предыдущие сообщения бота"""
     for msg_id in message_ids:
@@ -161,9 +804,214 @@ class CalculatorStates(StatesGroup):
 
 # ==================== ИНИЦИАЛИЗАЦИЯ БОТА ====================
 
-bot = Bot(token=Config.BOT_TOKEN, parse_mode="HTML")
-storage = MemoryStorage()
-dp = Dispatcher(bot, storage=storage)
+# Все исходящие запросы к чатам проходят через общий планировщик с учетом лимитов Telegram
+bot = ScheduledBot(
+    token=Config.BOT_TOKEN,
+    parse_mode="HTML",
+    # Локальный сервер Bot API (telegram-bot-api) или api.telegram.org
+    server=TelegramAPIServer.from_base(Config.API_SERVER) if Config.API_SERVER else TELEGRAM_PRODUCTION,
+    connections_limit=Config.API_CONNECTIONS_LIMIT,
+    timeout=aiohttp.ClientTimeout(total=Config.API_TIMEOUT, connect=Config.API_CONNECT_TIMEOUT),
+    connector_options={
+        "limit_per_host": Config.API_CONNECTIONS_PER_HOST,
+        "keepalive_timeout": Config.API_KEEPALIVE_TIMEOUT,
+        "ttl_dns_cache": Config.API_DNS_CACHE_TTL,
+    },
+    scheduler=SendScheduler(
+        global_rate=Config.SEND_GLOBAL_RATE,
+        chat_rate=Config.SEND_CHAT_RATE,
+        chat_burst=Config.SEND_CHAT_BURST,
+        max_retries=Config.SEND_MAX_RETRIES
+    )
+)
+storage = UserStateStorage(
+    Config.STATE_DB_PATH,
+    capacity=Config.USER_CACHE_SIZE,
+    ttl=Config.USER_CACHE_TTL,
+    flush_interval=Config.STATE_FLUSH_INTERVAL
+)
+# Статистика использования хранится в том же файле SQLite, что и состояния
+analytics = Analytics(Config.STATE_DB_PATH, flush_interval=Config.ANALYTICS_FLUSH_INTERVAL)
+# Состояния FSM читаются один раз за обновление, изменения записываются одной операцией
+fsm_storage = UnitOfWorkStorage(storage)
+dp = Dispatcher(bot, storage=fsm_storage)
+
+# ==================== МЕТРИКИ ====================
+
+metrics = Metrics()
+bot.on_api_call = metrics.observe_api_call
+storage.on_state_change = metrics.observe_state_change
+metrics.register_gauge("bot_fsm_active_sessions", lambda: storage.active_sessions)
+metrics.register_gauge("bot_users_cached", lambda: storage.cached_count)
+metrics.register_gauge("bot_send_queues", lambda: bot.scheduler.active_chats)
+metrics.register_gauge("bot_api_connections_created", lambda: bot.connections_created)
+metrics.register_gauge("bot_api_connections_reused", lambda: bot.connections_reused)
+metrics.register_gauge("bot_api_connect_seconds", lambda: bot.connect_seconds)
+metrics.register_gauge("bot_log_dropped", lambda: log_handler.dropped)
+metrics.register_gauge("bot_log_suppressed", lambda: log_handler.sampler.suppressed)
+
+# Типы обновлений, которые обрабатывает бот
+UPDATE_TYPES = ("message", "callback_query", "inline_query", "edited_message")
+
+class MetricsMiddleware(BaseMiddleware):
+    """
+    Измеряет время обработки каждого обновления и запоминает сработавший обработчик.
+    Подключается первым: время от получения обновления до pre_process_message
+    (после того как ChatOrderMiddleware дождалась очереди чата) учитывается
+    отдельно как ожидание очереди и не входит во время обработчика.
+    """
+
+    async def on_pre_process_update(self, update: types.Update, data: dict):
+        update.conf["received"] = time.perf_counter()
+
+    @staticmethod
+    def start_timer():
+        update = types.Update.get_current()
+        if update is not None:
+            update.conf.setdefault("started", time.perf_counter())
+
+    async def on_pre_process_message(self, message: types.Message, data: dict):
+        self.start_timer()
+
+    async def on_pre_process_callback_query(self, query: types.CallbackQuery, data: dict):
+        self.start_timer()
+
+    async def on_pre_process_inline_query(self, query: types.InlineQuery, data: dict):
+        self.start_timer()
+
+    async def on_process_message(self, message: types.Message, data: dict):
+        types.Update.get_current().conf["handler"] = current_handler.get().__name__
+
+    async def on_process_callback_query(self, query: types.CallbackQuery, data: dict):
+        types.Update.get_current().conf["handler"] = current_handler.get().__name__
+
+    async def on_process_inline_query(self, query: types.InlineQuery, data: dict):
+        types.Update.get_current().conf["handler"] = current_handler.get().__name__
+
+    async def on_post_process_update(self, update: types.Update, results: list, data: dict):
+        received = update.conf.get("received")
+        if received is None:
+            return
+        started = update.conf.get("started", received)
+        update_type = next((name for name in UPDATE_TYPES if getattr(update, name) is not None), "other")
+        route = update.message.conf.get("route") if update.message else None
+        metrics.observe_update(
+            update_type, route or "-", update.conf.get("handler", "unhandled"),
+            time.perf_counter() - started, started - received
+        )
+
+dp.middleware.setup(MetricsMiddleware())
+
+# ==================== МАРШРУТИЗАЦИЯ ====================
+
+class SnapshotMiddleware(BaseMiddleware):
+    """Фиксирует снимок данных на все время обработки обновления"""
+
+    async def on_pre_process_update(self, update: types.Update, data: dict):
+        _current_data.set(DATA)
+
+class UnitOfWorkMiddleware(BaseMiddleware):
+    """Открывает единицу работы FSM на время обработки обновления и записывает изменения в конце"""
+
+    def __init__(self, unit_storage: UnitOfWorkStorage):
+        super().__init__()
+        self.unit_storage = unit_storage
+
+    async def on_pre_process_update(self, update: types.Update, data: dict):
+        self.unit_storage.begin()
+
+    async def on_pre_process_error(self, update: types.Update, exception: Exception, data: dict):
+        # Изменения обработчика, завершившегося ошибкой, не записываются
+        self.unit_storage.rollback()
+
+    async def on_post_process_update(self, update: types.Update, results: list, data: dict):
+        await self.unit_storage.commit()
+
+def update_chat(update: types.Update) -> int:
+    """Чат обновления, а для обновлений без чата (inline-запросы) — пользователь; 0, если нет ни того, ни другого"""
+    message = update.message or update.edited_message or (update.callback_query and update.callback_query.message)
+    if message:
+        return message.chat.id
+    event = update.callback_query or update.inline_query or update.chosen_inline_result
+    return event.from_user.id if event else 0
+
+class ChatOrderMiddleware(BaseMiddleware):
+    """
+    Обрабатывает обновления одного чата строго по очереди, разных чатов — параллельно.
+    Подключается после UnitOfWorkMiddleware: изменения FSM записываются до того,
+    как очередь перейдет к следующему обновлению чата.
+    """
+
+    def __init__(self, serializer: ChatSerializer):
+        super().__init__()
+        self.serializer = serializer
+
+    async def on_pre_process_update(self, update: types.Update, data: dict):
+        chat_id = update_chat(update)
+        if not chat_id:
+            return
+        await self.serializer.acquire(chat_id)
+        update.conf["chat_turn"] = chat_id
+        # Если обработка прервется до post_process_update, очередь освободится с завершением задачи
+        task = asyncio.current_task()
+        if task is not None:
+            task.add_done_callback(lambda _: self.release(update))
+
+    async def on_post_process_update(self, update: types.Update, results: list, data: dict):
+        self.release(update)
+
+    def release(self, update: types.Update):
+        chat_id = update.conf.pop("chat_turn", None)
+        if chat_id is not None:
+            self.serializer.release(chat_id)
+
+class UserRecordMiddleware(BaseMiddleware):
+    """
+    Загружает запись пользователя до обработчика: промах кэша читается с диска
+    в потоке пула, и синхронный get_user в обработчике уже не ходит на диск
+    """
+
+    def __init__(self, user_storage: UserStateStorage):
+        super().__init__()
+        self.user_storage = user_storage
+
+    async def load(self, user: Optional[types.User]):
+        if user is not None:
+            await self.user_storage.load_record(user.id, user.id)
+
+    async def on_pre_process_message(self, message: types.Message, data: dict):
+        await self.load(message.from_user)
+
+    async def on_pre_process_callback_query(self, query: types.CallbackQuery, data: dict):
+        await self.load(query.from_user)
+
+    async def on_pre_process_inline_query(self, query: types.InlineQuery, data: dict):
+        await self.load(query.from_user)
+
+class RoutingMiddleware(BaseMiddleware):
+    """Определяет маршрут сообщения один раз до проверки фильтров"""
+
+    async def on_pre_process_message(self, message: types.Message, data: dict):
+        message.conf["route"] = resolve_route(message.text)
+
+class RouteFilter(BoundFilter):
+    """Фильтр по маршруту, вычисленному RoutingMiddleware"""
+    key = "route"
+
+    def __init__(self, route: str):
+        self.route = route
+
+    async def check(self, message: types.Message) -> bool:
+        return message.conf.get("route") == self.route
+
+dp.middleware.setup(SnapshotMiddleware())
+dp.middleware.setup(UnitOfWorkMiddleware(fsm_storage))
+chat_serializer = ChatSerializer(Config.MAX_CONCURRENT_UPDATES)
+dp.middleware.setup(ChatOrderMiddleware(chat_serializer))
+metrics.register_gauge("bot_busy_chats", lambda: chat_serializer.active_chats)
+dp.middleware.setup(UserRecordMiddleware(storage))
+dp.middleware.setup(RoutingMiddleware())
+dp.filters_factory.bind(RouteFilter, event_handlers=[dp.message_handlers])
 
 # ==================== ОБРАБОТЧИКИ КОМАНД ====================
 
@@ -191,17 +1039,13 @@ async def prompt_language(message: types.Message):
         reply_markup=create_language_keyboard()
     )
 
-def create_language_keyboard() -> ReplyKeyboardMarkup:
-    """Создает клавиатуру выбора языка"""
-    kb = ReplyKeyboardMarkup(resize_keyboard=True)
-    kb.add("🇷🇺 Русский", "🇺🇿 O‘zbekcha")
-    return kb
-
-@dp.message_handler(lambda m: m.text in ["🇷🇺 Русский", "🇺🇿 O‘zbekcha"])
+@dp.message_handler(route="language")
 async def set_language_handler(message: types.Message):
     """Устанавливает язык пользователя"""
     user = get_user(message.from_user.id)
     user.language = "ru" if "Рус" in message.text else "uz"
+    save_user(message.from_user.id)
+    analytics.record(LANGUAGE, user.language)
     
     await message.answer(
         get_text(message.from_user.id, "start"),
@@ -210,7 +1054,7 @@ async def set_language_handler(message: types.Message):
 
 # ==================== ОБРАБОТЧИКИ МЕНЮ ====================
 
-@dp.message_handler(lambda m: m.text == get_text(m.from_user.id, "catalog"))
+@dp.message_handler(route="catalog")
 async def catalog_handler(message: types.Message):
     """Обработчик каталога техники"""
     await message.answer(
@@ -218,29 +1062,54 @@ async def catalog_handler(message: types.Message):
         reply_markup=create_categories_keyboard(message.from_user.id)
     )
 
-@dp.message_handler(lambda m: m.text in MODELS.keys())
+@dp.message_handler(route="category")
 async def category_handler(message: types.Message):
     """Обработчик выбора категории техники"""
-    category = message.text
-    models = MODELS[category]
-    
-    for model in models:
-        caption = f"<b>{model['name']}</b> — {model['price']} сум\n"
-        if "specs" in model:
-            for spec, value in model["specs"].items():
-                caption += f"\n• <i>{spec}:</i> {value}"
-        
-        try:
-            await message.answer_photo(
-                model["image"],
-                caption=caption,
-                reply_markup=create_menu(message.from_user.id)
-            )
-        except Exception as e:
-            logger.error(f"Ошибка отправки фото: {e}")
-            await message.answer(caption)
+    category_index = current_data().catalog.ordered_categories.index(message.text)
+    analytics.record(CATEGORY, message.text)
+    await show_catalog_card(message, get_user(message.from_user.id).language, category_index, 0)
+
+@dp.callback_query_handler(catalog_cb.filter(), state="*")
+async def catalog_card_handler(query: types.CallbackQuery, callback_data: Dict[str, str], state: FSMContext):
+    """Листание карточек каталога и переход к сравнению или расчету"""
+    snapshot = current_data()
+    catalog = snapshot.catalog
+    if callback_data["version"] != catalog.version[:CATALOG_VERSION_LENGTH]:
+        await query.answer("Каталог обновился, откройте категорию заново.", show_alert=True)
+        return
+
+    # Данные кнопки приходят от клиента и могут быть подделаны
+    raw_category, raw_index = callback_data["category"], callback_data["index"]
+    if not (raw_category.isdigit() and raw_index.isdigit()) or \
+            int(raw_category) >= len(catalog.ordered_categories) or \
+            int(raw_index) >= len(snapshot.models[catalog.ordered_categories[int(raw_category)]]):
+        await query.answer("Модель не найдена, откройте категорию заново.", show_alert=True)
+        return
+
+    category_index, index = int(raw_category), int(raw_index)
+    category = catalog.ordered_categories[category_index]
+    model_name = snapshot.models[category][index]["name"]
+    user_id = query.from_user.id
+    action = callback_data["action"]
+
+    if action == "show":
+        await query.answer()
+        await show_catalog_card(query.message, get_user(user_id).language, category_index, index, edit=True)
+    elif action == "open":
+        await query.answer()
+        await show_catalog_card(query.message, get_user(user_id).language, category_index, index)
+    elif action == "compare":
+        await query.answer(model_name)
+        await state.finish()
+        await select_for_comparison(query.message, user_id, model_name)
+    elif action == "calculate":
+        await query.answer(model_name)
+        await state.finish()
+        await start_calculation(query.message, state, model_name)
+    else:
+        await query.answer()
 
-@dp.message_handler(lambda m: m.text == get_text(m.from_user.id, "calculator"))
+@dp.message_handler(route="calculator")
 async def calculator_handler(message: types.Message):
     """Обработчик запуска калькулятора"""
     await message.answer(
@@ -255,31 +1124,168 @@ async def calculator_handler(message: types.Message):
 async def process_model(message: types.Message, state: FSMContext):
     """Обработчик выбора модели для калькулятора"""
     model_name = message.text
-    model_exists = any(model_name in (m["name"] for m in models) for models in MODELS.values())
     
-    if not model_exists:
+    if model_name not in current_data().catalog.names:
         await message.answer("❌ Модель не найдена. Пожалуйста, выберите из списка.")
         return
     
+    await start_calculation(message, state, model_name)
+
+class CalculatorField(NamedTuple):
+    """Поле калькулятора: допустимый диапазон (min_val, max_val] и названия для ввода одной строкой"""
+    key: str
+    label: str
+    min_val: float
+    max_val: float
+    aliases: Tuple[str, ...]
+
+# Поля в порядке шагов CalculatorStates; первое название — то, что показывается в подсказке
+CALCULATOR_FIELDS = (
+    CalculatorField("hours_per_day", "часы", 0, 24, ("часы", "час", "ч", "soat", "hours")),
+    CalculatorField("days_per_month", "дни", 0, 31, ("дни", "дней", "день", "д", "kun", "days")),
+    CalculatorField("months_total", "месяцы", 1, float('inf'), ("месяцы", "месяцев", "мес", "oy", "months")),
+    CalculatorField("rent_per_month", "аренда", 1, float('inf'), ("аренда", "ijara", "rent")),
+    CalculatorField("operator_salary", "зарплата", 1, float('inf'), ("зарплата", "зп", "оператор", "maosh", "salary")),
+    CalculatorField("fuel_per_day", "топливо", 0, float('inf'), ("топливо", "расход", "литры", "yoqilgi", "fuel")),
+    CalculatorField("fuel_price", "цена", 0, float('inf'), ("цена", "цена_топлива", "narx", "fuel_price")),
+    CalculatorField("service_cost", "обслуживание", 0, float('inf'), ("обслуживание", "сервис", "xizmat", "service")),
+)
+CALCULATOR_FIELD_BY_KEY = {field.key: field for field in CALCULATOR_FIELDS}
+CALCULATOR_ALIASES = {alias: field for field in CALCULATOR_FIELDS for alias in field.aliases}
+
+# Множители для сокращений вида «15млн», «900к»
+NUMBER_SUFFIXES = {"": 1, "к": 1e3, "k": 1e3, "тыс": 1e3, "млн": 1e6, "m": 1e6, "mln": 1e6}
+NUMBER_PATTERN = re.compile(r"^(\d+(?:\.\d+)?)(" + "|".join(sorted(NUMBER_SUFFIXES, key=len, reverse=True)) + r")$")
+KEY_VALUE_SEPARATOR = re.compile(r"\s*[=:]\s*")
+
+def parse_number(raw: str) -> Optional[float]:
+    """Разбирает число с запятой или точкой и необязательным сокращением (к, тыс, млн)"""
+    match = NUMBER_PATTERN.match(raw.lower().replace(",", ".").replace("_", ""))
+    if not match:
+        return None
+    return float(match.group(1)) * NUMBER_SUFFIXES[match.group(2)]
+
+def field_range(field: CalculatorField) -> str:
+    """Допустимый диапазон поля для сообщений об ошибке"""
+    if field.max_val == float('inf'):
+        return f"больше {field.min_val:g}"
+    return f"от {field.min_val:g} до {field.max_val:g}"
+
+# Разделитель значений при вводе одной строкой
+VALUE_SEPARATOR = re.compile(r"[\s;]+")
+# Название поля перед «=» или «:» — признак ввода с названиями («часы=10», «зп: 5млн»)
+NAMED_FIELD = re.compile(
+    r"(?:^|[\s;])(?:" + "|".join(re.escape(alias) for alias in sorted(CALCULATOR_ALIASES, key=len, reverse=True))
+    + r")\s*[=:]",
+    re.IGNORECASE
+)
+# Число, разбитое пробелами на разряды: «15 000 000»; запятая или точка после него — знак препинания,
+# если за ней не идет цифра
+GROUPED_NUMBER = re.compile(r"(?<![\w.,])\d{1,3}(?:[ \u00a0\u202f]\d{3})+(?!\w|[.,]\d)")
+GROUPED_VALUE = re.compile(r"(=\s*)(\d{1,3}(?:[ \u00a0\u202f]\d{3})+)(?!\w|[.,]\d)")
+
+def join_digit_groups(text: str) -> str:
+    """Склеивает числа, разбитые пробелами на разряды: «15 000 000» → «15000000»"""
+    return GROUPED_NUMBER.sub(lambda match: re.sub(r"\s", "", match.group()), text)
+
+def is_one_shot_input(text: str) -> bool:
+    """
+    Сообщение похоже на ввод всех значений калькулятора одной строкой: есть
+    название поля перед «=» или «:» или больше одного числа. Ответы вроде
+    «10 часов», «10:30» или «15 000 000» остаются ответом на один вопрос.
+    """
+    if NAMED_FIELD.search(text):
+        return True
+    return sum(parse_number(token) is not None for token in VALUE_SEPARATOR.split(join_digit_groups(text))) > 1
+
+def split_calculator_input(text: str) -> Tuple[Dict[str, str], List[str], List[str]]:
+    """Делит строку на значения с названиями, значения по порядку и ошибки в названиях"""
+    named: Dict[str, str] = {}
+    positional: List[str] = []
+    errors: List[str] = []
+    for token in VALUE_SEPARATOR.split(text):
+        if not token:
+            continue
+        if "=" not in token:
+            positional.append(token)
+            continue
+        alias, raw = token.split("=", 1)
+        field = CALCULATOR_ALIASES.get(alias.lower())
+        if field is None:
+            errors.append(f"«{alias}»: неизвестное поле")
+        elif field.key in named:
+            errors.append(f"{field.label}: указано дважды")
+        else:
+            named[field.key] = raw
+    return named, positional, errors
+
+def parse_calculator_input(text: str) -> Tuple[Dict[str, float], List[str]]:
+    """
+    Разбирает значения калькулятора из одной строки: по порядку («10 22 12 ...»)
+    или по названиям («часы=10 дни=22 ...»). Значения без названий заполняют
+    оставшиеся поля по порядку. Возвращает значения и ошибки по полям.
+
+    Число после названия может быть разбито пробелами на разряды («аренда=15 000 000»).
+    Среди значений по порядку разряды неотличимы от отдельных значений, поэтому
+    склеиваются, только если без этого значений больше, чем полей.
+    """
+    text = KEY_VALUE_SEPARATOR.sub("=", text.strip())
+    text = GROUPED_VALUE.sub(lambda match: match.group(1) + re.sub(r"\s", "", match.group(2)), text)
+    named, positional, errors = split_calculator_input(text)
+    remaining = [field for field in CALCULATOR_FIELDS if field.key not in named]
+    if len(positional) > len(remaining):
+        named, positional, errors = split_calculator_input(join_digit_groups(text))
+    if len(positional) > len(remaining):
+        errors.append(f"лишние значения: {' '.join(positional[len(remaining):])}")
+    for field, raw in zip(remaining, positional):
+        named[field.key] = raw
+
+    values: Dict[str, float] = {}
+    for field in CALCULATOR_FIELDS:
+        raw = named.get(field.key)
+        if raw is None:
+            errors.append(f"{field.label}: не указано")
+            continue
+        value = parse_number(raw)
+        if value is None or value <= field.min_val or value > field.max_val:
+            errors.append(f"{field.label}: «{raw}» — нужно число {field_range(field)}")
+            continue
+        values[field.key] = value
+    return values, errors
+
+def calculator_input_hint() -> str:
+    """Подсказка о вводе всех значений одной строкой"""
+    labels = " ".join(field.label for field in CALCULATOR_FIELDS)
+    return (
+        "💡 Можно сразу отправить все значения одной строкой по порядку "
+        f"({labels}), например:\n<code>10 22 12 15млн 5млн 60 12500 10млн</code>\n"
+        "или с названиями: <code>часы=10 дни=22 ...</code>"
+    )
+
+async def start_calculation(message: types.Message, state: FSMContext, model_name: str):
+    """Запоминает модель и переходит к вопросам калькулятора"""
     await state.update_data(model=model_name)
-    await message.answer("⌚ Сколько часов в день работает техника?")
-    await CalculatorStates.hours_per_day.set()
+    analytics.record(CALC_START, model_name)
+    await message.answer("⌚ Сколько часов в день работает техника?\n\n" + calculator_input_hint())
+    await state.set_state(CalculatorStates.hours_per_day)
 
-async def validate_number_input(message: types.Message, min_val: float = 0, max_val: float = float('inf')) -> Optional[float]:
-    """Валидирует числовой ввод"""
-    try:
-        value = float(message.text)
-        if value <= min_val or value > max_val:
-            raise ValueError
-        return value
-    except ValueError:
-        await message.answer(f"Пожалуйста, введите число от {min_val} до {max_val}")
+async def validate_number_input(message: types.Message, key: str) -> Optional[float]:
+    """Валидирует числовой ввод для поля калькулятора"""
+    field = CALCULATOR_FIELD_BY_KEY[key]
+    value = parse_number(join_digit_groups(message.text.strip()))
+    if value is None or value <= field.min_val or value > field.max_val:
+        await message.answer(f"Пожалуйста, введите число {field_range(field)}")
         return None
+    return value
 
 @dp.message_handler(state=CalculatorStates.hours_per_day)
 async def process_hours(message: types.Message, state: FSMContext):
-    """Обработчик часов работы"""
-    hours = await validate_number_input(message, min_val=0, max_val=24)
+    """Обработчик часов работы или всех значений одной строкой"""
+    if is_one_shot_input(message.text):
+        await process_one_shot(message, state)
+        return
+
+    hours = await validate_number_input(message, "hours_per_day")
     if hours is None:
         return
     
@@ -290,7 +1296,7 @@ async def process_hours(message: types.Message, state: FSMContext):
 @dp.message_handler(state=CalculatorStates.days_per_month)
 async def process_days(message: types.Message, state: FSMContext):
     """Обработчик дней использования"""
-    days = await validate_number_input(message, min_val=0, max_val=31)
+    days = await validate_number_input(message, "days_per_month")
     if days is None:
         return
     
@@ -301,7 +1307,7 @@ async def process_days(message: types.Message, state: FSMContext):
 @dp.message_handler(state=CalculatorStates.months_total)
 async def process_months(message: types.Message, state: FSMContext):
     """Обработчик месяцев использования"""
-    months = await validate_number_input(message, min_val=1)
+    months = await validate_number_input(message, "months_total")
     if months is None:
         return
     
@@ -312,7 +1318,7 @@ async def process_months(message: types.Message, state: FSMContext):
 @dp.message_handler(state=CalculatorStates.rent_per_month)
 async def process_rent(message: types.Message, state: FSMContext):
     """Обработчик стоимости аренды"""
-    rent = await validate_number_input(message, min_val=1)
+    rent = await validate_number_input(message, "rent_per_month")
     if rent is None:
         return
     
@@ -323,7 +1329,7 @@ async def process_rent(message: types.Message, state: FSMContext):
 @dp.message_handler(state=CalculatorStates.operator_salary)
 async def process_salary(message: types.Message, state: FSMContext):
     """Обработчик зарплаты оператора"""
-    salary = await validate_number_input(message, min_val=1)
+    salary = await validate_number_input(message, "operator_salary")
     if salary is None:
         return
     
@@ -334,7 +1340,7 @@ async def process_salary(message: types.Message, state: FSMContext):
 @dp.message_handler(state=CalculatorStates.fuel_per_day)
 async def process_fuel_consumption(message: types.Message, state: FSMContext):
     """Обработчик расхода топлива"""
-    fuel = await validate_number_input(message, min_val=0)
+    fuel = await validate_number_input(message, "fuel_per_day")
     if fuel is None:
         return
     
@@ -345,7 +1351,7 @@ async def process_fuel_consumption(message: types.Message, state: FSMContext):
 @dp.message_handler(state=CalculatorStates.fuel_price)
 async def process_fuel_price(message: types.Message, state: FSMContext):
     """Обработчик цены топлива"""
-    price = await validate_number_input(message, min_val=0)
+    price = await validate_number_input(message, "fuel_price")
     if price is None:
         return
     
@@ -356,19 +1362,30 @@ async def process_fuel_price(message: types.Message, state: FSMContext):
 @dp.message_handler(state=CalculatorStates.service_cost)
 async def process_service_cost(message: types.Message, state: FSMContext):
     """Завершение расчета и вывод результатов"""
-    service_cost = await validate_number_input(message, min_val=0)
+    service_cost = await validate_number_input(message, "service_cost")
     if service_cost is None:
         return
     
     await state.update_data(service_cost=service_cost)
+    await finish_calculation(message, state, await state.get_data())
+
+async def process_one_shot(message: types.Message, state: FSMContext):
+    """Расчет по всем значениям, отправленным одним сообщением"""
+    values, errors = parse_calculator_input(message.text)
+    if errors:
+        await message.answer(
+            "❌ Не удалось разобрать значения:\n" + "\n".join(f"• {error}" for error in errors)
+            + "\n\n" + calculator_input_hint()
+        )
+        return
     data = await state.get_data()
-    user = get_user(message.from_user.id)
-    
+    await finish_calculation(message, state, dict(data, **values))
+
+async def finish_calculation(message: types.Message, state: FSMContext, data: Dict[str, Any]):
+    """Считает экономию по собранным значениям и завершает сценарий калькулятора"""
     # Находим модель в каталоге
-    model = next(
-        (item for items in MODELS.values() for item in items if item["name"] == data["model"]),
-        None
-    )
+    catalog = current_data().catalog
+    model = catalog.by_name.get(data.get("model"))
     
     if not model:
         await message.answer("❌ Модель не найдена.", reply_markup=create_menu(message.from_user.id))
@@ -376,24 +1393,22 @@ async def process_service_cost(message: types.Message, state: FSMContext):
         return
     
     # Расчет экономии
-    hours = data["hours_per_day"]
-    days = data["days_per_month"]
-    months = data["months_total"]
-    rent = data["rent_per_month"]
-    salary = data["operator_salary"]
-    fuel_cons = data["fuel_per_day"]
-    fuel_price = data["fuel_price"]
-    service = data["service_cost"]
-    
-    fuel_total = fuel_cons * fuel_price * days * months
-    own_cost = salary * months + fuel_total + service
-    rent_total = rent * months
-    saving = rent_total - own_cost
+    scenario = {
+        "fuel_per_day": data["fuel_per_day"],
+        "fuel_price": data["fuel_price"],
+        "days_per_month": data["days_per_month"],
+        "months_total": data["months_total"],
+        "rent_per_month": data["rent_per_month"],
+        "operator_salary": data["operator_salary"],
+        "service_cost": data["service_cost"],
+    }
+    price = catalog.prices[model["name"]]
+    result = savings_module().calculate_savings(price=price, **scenario)
     
-    try:
-        price = int(model["price"].replace(" ", "").replace("сум", ""))
-    except:
-        price = 0
+    months = scenario["months_total"]
+    own_cost = float(result["own_cost"])
+    rent_total = float(result["rent_total"])
+    saving = float(result["saving"])
     
     if saving <= 0:
         result_text = (
@@ -401,108 +1416,94 @@ async def process_service_cost(message: types.Message, state: FSMContext):
             f"Вы тратите {own_cost:,} сум, а аренда стоит {rent_total:,} сум."
         )
     else:
-        payback = round(price / (saving / months), 1) if price else 0
+        payback = float(result["payback"]) if price else 0
         result_text = (
             f"✅ Вы экономите ~{saving:,} сум за {months} мес.\n"
             f"📉 Срок окупаемости: {payback} мес.\n\n"
             f"🔹 Собственные расходы: {own_cost:,} сум\n"
             f"🔹 Стоимость аренды: {rent_total:,} сум"
         )
+    result_text += "\n\n" + format_sensitivity(scenario)
     
     await message.answer(result_text, reply_markup=create_menu(message.from_user.id))
     await state.finish()
+    metrics.observe_completion("calculator")
+    analytics.record(CALC_DONE, model["name"])
+
+# Множители цены топлива и аренды для таблицы чувствительности
+SENSITIVITY_FACTORS = (0.8, 1.0, 1.2)
+
+def format_sensitivity(scenario: Dict[str, float]) -> str:
+    """Формирует компактную таблицу чувствительности экономии и точки безубыточности"""
+    table = savings_module().sensitivity_table(scenario, SENSITIVITY_FACTORS, SENSITIVITY_FACTORS)
+    header = "топл.\\аренда " + " ".join(f"{factor - 1:>+7.0%}" for factor in SENSITIVITY_FACTORS)
+    rows = [
+        f"{fuel_factor - 1:>+12.0%} " + " ".join(f"{value / 1e6:>7.1f}" for value in row)
+        for fuel_factor, row in zip(SENSITIVITY_FACTORS, table)
+    ]
+    points = savings_module().break_even(**scenario)
+    text = (
+        "📊 <b>Экономия (млн сум) при изменении цены топлива и аренды:</b>\n"
+        f"<pre>{header}\n" + "\n".join(rows) + "</pre>\n"
+        f"⚖ Аренда без выгоды: {points['rent_per_month']:,.0f} сум/мес."
+    )
+    # Отрицательная цена топлива означает, что аренда не окупает даже остальные расходы
+    if not math.isnan(points["fuel_price"]) and points["fuel_price"] > 0:
+        text += f"\n⚖ Цена топлива без выгоды: {points['fuel_price']:,.0f} сум/л"
+    return text
 
 # ==================== ОБРАБОТЧИКИ СРАВНЕНИЯ МОДЕЛЕЙ ====================
 
-@dp.message_handler(lambda m: m.text == get_text(m.from_user.id, "compare"))
+@dp.message_handler(route="compare")
 async def start_compare_handler(message: types.Message):
     """Начало сравнения моделей"""
     user = get_user(message.from_user.id)
     user.compare_selection = []
+    save_user(message.from_user.id)
     
     await message.answer(
         "Выберите первую модель для сравнения:",
         reply_markup=create_models_keyboard(message.from_user.id)
     )
 
-@dp.message_handler(lambda m: m.text in [model["name"] for models in MODELS.values() for model in models])
+@dp.message_handler(route="model")
 async def compare_model_handler(message: types.Message):
     """Обработчик выбора моделей для сравнения"""
-    user = get_user(message.from_user.id)
-    model_name = message.text
+    await select_for_comparison(message, message.from_user.id, message.text)
+
+async def select_for_comparison(message: types.Message, user_id: int, model_name: str):
+    """Добавляет модель к сравнению и, когда выбрано достаточно моделей, выводит таблицу"""
+    user = get_user(user_id)
     
     if model_name in user.compare_selection:
         await message.answer("Эта модель уже выбрана для сравнения.")
         return
     
     user.compare_selection.append(model_name)
+    save_user(user_id)
     
-    if len(user.compare_selection) == 1:
-        await message.answer(
-            "Теперь выберите вторую модель:",
-            reply_markup=create_models_keyboard(message.from_user.id)
-        )
-    elif len(user.compare_selection) == 2:
-        model1 = next(
-            (item for items in MODELS.values() for item in items if item["name"] == user.compare_selection[0]),
-            None
+    if len(user.compare_selection) < Config.COMPARE_MAX_MODELS:
+        prompt = (
+            "Теперь выберите вторую модель:" if len(user.compare_selection) == 1
+            else f"Выбрано моделей: {len(user.compare_selection)} из {Config.COMPARE_MAX_MODELS}. Выберите следующую:"
         )
-        model2 = next(
-            (item for items in MODELS.values() for item in items if item["name"] == user.compare_selection[1]),
-            None
-        )
-        
-        if not model1 or not model2:
-            await message.answer("❌ Не удалось найти одну из моделей.")
-            user.compare_selection = []
-            return
-        
-        comparison_text = generate_comparison_text(model1, model2)
-        await message.answer(comparison_text, reply_markup=create_menu(message.from_user.id))
-        user.compare_selection = []
-
-def generate_comparison_text(model1: Dict, model2: Dict) -> str:
-    """Генерирует текст для сравнения моделей"""
-    text = (
-        f"🆚 <b>Сравнение моделей</b>\n\n"
-        f"<u>{model1['name']}</u> vs <u>{model2['name']}</u>\n\n"
-    )
-    
-    # Общие характеристики
-    common_specs = set(model1.get("specs", {}).keys()) & set(model2.get("specs", {}).keys())
-    if common_specs:
-        text += "📊 <b>Общие характеристики:</b>\n"
-        for spec in common_specs:
-            val1 = model1['specs'][spec]
-            val2 = model2['specs'][spec]
-            text += f"• {spec}: {val1} | {val2}\n"
-        text += "\n"
-    
-    # Уникальные характеристики первой модели
-    unique1 = set(model1.get("specs", {}).keys()) - set(model2.get("specs", {}).keys())
-    if unique1:
-        text += f"🔹 <b>Уникальные характеристики {model1['name']}:</b>\n"
-        for spec in unique1:
-            text += f"• {spec}: {model1['specs'][spec]}\n"
-        text += "\n"
+        await message.answer(prompt, reply_markup=create_models_keyboard(user_id))
+        return
     
-    # Уникальные характеристики второй модели
-    unique2 = set(model2.get("specs", {}).keys()) - set(model1.get("specs", {}).keys())
-    if unique2:
-        text += f"🔸 <b>Уникальные характеристики {model2['name']}:</b>\n"
-        for spec in unique2:
-            text += f"• {spec}: {model2['specs'][spec]}\n"
+    selection = tuple(user.compare_selection)
+    user.compare_selection = []
     
-    # Цены
-    text += f"\n💵 <b>Цены:</b>\n"
-    text += f"• {model1['name']}: {model1['price']}\n"
-    text += f"• {model2['name']}: {model2['price']}\n"
+    if any(name not in current_data().catalog.names for name in selection):
+        await message.answer("❌ Не удалось найти одну из моделей.")
+        return
     
-    return text
+    analytics.record(COMPARE, " / ".join(sorted(selection)))
+    comparison_text = render_comparison(selection, user.language)
+    await message.answer(comparison_text, reply_markup=create_menu(user_id))
 
 # ==================== ОБРАБОТЧИКИ КОНТАКТОВ И ИНФОРМАЦИИ ====================
 
-@dp.message_handler(lambda m: m.text.startswith("📞"))
+@dp.message_handler(route="contact")
 async def contact_handler(message: types.Message):
     """Обработчик контактов"""
     contact_text = (
@@ -512,7 +1513,7 @@ async def contact_handler(message: types.Message):
     )
     await message.answer(contact_text)
 
-@dp.message_handler(lambda m: m.text.startswith("🔒"))
+@dp.message_handler(route="policy")
 async def policy_handler(message: types.Message):
     """Обработчик политики конфиденциальности"""
     policy_text = (
@@ -525,12 +1526,208 @@ async def policy_handler(message: types.Message):
     )
     await message.answer(policy_text)
 
+# ==================== АДМИНИСТРИРОВАНИЕ ====================
+
+_reload_lock = asyncio.Lock()
+
+async def notify_admins(text: str):
+    """Отправляет сообщение всем администраторам"""
+    for admin_id in Config.ADMIN_IDS:
+        try:
+            await bot.send_message(admin_id, text)
+        except TelegramAPIError:
+            pass
+
+async def reload_data(reason: str) -> DataSnapshot:
+    """Перестраивает снимок данных в фоновом потоке и атомарно подменяет текущий"""
+    async with _reload_lock:
+        started = time.perf_counter()
+        try:
+            snapshot = await asyncio.get_event_loop().run_in_executor(None, build_snapshot)
+        except Exception as e:
+            logger.error(f"Перезагрузка данных ({reason}) не удалась: {e}", exc_info=True)
+            raise
+        activate_snapshot(snapshot)
+        logger.info(
+            f"Данные перезагружены ({reason}) за {(time.perf_counter() - started) * 1000:.0f} мс, "
+            f"версия каталога {snapshot.catalog.version}, моделей: {len(snapshot.catalog.names)}"
+        )
+        return snapshot
+
+async def watch_data_files():
+    """
+    Периодически проверяет время изменения файлов с данными и перезагружает их.
+    Файлы, которые не удалось загрузить, повторно не читаются, пока не изменятся,
+    а администраторы получают одно сообщение на каждую неудачную версию
+    (в режиме нескольких процессов — только от первого).
+    """
+    failed_mtimes = None
+    while True:
+        await asyncio.sleep(Config.RELOAD_INTERVAL)
+        try:
+            mtimes = data_files_mtimes()
+        except OSError as e:
+            logger.error(f"Не удалось проверить файлы с данными: {e}")
+            continue
+        if mtimes == dict(DATA.mtimes) or mtimes == failed_mtimes:
+            continue
+        try:
+            await reload_data("изменение файлов")
+        except Exception as e:
+            failed_mtimes = mtimes
+            if Config.WORKER_INDEX in ("", "0"):
+                await notify_admins(f"⚠ Не удалось перезагрузить данные: {e}\nБот продолжает работать со старыми данными.")
+        else:
+            failed_mtimes = None
+
+@dp.message_handler(commands=["reload"], user_id=Config.ADMIN_IDS, state="*")
+async def reload_handler(message: types.Message):
+    """Перезагружает каталог и тексты по команде администратора"""
+    started = time.perf_counter()
+    try:
+        snapshot = await reload_data(f"команда от {message.from_user.id}")
+    except Exception as e:
+        await message.answer(f"⚠ Не удалось перезагрузить данные: {e}")
+        return
+    await message.answer(
+        f"✅ Данные перезагружены за {(time.perf_counter() - started) * 1000:.0f} мс.\n"
+        f"Версия каталога: {snapshot.catalog.version}, моделей: {len(snapshot.catalog.names)}"
+    )
+
+def format_duration(seconds: float) -> str:
+    """Форматирует длительность в виде «2 ч 15 мин»"""
+    minutes = int(seconds // 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours} ч {minutes} мин" if hours else f"{minutes} мин"
+
+@dp.message_handler(commands=["stats"], user_id=Config.ADMIN_IDS, state="*")
+async def stats_handler(message: types.Message):
+    """Краткая сводка метрик для администратора"""
+    total = sum(metrics.updates.values())
+    lines = [
+        f"📊 <b>Статистика за {format_duration(time.time() - metrics.started_at)}</b>",
+        f"Обновлений: {total}, ошибок: {metrics.errors}",
+        f"Незавершенных расчетов: {storage.active_sessions}",
+        "",
+        "<b>Обработчики</b> (вызовов, p95):"
+    ]
+    busiest = sorted(metrics.handler_latency.items(), key=lambda item: item[1].count, reverse=True)
+    for name, histogram in busiest[:10]:
+        lines.append(f"• {name}: {histogram.count}, ≤ {histogram.quantile(0.95) * 1000:g} мс")
+    lines.append(f"Ожидание очереди чата, p95: ≤ {metrics.queue_wait.quantile(0.95) * 1000:g} мс")
+
+    api_calls = sum(histogram.count for histogram in metrics.api_latency.values())
+    lines += ["", f"<b>Telegram API</b>: запросов {api_calls}, ошибок {sum(metrics.api_errors.values())}"]
+    lines.append(f"Соединений: новых {bot.connections_created}, повторно {bot.connections_reused}")
+
+    funnel = [
+        f"{state.split(':')[-1]} {metrics.state_entries.get(state, 0)}"
+        for state in CalculatorStates.states_names
+    ]
+    funnel.append(f"готово {metrics.completions.get('calculator', 0)}")
+    lines += ["", "<b>Калькулятор</b>: " + " → ".join(funnel)]
+    await message.answer("\n".join(lines))
+
+def format_top(items: List[Tuple[str, int]]) -> List[str]:
+    """Строки рейтинга «1. название — число»"""
+    return [f"{place}. {key} — {count}" for place, (key, count) in enumerate(items, 1)] or ["нет данных"]
+
+@dp.message_handler(commands=["report"], user_id=Config.ADMIN_IDS, state="*")
+async def report_handler(message: types.Message):
+    """Отчет об использовании каталога, сравнения и калькулятора по готовой сводке"""
+    summary = analytics.summary
+    started, done = summary["calc_started"], summary["calc_done"]
+    rate = f"{done / started:.0%}" if started else "—"
+    languages = ", ".join(f"{language}: {count}" for language, count in summary["languages"].items()) or "нет данных"
+    age = format_duration(time.time() - summary["built_at"])
+    lines = (
+        [f"📈 <b>Отчет об использовании</b> (сводка обновлена {age} назад)", "", "<b>Просмотры моделей</b>:"]
+        + format_top(summary["views"])
+        + ["", f"<b>За последние {analytics.window_minutes} мин</b>:"] + format_top(summary["recent_views"])
+        + ["", "<b>Категории</b>:"] + format_top(summary["categories"])
+        + ["", "<b>Сравнения</b>:"] + format_top(summary["comparisons"])
+        + ["", f"<b>Калькулятор</b>: начато {started}, завершено {done} ({rate})"] + format_top(summary["calculations"])
+        + ["", f"<b>Языки</b>: {languages}"]
+    )
+    await message.answer("\n".join(lines))
+
+# ==================== ПОИСК ====================
+
+def search_keyboard(names: Tuple[str, ...]) -> InlineKeyboardMarkup:
+    """Кнопки найденных моделей, открывающие их карточки"""
+    catalog = current_data().catalog
+    version = catalog.version[:CATALOG_VERSION_LENGTH]
+    kb = InlineKeyboardMarkup(row_width=1)
+    for name in names:
+        category_index, index = catalog.positions[name]
+        kb.add(InlineKeyboardButton(name, callback_data=catalog_cb.new(
+            version=version, category=category_index, index=index, action="open"
+        )))
+    return kb
+
+def thumbnail_url(model: Dict[str, Any]) -> Optional[str]:
+    """
+    Миниатюра для inline-результата: Telegram принимает только JPEG. Поле
+    "thumb" модели задает ее явно; у картинок WordPress вида «x.jpg.webp»
+    берется исходный JPEG, для остальных WebP миниатюры нет.
+    """
+    if model.get("thumb"):
+        return model["thumb"]
+    url = model["image"]
+    if url.lower().endswith((".jpg.webp", ".jpeg.webp")):
+        return url[:-len(".webp")]
+    if url.lower().endswith(".webp"):
+        return None
+    return url
+
+def inline_results(query: str) -> List[InlineQueryResultArticle]:
+    """Готовые результаты inline-запроса; кэшируются в снимке данных по тексту запроса"""
+    snapshot = current_data()
+    cache_key = " ".join(query.lower().split())
+    results = snapshot.inline_results.get(cache_key)
+    if results is not None:
+        return results
+
+    catalog = snapshot.catalog
+    names = (snapshot.search.search(cache_key, limit=Config.INLINE_RESULTS_LIMIT) if cache_key
+             else catalog.ordered_names[:Config.INLINE_RESULTS_LIMIT])
+    results = []
+    for name in names:
+        model = catalog.by_name[name]
+        results.append(InlineQueryResultArticle(
+            id="{}-{}".format(*catalog.positions[name]),
+            title=name,
+            description=f"{model['price']} · {catalog.category_of[name]}",
+            thumb_url=thumbnail_url(model),
+            input_message_content=InputTextMessageContent(model_caption(model, 0, 1), parse_mode="HTML")
+        ))
+
+    if len(snapshot.inline_results) >= INLINE_CACHE_SIZE:
+        snapshot.inline_results.clear()
+    snapshot.inline_results[cache_key] = results
+    return results
+
+@dp.inline_handler(state="*")
+async def inline_search_handler(query: types.InlineQuery):
+    """Поиск моделей в inline-режиме: @бот 3cx pro"""
+    await query.answer(inline_results(query.query), cache_time=Config.INLINE_CACHE_TIME)
+
+@dp.message_handler(lambda message: not message.is_command(), content_types=types.ContentType.TEXT)
+async def search_handler(message: types.Message):
+    """Произвольный текст: ищем подходящие модели"""
+    names = current_data().search.search(message.text, limit=Config.SEARCH_LIMIT)
+    if not names:
+        await message.answer(get_text(message.from_user.id, "unknown"), reply_markup=create_menu(message.from_user.id))
+        return
+    await message.answer(get_text(message.from_user.id, "search_results"), reply_markup=search_keyboard(names))
+
 # ==================== ОБРАБОТЧИК ОШИБОК ====================
 
 @dp.errors_handler()
 async def error_handler(update: types.Update, exception: Exception):
     """Глобальный обработчик ошибок"""
     logger.error(f"Ошибка при обработке запроса: {exception}", exc_info=True)
+    metrics.observe_error()
     
     if isinstance(update, types.Message):
         chat_id = update.chat.id
@@ -543,34 +1740,351 @@ async def error_handler(update: types.Update, exception: Exception):
 
 # ==================== ЗАПУСК БОТА ====================
 
+# Сколько обновлений запрашивать за один getUpdates при разборе очереди
+BACKLOG_BATCH_SIZE = 100
+# Сколько раз повторять getUpdates при ошибке во время разбора очереди
+BACKLOG_RETRIES = 3
+
+def is_stale(raw: Dict[str, Any], now: float) -> bool:
+    """Обновление старше BACKLOG_MAX_AGE: отвечать на него уже поздно"""
+    date = update_date(raw)
+    return Config.BACKLOG_MAX_AGE > 0 and date is not None and now - date > Config.BACKLOG_MAX_AGE
+
+async def drain_backlog(handle_batch: Callable[[List[Dict[str, Any]]], Awaitable[None]]) -> Tuple[Optional[int], Optional[str]]:
+    """
+    Забирает обновления, накопившиеся за время простоя (webhook должен быть снят),
+    пропускает устаревшие и передает остальные в handle_batch одной пачкой.
+
+    Обрабатываются только обновления, получение которых Telegram уже
+    подтвердил следующим запросом с offset (при ошибке запрос повторяется).
+    Если все попытки не удались, последняя пачка остается неподтвержденной и
+    придет повторно при обычном получении обновлений, поэтому ни одно
+    обновление не обрабатывается дважды.
+    Возвращает подтвержденный offset для следующего getUpdates и отчет
+    (None, если очередь пуста).
+    """
+    started = time.monotonic()
+    backlog: List[Dict[str, Any]] = []
+    unconfirmed: List[Dict[str, Any]] = []
+    offset = confirmed_offset = None
+    while True:
+        # Запрос с offset подтверждает получение предыдущей пачки
+        payload = {"timeout": 0, "limit": BACKLOG_BATCH_SIZE}
+        if offset is not None:
+            payload["offset"] = offset
+        updates = None
+        for attempt in range(1, BACKLOG_RETRIES + 1):
+            try:
+                updates = await bot.request("getUpdates", payload)
+                break
+            except (TelegramAPIError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.error(f"Ошибка получения накопившихся обновлений (попытка {attempt}/{BACKLOG_RETRIES}): {e}")
+                if attempt < BACKLOG_RETRIES:
+                    await asyncio.sleep(attempt)
+        if updates is None:
+            break
+        backlog.extend(unconfirmed)
+        confirmed_offset = offset
+        unconfirmed = updates or []
+        if not updates:
+            break
+        offset = updates[-1]["update_id"] + 1
+
+    if unconfirmed:
+        logger.warning(f"Получение {len(unconfirmed)} обновлений не подтверждено, они будут получены повторно")
+    if not backlog:
+        return confirmed_offset, None
+    now = time.time()
+    fresh = [raw for raw in backlog if not is_stale(raw, now)]
+    await handle_batch(fresh)
+    report = (
+        f"Накопилось обновлений: {len(backlog)}, устаревших пропущено: {len(backlog) - len(fresh)}, "
+        f"разобрано за {time.monotonic() - started:.1f} с"
+    )
+    logger.info(report)
+    return confirmed_offset, report
+
+async def process_update(dispatcher: Dispatcher, update: types.Update):
+    """
+    Обрабатывает одно обновление в отдельной задаче. Очередность внутри чата и
+    предел MAX_CONCURRENT_UPDATES обеспечивает ChatOrderMiddleware, поэтому
+    задачи достаточно создавать в порядке поступления обновлений.
+    """
+    Bot.set_current(dispatcher.bot)
+    Dispatcher.set_current(dispatcher)
+    try:
+        await dispatcher.process_updates([update])
+    except Exception as e:
+        logger.error(f"Ошибка обработки обновления {update.update_id}: {e}", exc_info=True)
+
+async def process_backlog(updates: List[Dict[str, Any]]):
+    """Обрабатывает накопившиеся обновления: чаты параллельно, каждый чат по порядку"""
+    tasks = [asyncio.ensure_future(process_update(dp, types.Update(**raw))) for raw in updates]
+    if tasks:
+        await asyncio.wait(tasks)
+
 async def on_startup(dp: Dispatcher):
     """Действия при запуске бота"""
-    await bot.delete_webhook(drop_pending_updates=True)
-    logger.info("Бот успешно запущен")
+    await start_services(dp)
+    drain = Config.BACKLOG_MODE == "drain"
+    backlog_report = None
+    if drain:
+        await bot.delete_webhook()
+        # start_polling начинает без offset: Telegram отдаст обновления, начиная с первого
+        # неподтвержденного, то есть ровно те, что drain_backlog не обработал
+        _, backlog_report = await drain_backlog(process_backlog)
+
+    if Config.BOT_MODE == "webhook":
+        await bot.set_webhook(
+            Config.WEBHOOK_HOST.rstrip("/") + Config.WEBHOOK_PATH,
+            max_connections=Config.WEBHOOK_MAX_CONNECTIONS,
+            drop_pending_updates=not drain,
+            secret_token=Config.WEBHOOK_SECRET or None
+        )
+    elif not drain:
+        await bot.delete_webhook(drop_pending_updates=True)
+    logger.info(f"Бот успешно запущен (режим: {Config.BOT_MODE})")
     
     # Уведомление админов
+    startup_text = "🟢 Бот успешно запущен"
+    if backlog_report:
+        startup_text += f"\n{backlog_report}"
     for admin_id in Config.ADMIN_IDS:
         try:
-            await bot.send_message(admin_id, "🟢 Бот успешно запущен")
+            await bot.send_message(admin_id, startup_text)
         except TelegramAPIError:
             pass
 
 async def on_shutdown(dp: Dispatcher):
     """Действия при выключении бота"""
     logger.info("Выключение бота...")
-    await bot.delete_webhook()
+    if Config.BOT_MODE == "polling":
+        await bot.delete_webhook()
+    await stop_services(dp)
+    logger.info("Бот успешно выключен")
+
+async def start_services(dp: Dispatcher):
+    """Запускает фоновые задачи процесса, который обрабатывает обновления"""
+    storage.start()
+    analytics.start()
+    asyncio.get_event_loop().run_in_executor(None, savings_module)
+    if Config.RELOAD_INTERVAL > 0:
+        asyncio.get_event_loop().create_task(watch_data_files())
+    if Config.METRICS_PORT:
+        dp["metrics_runner"] = await start_metrics_server(metrics, Config.METRICS_HOST, Config.METRICS_PORT)
+        logger.info(f"Метрики доступны на http://{Config.METRICS_HOST}:{Config.METRICS_PORT}/metrics")
+
+async def stop_services(dp: Dispatcher):
+    """Останавливает фоновые задачи и сохраняет состояния на диск"""
+    if dp.get("metrics_runner") is not None:
+        await dp["metrics_runner"].cleanup()
+    await analytics.close()
+    await photo_cache.close()
     await dp.storage.close()
     await dp.storage.wait_closed()
-    logger.info("Бот успешно выключен")
 
-if __name__ == "__main__":
+def create_webhook_app(dispatcher: Dispatcher) -> web.Application:
+    """
+    Создает aiohttp-приложение для приема обновлений через webhook.
+
+    Telegram сразу получает ответ 200, а обновление обрабатывается в фоне.
+    Одновременно обрабатывается не больше MAX_CONCURRENT_UPDATES обновлений
+    разных чатов, обновления одного чата ждут своей очереди, не занимая общих
+    слотов (ChatOrderMiddleware). Если в обработке больше WEBHOOK_MAX_PENDING
+    обновлений, бот отвечает 503 и Telegram повторяет доставку позже.
+    """
+    pending: Set[asyncio.Task] = set()
+
+    async def handle_update(request: web.Request) -> web.Response:
+        if Config.WEBHOOK_SECRET and \
+                request.headers.get("X-Telegram-Bot-Api-Secret-Token") != Config.WEBHOOK_SECRET:
+            return web.Response(status=403)
+        if len(pending) >= Config.WEBHOOK_MAX_PENDING:
+            return web.Response(status=503)
+        try:
+            update = types.Update(**await request.json())
+        except (ValueError, TypeError):
+            return web.Response(status=400)
+
+        task = asyncio.get_event_loop().create_task(process_update(dispatcher, update))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+        return web.Response(status=200)
+
+    async def app_startup(app: web.Application):
+        await on_startup(dispatcher)
+
+    async def app_shutdown(app: web.Application):
+        if pending:
+            await asyncio.wait(list(pending), timeout=10)
+        await on_shutdown(dispatcher)
+        session = await dispatcher.bot.get_session()
+        await session.close()
+
+    app = web.Application()
+    app.router.add_post(Config.WEBHOOK_PATH, handle_update)
+    app.on_startup.append(app_startup)
+    app.on_shutdown.append(app_shutdown)
+    app["pending_updates"] = pending
+    return app
+
+# ==================== НЕСКОЛЬКО ПРОЦЕССОВ ====================
+
+def run_worker(index: int, updates, heartbeat):
+    """Точка входа рабочего процесса: обрабатывает обновления своей доли чатов"""
+    # Сигналы остановки получает фронт-процесс, он же завершает рабочие процессы
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+    async def handle(raw: Dict[str, Any]):
+        await dp.process_updates([types.Update(**raw)])
+
+    async def serve():
+        Bot.set_current(bot)
+        Dispatcher.set_current(dp)
+        await start_services(dp)
+        logger.info(f"Рабочий процесс {index} готов")
+        try:
+            await run_worker_loop(updates, heartbeat, handle, Config.WEBHOOK_MAX_PENDING)
+        finally:
+            await stop_services(dp)
+            await close_bot_session()
+
+    asyncio.get_event_loop().run_until_complete(serve())
+
+def create_worker_pool() -> WorkerPool:
+    return WorkerPool(
+        run_worker,
+        Config.BOT_WORKERS,
+        queue_size=Config.WEBHOOK_MAX_PENDING,
+        heartbeat_timeout=Config.WORKER_HEARTBEAT_TIMEOUT
+    )
+
+async def close_bot_session():
+    session = await bot.get_session()
+    await session.close()
+
+async def notify_worker_restart(indexes: List[int]):
+    await notify_admins(f"⚠ Перезапущены рабочие процессы: {', '.join(map(str, indexes))}")
+
+async def dispatch_to_pool(pool: WorkerPool, updates: List[Dict[str, Any]]):
+    """Раскладывает обновления по рабочим процессам"""
+    for raw in updates:
+        # Очередь процесса переполнена — ждем, сохраняя порядок обновлений
+        while not pool.dispatch(raw):
+            await asyncio.sleep(0.05)
+
+async def drain_backlog_into_pool(pool: WorkerPool) -> Optional[int]:
+    """Передает рабочим процессам накопившиеся обновления; возвращает offset для getUpdates"""
+    await bot.delete_webhook()
+    offset, report = await drain_backlog(lambda updates: dispatch_to_pool(pool, updates))
+    if report:
+        await notify_admins(f"🟢 Бот запущен\n{report}")
+    return offset
+
+async def poll_into_pool(pool: WorkerPool):
+    """Фронт в режиме polling: получает обновления и раскладывает их по рабочим процессам"""
+    if Config.BACKLOG_MODE == "drain":
+        offset = await drain_backlog_into_pool(pool)
+    else:
+        await bot.delete_webhook(drop_pending_updates=True)
+        offset = None
+    supervisor = asyncio.get_event_loop().create_task(pool.supervise(notify_worker_restart))
+    logger.info(f"Бот успешно запущен (режим: polling, процессов: {len(pool.queues)})")
     try:
-        executor.start_polling(
-            dp,
-            skip_updates=True,
-            on_startup=on_startup,
-            on_shutdown=on_shutdown
+        while True:
+            payload = {"timeout": 20}
+            if offset is not None:
+                payload["offset"] = offset
+            try:
+                updates = await bot.request("getUpdates", payload)
+            except (TelegramAPIError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.error(f"Ошибка получения обновлений: {e}")
+                await asyncio.sleep(5)
+                continue
+            if updates:
+                offset = updates[-1]["update_id"] + 1
+                await dispatch_to_pool(pool, updates)
+    finally:
+        supervisor.cancel()
+
+def create_sharded_webhook_app(pool: WorkerPool) -> web.Application:
+    """Фронт в режиме webhook: принимает обновления и раскладывает их по рабочим процессам"""
+
+    async def handle_update(request: web.Request) -> web.Response:
+        if Config.WEBHOOK_SECRET and \
+                request.headers.get("X-Telegram-Bot-Api-Secret-Token") != Config.WEBHOOK_SECRET:
+            return web.Response(status=403)
+        try:
+            raw = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+        if not isinstance(raw, dict) or "update_id" not in raw:
+            return web.Response(status=400)
+        return web.Response(status=200 if pool.dispatch(raw) else 503)
+
+    async def app_startup(app: web.Application):
+        drain = Config.BACKLOG_MODE == "drain"
+        if drain:
+            await drain_backlog_into_pool(pool)
+        await bot.set_webhook(
+            Config.WEBHOOK_HOST.rstrip("/") + Config.WEBHOOK_PATH,
+            max_connections=Config.WEBHOOK_MAX_CONNECTIONS,
+            drop_pending_updates=not drain,
+            secret_token=Config.WEBHOOK_SECRET or None
         )
+        app["supervisor"] = asyncio.get_event_loop().create_task(pool.supervise(notify_worker_restart))
+        logger.info(f"Бот успешно запущен (режим: webhook, процессов: {len(pool.queues)})")
+
+    async def app_shutdown(app: web.Application):
+        app["supervisor"].cancel()
+        await asyncio.get_event_loop().run_in_executor(None, pool.stop)
+        await close_bot_session()
+
+    app = web.Application()
+    app.router.add_post(Config.WEBHOOK_PATH, handle_update)
+    app.on_startup.append(app_startup)
+    app.on_shutdown.append(app_shutdown)
+    return app
+
+def run_sharded():
+    """Запускает фронт-процесс и пул из BOT_WORKERS рабочих процессов"""
+    pool = create_worker_pool()
+    pool.start()
+    if Config.BOT_MODE == "webhook":
+        web.run_app(create_sharded_webhook_app(pool), host=Config.WEBAPP_HOST, port=Config.WEBAPP_PORT)
+        return
+
+    loop = asyncio.get_event_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, lambda: polling.cancel())
+    polling = loop.create_task(poll_into_pool(pool))
+    try:
+        loop.run_until_complete(polling)
+    except asyncio.CancelledError:
+        logger.info("Выключение бота...")
+    finally:
+        pool.stop()
+        loop.run_until_complete(close_bot_session())
+        logger.info("Бот успешно выключен")
+
+if __name__ == "__main__":
+    try:
+        if Config.BOT_WORKERS > 1:
+            run_sharded()
+        elif Config.BOT_MODE == "webhook":
+            web.run_app(
+                create_webhook_app(dp),
+                host=Config.WEBAPP_HOST,
+                port=Config.WEBAPP_PORT
+            )
+        else:
+            executor.start_polling(
+                dp,
+                skip_updates=Config.BACKLOG_MODE != "drain",
+                on_startup=on_startup,
+                on_shutdown=on_shutdown
+            )
     except Exception as e:
         logger.critical(f"Ошибка при запуске бота: {e}", exc_info=True)
         exit(1)
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+Метрики бота: задержки обработчиков, обновления, запросы к Telegram API.
+
+Значения копятся в памяти в счетчиках и гистограммах с фиксированными
+корзинами (запись — поиск корзины и пара инкрементов, без аллокаций) и
+отдаются в текстовом формате Prometheus.
+"""
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+# Границы корзин гистограмм задержек, секунды
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами в формате Prometheus"""
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Оценка квантиля по верхней границе корзины"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+        return float("inf")
+
+
+def _labels(**labels: str) -> str:
+    def escape(value: str) -> str:
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in labels.items()) + "}"
+
+
+class Metrics:
+    """Хранилище метрик бота"""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.handler_latency: Dict[str, Histogram] = {}
+        self.queue_wait = Histogram()
+        self.updates: Dict[Tuple[str, str], int] = {}
+        self.errors = 0
+        self.api_latency: Dict[str, Histogram] = {}
+        self.api_errors: Dict[Tuple[str, str], int] = {}
+        self.state_entries: Dict[str, int] = {}
+        self.completions: Dict[str, int] = {}
+        self.gauges: Dict[str, Callable[[], float]] = {}
+
+    # ---------- Запись ----------
+
+    def observe_update(self, update_type: str, route: str, handler: str, seconds: float, queued: float = 0.0):
+        """seconds — время обработки, queued — ожидание очереди чата до начала обработки"""
+        key = (update_type, route)
+        self.updates[key] = self.updates.get(key, 0) + 1
+        histogram = self.handler_latency.get(handler)
+        if histogram is None:
+            histogram = self.handler_latency[handler] = Histogram()
+        histogram.observe(seconds)
+        self.queue_wait.observe(queued)
+
+    def observe_api_call(self, method: str, seconds: float, error: Optional[BaseException] = None):
+        histogram = self.api_latency.get(method)
+        if histogram is None:
+            histogram = self.api_latency[method] = Histogram()
+        histogram.observe(seconds)
+        if error is not None:
+            key = (method, type(error).__name__)
+            self.api_errors[key] = self.api_errors.get(key, 0) + 1
+
+    def observe_state_change(self, old_state: Optional[str], new_state: Optional[str]):
+        if new_state is not None and new_state != old_state:
+            self.state_entries[new_state] = self.state_entries.get(new_state, 0) + 1
+
+    def observe_completion(self, flow: str):
+        self.completions[flow] = self.completions.get(flow, 0) + 1
+
+    def observe_error(self):
+        self.errors += 1
+
+    def register_gauge(self, name: str, getter: Callable[[], float]):
+        self.gauges[name] = getter
+
+    # ---------- Выгрузка ----------
+
+    def render_prometheus(self) -> str:
+        """Возвращает все метрики в текстовом формате Prometheus"""
+        lines: List[str] = [
+            "# TYPE bot_uptime_seconds gauge",
+            f"bot_uptime_seconds {time.time() - self.started_at:.0f}",
+            "# TYPE bot_updates_total counter",
+        ]
+        for (update_type, route), count in self.updates.items():
+            lines.append(f"bot_updates_total{_labels(type=update_type, route=route)} {count}")
+        lines += ["# TYPE bot_errors_total counter", f"bot_errors_total {self.errors}"]
+        lines += self._render_histograms("bot_handler_latency_seconds", "handler", self.handler_latency)
+        lines += self._render_histograms("bot_update_queue_seconds", "queue", {"chat": self.queue_wait})
+        lines += self._render_histograms("bot_api_latency_seconds", "method", self.api_latency)
+        lines.append("# TYPE bot_api_errors_total counter")
+        for (method, error), count in self.api_errors.items():
+            lines.append(f"bot_api_errors_total{_labels(method=method, error=error)} {count}")
+        lines.append("# TYPE bot_fsm_state_entries_total counter")
+        for state, count in self.state_entries.items():
+            lines.append(f"bot_fsm_state_entries_total{_labels(state=state)} {count}")
+        lines.append("# TYPE bot_flow_completions_total counter")
+        for flow, count in self.completions.items():
+            lines.append(f"bot_flow_completions_total{_labels(flow=flow)} {count}")
+        for name, getter in self.gauges.items():
+            lines += [f"# TYPE {name} gauge", f"{name} {getter()}"]
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _render_histograms(name: str, label: str, histograms: Dict[str, Histogram]) -> List[str]:
+        lines = [f"# TYPE {name} histogram"]
+        for key, histogram in histograms.items():
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(**{label: key, 'le': repr(bound)})} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(**{label: key, 'le': '+Inf'})} {histogram.count}")
+            lines.append(f"{name}_sum{_labels(**{label: key})} {histogram.sum}")
+            lines.append(f"{name}_count{_labels(**{label: key})} {histogram.count}")
+        return lines
+
+
+async def start_metrics_server(metrics: Metrics, host: str, port: int) -> web.AppRunner:
+    """Запускает HTTP-сервер, отдающий метрики по адресу /metrics"""
+
+    async def handle_metrics(request: web.Request) -> web.Response:
+        return web.Response(text=metrics.render_prometheus(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+Планировщик исходящих запросов к Telegram Bot API.
+
+Все запросы, адресованные конкретному чату (send*, edit*, delete* и т.д.),
+проходят через общую очередь с двумя ограничителями «token bucket»:
+глобальным (~30 сообщений в секунду на бота) и для каждого чата. Запросы
+в один чат выполняются строго по очереди, при ответе 429 (RetryAfter)
+запрос автоматически повторяется после указанной паузы.
+
+ScheduledBot также настраивает пул соединений aiohttp (лимиты, keep-alive,
+кэш DNS) и считает новые и повторно использованные соединения.
+"""
+import asyncio
+import logging
+import time
+from types import SimpleNamespace
+from typing import Any, Awaitable, Callable, Dict, Optional, Union
+
+import aiohttp
+from aiogram import Bot
+from aiogram.utils import json
+from aiogram.utils.exceptions import RetryAfter
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Ограничитель скорости: rate токенов в секунду, не больше capacity подряд"""
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def reserve(self) -> float:
+        """Забирает токен и возвращает, сколько секунд нужно подождать до его появления"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    async def acquire(self):
+        delay = self.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+
+class _ChatQueue:
+    """Очередь запросов одного чата"""
+    __slots__ = ("lock", "bucket", "last_used")
+
+    def __init__(self, rate: float, capacity: float):
+        self.lock = asyncio.Lock()
+        self.bucket = TokenBucket(rate, capacity)
+        self.last_used = time.monotonic()
+
+
+class SendScheduler:
+    """
+    Центральная очередь исходящих запросов.
+
+    :param global_rate: допустимое число запросов в секунду для всего бота
+    :param chat_rate: допустимое число запросов в секунду в один чат
+    :param chat_burst: сколько запросов в один чат можно отправить подряд без паузы
+    :param max_retries: сколько раз повторять запрос после RetryAfter
+    :param idle_ttl: через сколько секунд простоя очередь чата удаляется
+    """
+
+    def __init__(self, global_rate: float = 30.0, chat_rate: float = 1.0, chat_burst: float = 5.0,
+                 max_retries: int = 3, idle_ttl: float = 60.0):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.idle_ttl = idle_ttl
+        self._chats: Dict[Union[int, str], _ChatQueue] = {}
+        self._next_cleanup = time.monotonic() + idle_ttl
+
+    async def submit(self, chat_id: Union[int, str], call: Callable[[], Awaitable[Any]]) -> Any:
+        """Выполняет запрос в порядке очереди чата с учетом ограничений скорости"""
+        queue = self._chats.get(chat_id)
+        if queue is None:
+            queue = self._chats[chat_id] = _ChatQueue(self.chat_rate, self.chat_burst)
+            self._cleanup()
+
+        async with queue.lock:
+            attempt = 0
+            while True:
+                await queue.bucket.acquire()
+                await self.global_bucket.acquire()
+                try:
+                    result = await call()
+                except RetryAfter as e:
+                    attempt += 1
+                    if attempt > self.max_retries:
+                        raise
+                    logger.warning(f"Flood control для чата {chat_id}: повтор через {e.timeout} с "
+                                   f"(попытка {attempt}/{self.max_retries})")
+                    await asyncio.sleep(e.timeout)
+                    continue
+                finally:
+                    queue.last_used = time.monotonic()
+                return result
+
+    def _cleanup(self):
+        now = time.monotonic()
+        if now < self._next_cleanup:
+            return
+        self._next_cleanup = now + self.idle_ttl
+        deadline = now - self.idle_ttl
+        idle = [chat_id for chat_id, queue in self._chats.items()
+                if not queue.lock.locked() and queue.last_used < deadline]
+        for chat_id in idle:
+            del self._chats[chat_id]
+
+    @property
+    def active_chats(self) -> int:
+        return len(self._chats)
+
+
+class ScheduledBot(Bot):
+    """
+    Bot, отправляющий все запросы к конкретному чату через SendScheduler.
+
+    :param connector_options: дополнительные параметры aiohttp.TCPConnector
+        (limit_per_host, keepalive_timeout, ttl_dns_cache и т.д.)
+    """
+
+    def __init__(self, *args, scheduler: Optional[SendScheduler] = None,
+                 connector_options: Optional[Dict[str, Any]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.scheduler = scheduler or SendScheduler()
+        self._connector_init.update(connector_options or {})
+        # Вызывается после каждого запроса: on_api_call(метод, секунды, ошибка или None)
+        self.on_api_call: Optional[Callable[[str, float, Optional[BaseException]], None]] = None
+        self.connections_created = 0
+        self.connections_reused = 0
+        self.connect_seconds = 0.0
+
+    async def get_new_session(self) -> aiohttp.ClientSession:
+        trace = aiohttp.TraceConfig()
+        trace.on_connection_create_start.append(self._on_connection_create_start)
+        trace.on_connection_create_end.append(self._on_connection_create_end)
+        trace.on_connection_reuseconn.append(self._on_connection_reused)
+        return aiohttp.ClientSession(
+            connector=self._connector_class(**self._connector_init),
+            json_serialize=json.dumps,
+            trace_configs=[trace]
+        )
+
+    async def _on_connection_create_start(self, session: aiohttp.ClientSession, context: SimpleNamespace, params):
+        context.connect_started = time.perf_counter()
+
+    async def _on_connection_create_end(self, session: aiohttp.ClientSession, context: SimpleNamespace, params):
+        # Время установки соединения включает DNS и TLS
+        self.connections_created += 1
+        self.connect_seconds += time.perf_counter() - context.connect_started
+
+    async def _on_connection_reused(self, session: aiohttp.ClientSession, context: SimpleNamespace, params):
+        self.connections_reused += 1
+
+    async def request(self, method: str, data: Optional[Dict] = None, files: Optional[Dict] = None, **kwargs):
+        chat_id = data.get("chat_id") if data else None
+        if chat_id is None:
+            return await self._timed_request(method, data, files, **kwargs)
+        return await self.scheduler.submit(chat_id, lambda: self._timed_request(method, data, files, **kwargs))
+
+    async def _timed_request(self, method: str, data: Optional[Dict], files: Optional[Dict], **kwargs):
+        if self.on_api_call is None:
+            return await self.perform_request(method, data, files, **kwargs)
+        started = time.perf_counter()
+        try:
+            result = await self.perform_request(method, data, files, **kwargs)
+        except Exception as e:
+            self.on_api_call(method, time.perf_counter() - started, e)
+            raise
+        self.on_api_call(method, time.perf_counter() - started, None)
+        return result
+
+    async def perform_request(self, method: str, data: Optional[Dict] = None, files: Optional[Dict] = None,
+                              **kwargs):
+        """Непосредственно выполняет HTTP-запрос к Bot API"""
+        return await super().request(method, data, files, **kwargs)
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Расчет экономии от покупки техники вместо аренды.
+
+Формулы работают с массивами NumPy, поэтому одним вызовом считается как
+один сценарий калькулятора, так и целая сетка сценариев (например,
+цена топлива × стоимость аренды или все модели каталога сразу).
+"""
+from typing import Dict, Sequence
+
+import numpy as np
+
+
+def calculate_savings(fuel_per_day, fuel_price, days_per_month, months_total, rent_per_month,
+                      operator_salary, service_cost, price=0) -> Dict[str, np.ndarray]:
+    """
+    Считает экономию для всех сочетаний входных значений (по правилам broadcasting NumPy).
+
+    Возвращает массивы fuel_total, own_cost, rent_total, saving и payback
+    (срок окупаемости в месяцах; 0, если выгоды нет или цена неизвестна).
+    """
+    fuel_per_day = np.asarray(fuel_per_day, dtype=np.float64)
+    fuel_price = np.asarray(fuel_price, dtype=np.float64)
+    days = np.asarray(days_per_month, dtype=np.float64)
+    months = np.asarray(months_total, dtype=np.float64)
+    rent = np.asarray(rent_per_month, dtype=np.float64)
+    salary = np.asarray(operator_salary, dtype=np.float64)
+    service = np.asarray(service_cost, dtype=np.float64)
+    price = np.asarray(price, dtype=np.float64)
+
+    fuel_total = fuel_per_day * fuel_price * days * months
+    own_cost = salary * months + fuel_total + service
+    rent_total = rent * months
+    saving = rent_total - own_cost
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        payback = np.where((saving > 0) & (price > 0), np.round(price / (saving / months), 1), 0.0)
+
+    return {
+        "fuel_total": fuel_total,
+        "own_cost": own_cost,
+        "rent_total": rent_total,
+        "saving": saving,
+        "payback": payback,
+    }
+
+
+def break_even(fuel_per_day: float, fuel_price: float, days_per_month: float, months_total: float,
+               rent_per_month: float, operator_salary: float, service_cost: float) -> Dict[str, float]:
+    """
+    Точки безубыточности сценария: аренда в месяц и цена топлива, при которых экономия равна нулю.
+
+    Обе точки выводятся из calculate_savings: экономия линейно зависит от цены
+    топлива, поэтому достаточно посчитать ее при цене 0 и 1. Если цена топлива
+    не влияет на расходы (нулевой расход), fuel_price равна nan.
+    """
+    scenario = {
+        "fuel_per_day": fuel_per_day,
+        "days_per_month": days_per_month,
+        "months_total": months_total,
+        "rent_per_month": rent_per_month,
+        "operator_salary": operator_salary,
+        "service_cost": service_cost,
+    }
+    own_cost = calculate_savings(fuel_price=fuel_price, **scenario)["own_cost"]
+    saving_at_zero, saving_at_one = calculate_savings(fuel_price=np.array([0.0, 1.0]), **scenario)["saving"]
+    saving_per_unit = saving_at_zero - saving_at_one
+    return {
+        "rent_per_month": float(own_cost / months_total),
+        "fuel_price": float(saving_at_zero / saving_per_unit) if saving_per_unit else float("nan"),
+    }
+
+
+def sensitivity_table(scenario: Dict[str, float], fuel_factors: Sequence[float],
+                      rent_factors: Sequence[float]) -> np.ndarray:
+    """
+    Экономия при изменении цены топлива (строки) и аренды (столбцы) в заданное число раз.
+
+    scenario содержит аргументы calculate_savings.
+    """
+    grid = dict(scenario)
+    grid["fuel_price"] = scenario["fuel_price"] * np.asarray(fuel_factors, dtype=np.float64)[:, None]
+    grid["rent_per_month"] = scenario["rent_per_month"] * np.asarray(rent_factors, dtype=np.float64)[None, :]
+    return calculate_savings(**grid)["saving"]
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+Нечеткий поиск по каталогу.
+
+Тексты разбиваются на слова, слова — на триграммы (тройки символов с
+пробелами по краям), и для каждой триграммы хранится список документов.
+Запрос разбирается так же; документы ранжируются по доле совпавших
+триграмм с весом редкости (IDF), поэтому «3cx pro» находит «JCB 3CX PRO»,
+а опечатки и пропущенные пробелы («3cxpro», «js 220») не мешают.
+
+В больших каталогах баллы считаются массивами NumPy — по одной векторной
+операции на триграмму запроса вместо обхода списков документов в Python;
+в маленьких накладные расходы NumPy больше выигрыша. NumPy импортируется
+при первом поиске по большому каталогу, а не при построении индекса.
+"""
+import heapq
+import math
+import re
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+# Кириллические буквы, которые пишут вместо похожих латинских (и наоборот)
+_LOOKALIKES = str.maketrans("асеорхкмтвн", "aceopxkmtbh")
+_WORD = re.compile(r"[^\W_]+")
+_PARTS = re.compile(r"\d+|[^\W\d_]+")
+
+# Сколько разных запросов кэшировать в одном индексе
+SEARCH_CACHE_SIZE = 4096
+# С какого числа документов баллы считаются массивами NumPy (в меньших индексах обход в Python быстрее)
+VECTORIZE_MIN_DOCUMENTS = 300
+
+
+def normalize(text: str) -> str:
+    return text.lower().replace("ё", "е").translate(_LOOKALIKES)
+
+
+def tokens(text: str) -> List[str]:
+    """Слова текста; слова из букв и цифр дополнительно делятся на части: js220 → js220, js, 220"""
+    result = []
+    for word in _WORD.findall(normalize(text)):
+        result.append(word)
+        parts = _PARTS.findall(word)
+        if len(parts) > 1:
+            result.extend(parts)
+    return result
+
+
+def trigrams(text: str) -> Set[str]:
+    grams = set()
+    for word in tokens(text):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class SearchIndex:
+    """
+    Индекс нечеткого поиска по триграммам.
+
+    :param documents: пары (ключ документа, [(текст поля, вес поля), ...]);
+        вес поля — от 0 до 1, например название 1.0, характеристики 0.3
+    """
+
+    def __init__(self, documents: Sequence[Tuple[str, Sequence[Tuple[str, float]]]]):
+        self.keys: Tuple[str, ...] = tuple(key for key, _ in documents)
+        postings: Dict[str, Dict[int, float]] = {}
+        for doc_id, (_, fields) in enumerate(documents):
+            for text, weight in fields:
+                for gram in trigrams(text):
+                    docs = postings.setdefault(gram, {})
+                    if docs.get(doc_id, 0.0) < weight:
+                        docs[doc_id] = weight
+
+        # Редкие триграммы весят больше: «jcb» есть во всех названиях и почти ничего не различает
+        count = len(self.keys)
+        self._missing_idf = math.log(1 + count)
+        self._idf = {gram: math.log(1 + count / len(docs)) for gram, docs in postings.items()}
+        self._postings = postings
+        # Списки документов в виде массивов (номера, веса), строятся при первом поиске по большому индексу
+        self._vectors: Optional[Dict[str, Tuple[Any, Any]]] = None
+        self._cache: Dict[Tuple[str, int], Tuple[str, ...]] = {}
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def search(self, query: str, limit: int = 5, min_score: float = 0.35) -> Tuple[str, ...]:
+        """Возвращает ключи документов, лучше всего подходящих под запрос"""
+        cache_key = (" ".join(_WORD.findall(normalize(query))), limit)
+        result = self._cache.get(cache_key)
+        if result is not None:
+            return result
+
+        # Баллы складываются от редких триграмм к частым
+        weighted = sorted(((self._idf.get(gram, self._missing_idf), gram) for gram in trigrams(query)), reverse=True)
+        if len(self.keys) >= VECTORIZE_MIN_DOCUMENTS:
+            ranked = self._rank_vectorized(weighted, limit, min_score)
+        else:
+            ranked = self._rank(weighted, limit, min_score)
+        result = tuple(self.keys[doc_id] for doc_id in ranked)
+
+        if len(self._cache) >= SEARCH_CACHE_SIZE:
+            self._cache.clear()
+        self._cache[cache_key] = result
+        return result
+
+    def _rank(self, weighted: List[Tuple[float, str]], limit: int, min_score: float) -> List[int]:
+        # Когда оставшиеся триграммы уже не могут дотянуть новый документ до порога,
+        # частые триграммы («jcb») только добавляют баллы найденным кандидатам
+        remaining = sum(idf for idf, _ in weighted)
+        threshold = min_score * remaining
+        scores: Dict[int, float] = {}
+        for idf, gram in weighted:
+            postings = self._postings.get(gram)
+            if postings is not None:
+                if remaining >= threshold:
+                    for doc_id, weight in postings.items():
+                        scores[doc_id] = scores.get(doc_id, 0.0) + idf * weight
+                elif len(scores) < len(postings):
+                    for doc_id in scores:
+                        weight = postings.get(doc_id)
+                        if weight:
+                            scores[doc_id] += idf * weight
+                else:
+                    for doc_id, weight in postings.items():
+                        if doc_id in scores:
+                            scores[doc_id] += idf * weight
+            remaining -= idf
+
+        return heapq.nsmallest(
+            limit,
+            (doc_id for doc_id, score in scores.items() if score >= threshold),
+            key=lambda doc_id: (-scores[doc_id], doc_id)
+        )
+
+    def _rank_vectorized(self, weighted: List[Tuple[float, str]], limit: int, min_score: float) -> List[int]:
+        # Те же баллы, что в _rank, но сразу для всех документов: по одной операции на триграмму
+        import numpy as np
+        if self._vectors is None:
+            self._vectors = {
+                gram: (np.fromiter(docs.keys(), np.intp, len(docs)), np.fromiter(docs.values(), np.float64, len(docs)))
+                for gram, docs in self._postings.items()
+            }
+        threshold = min_score * sum(idf for idf, _ in weighted)
+        scores = np.zeros(len(self.keys))
+        for idf, gram in weighted:
+            vector = self._vectors.get(gram)
+            if vector is not None:
+                doc_ids, weights = vector
+                scores[doc_ids] += idf * weights
+
+        found = np.flatnonzero(scores >= threshold)
+        if len(found) > limit:
+            # Без полной сортировки: оставляем документы с баллом не ниже limit-го
+            cutoff = np.partition(scores[found], len(found) - limit)[len(found) - limit]
+            found = found[scores[found] >= cutoff]
+        return found[np.lexsort((found, -scores[found]))][:limit].tolist()
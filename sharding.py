@@ -0,0 +1,341 @@
+# -*- coding: utf-8 -*-
+"""
+Горизонтальное масштабирование на несколько процессов.
+
+Фронт-процесс получает обновления (polling или webhook) и раскладывает их
+по очередям рабочих процессов по chat_id, поэтому весь сценарий FSM одного
+чата всегда обрабатывает один и тот же процесс, а разные чаты — параллельно
+на разных ядрах. Внутри процесса обновления одного чата обрабатываются
+строго по порядку, разных чатов — одновременно.
+
+Рабочие процессы раз в секунду отмечаются в общей памяти; упавший или
+переставший отмечаться процесс перезапускается. Обновления, которые он
+успел взять из очереди, теряются, оставшиеся в очереди передаются новому
+процессу.
+
+Порядок обновлений одного чата и общий предел одновременной обработки
+внутри процесса при любом способе получения (polling, webhook, очередь
+рабочего процесса, разбор накопившихся обновлений) обеспечивает
+ChatSerializer.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue as queue_module
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Sequence, Set
+
+logger = logging.getLogger(__name__)
+
+# Рабочие процессы запускаются «с нуля», без копирования состояния фронта (соединений, цикла событий)
+_context = multiprocessing.get_context("spawn")
+
+# Переменная окружения с номером рабочего процесса, задается перед его запуском
+WORKER_INDEX_ENV = "BOT_WORKER_INDEX"
+
+
+def update_chat_id(update: Dict[str, Any]) -> int:
+    """Находит чат обновления, а для обновлений без чата (inline-запросы) — пользователя"""
+    for key, payload in update.items():
+        if key == "update_id" or not isinstance(payload, dict):
+            continue
+        chat = payload.get("chat") or (payload.get("message") or {}).get("chat")
+        if chat:
+            return chat["id"]
+        sender = payload.get("from")
+        if sender:
+            return sender["id"]
+    return 0
+
+
+def update_date(update: Dict[str, Any]) -> Optional[int]:
+    """Время отправки сообщения или его правки (unix time); у нажатий кнопок и inline-запросов его нет"""
+    for key, payload in update.items():
+        if key != "update_id" and isinstance(payload, dict):
+            return payload.get("edit_date") or payload.get("date")
+    return None
+
+
+def shard_of(update: Dict[str, Any], shards: int) -> int:
+    """Номер рабочего процесса для обновления"""
+    return update_chat_id(update) % shards
+
+
+class WorkerPool:
+    """
+    Пул рабочих процессов с отдельной очередью обновлений у каждого.
+
+    :param target: функция рабочего процесса target(index, queue, heartbeat, *args)
+    :param workers: число процессов
+    :param queue_size: предел очереди одного процесса
+    :param heartbeat_timeout: через сколько секунд без отметки процесс считается зависшим
+    :param check_interval: период проверки процессов, секунды
+    :param args: дополнительные аргументы target
+    """
+
+    def __init__(self, target: Callable[..., None], workers: int, queue_size: int = 1000,
+                 heartbeat_timeout: float = 30.0, check_interval: float = 5.0, args: Sequence[Any] = ()):
+        self.target = target
+        self.args = tuple(args)
+        self.queue_size = queue_size
+        self.heartbeat_timeout = heartbeat_timeout
+        self.check_interval = check_interval
+        self.queues = [_context.Queue(queue_size) for _ in range(workers)]
+        self.heartbeats = [_context.Value("d", 0.0, lock=False) for _ in range(workers)]
+        self.processes: List[Optional[multiprocessing.process.BaseProcess]] = [None] * workers
+        self._started_at = [0.0] * workers
+        # Номера процессов, которым отправлен SIGKILL: перезапускаются, когда процесс завершится
+        self._killed: set = set()
+        self.restarts = 0
+
+    def start(self):
+        for index in range(len(self.queues)):
+            self._spawn(index)
+
+    def _spawn(self, index: int):
+        self.heartbeats[index].value = 0.0
+        process = _context.Process(
+            target=self.target,
+            args=(index, self.queues[index], self.heartbeats[index]) + self.args,
+            name=f"bot-worker-{index}",
+            daemon=True
+        )
+        # Дочерний процесс наследует окружение на момент запуска
+        previous = os.environ.get(WORKER_INDEX_ENV)
+        os.environ[WORKER_INDEX_ENV] = str(index)
+        try:
+            process.start()
+        finally:
+            if previous is None:
+                del os.environ[WORKER_INDEX_ENV]
+            else:
+                os.environ[WORKER_INDEX_ENV] = previous
+        self.processes[index] = process
+        self._started_at[index] = time.time()
+        logger.info(f"Запущен рабочий процесс {index} (pid {process.pid})")
+
+    @property
+    def ready(self) -> bool:
+        """Все процессы запустились и отметились хотя бы раз"""
+        return all(heartbeat.value > 0 for heartbeat in self.heartbeats)
+
+    def dispatch(self, update: Dict[str, Any]) -> bool:
+        """Кладет обновление в очередь его процесса; False — очередь переполнена"""
+        try:
+            self.queues[shard_of(update, len(self.queues))].put_nowait(update)
+        except queue_module.Full:
+            return False
+        return True
+
+    def check(self) -> List[int]:
+        """
+        Перезапускает упавшие процессы и останавливает зависшие, возвращает номера
+        перезапущенных. Не ждет завершения: зависший процесс получает SIGKILL и
+        перезапускается одной из следующих проверок, когда завершится.
+        """
+        now = time.time()
+        restarted = []
+        for index, process in enumerate(self.processes):
+            if process.is_alive():
+                # До первой отметки отсчитываем время от запуска процесса
+                last_seen = self.heartbeats[index].value or self._started_at[index]
+                if index not in self._killed and now - last_seen >= self.heartbeat_timeout:
+                    logger.error(f"Рабочий процесс {index} не отвечает {now - last_seen:.0f} с, остановка")
+                    process.kill()
+                    self._killed.add(index)
+                continue
+            if index in self._killed:
+                self._killed.discard(index)
+                logger.error(f"Зависший рабочий процесс {index} остановлен, перезапуск")
+            else:
+                logger.error(f"Рабочий процесс {index} завершился с кодом {process.exitcode}, перезапуск")
+            self._replace_queue(index)
+            self._spawn(index)
+            self.restarts += 1
+            restarted.append(index)
+        return restarted
+
+    def _replace_queue(self, index: int):
+        # Остановленный процесс мог оставить захваченной блокировку чтения очереди,
+        # поэтому новый процесс получает новую очередь с непрочитанными обновлениями старой
+        old, new = self.queues[index], _context.Queue(self.queue_size)
+        moved = 0
+        while True:
+            try:
+                new.put_nowait(old.get_nowait())
+            except (queue_module.Empty, queue_module.Full):
+                break
+            moved += 1
+        try:
+            lost = old.qsize()
+        except NotImplementedError:
+            lost = 0
+        if lost:
+            logger.error(f"Из очереди процесса {index} не удалось забрать обновлений: {lost}")
+        old.close()
+        self.queues[index] = new
+        if moved:
+            logger.info(f"Новому процессу {index} передано обновлений: {moved}")
+
+    async def supervise(self, on_restart: Optional[Callable[[List[int]], Awaitable[None]]] = None):
+        """Периодически проверяет процессы, пока задачу не отменят"""
+        while True:
+            # Остановленный процесс завершается за миллисекунды, его перезапуск не ждет полного периода
+            await asyncio.sleep(0.1 if self._killed else self.check_interval)
+            restarted = self.check()
+            if restarted and on_restart is not None:
+                await on_restart(restarted)
+
+    def stop(self, timeout: float = 10.0):
+        """Просит процессы дообработать очереди и завершиться"""
+        for update_queue in self.queues:
+            try:
+                update_queue.put(None, timeout=timeout)
+            except queue_module.Full:
+                pass
+        deadline = time.time() + timeout
+        for index, process in enumerate(self.processes):
+            if process is None:
+                continue
+            process.join(max(0.0, deadline - time.time()))
+            if process.is_alive():
+                logger.warning(f"Рабочий процесс {index} не завершился за {timeout:.0f} с, остановка")
+                process.kill()
+                process.join()
+
+
+def _get_batch(update_queue: multiprocessing.Queue, limit: int) -> List[Optional[Dict[str, Any]]]:
+    # Ждем первое обновление, остальные забираем без ожидания — меньше переходов между потоками
+    batch = [update_queue.get()]
+    while len(batch) < limit and batch[-1] is not None:
+        try:
+            batch.append(update_queue.get_nowait())
+        except queue_module.Empty:
+            break
+    return batch
+
+
+async def run_worker_loop(update_queue: multiprocessing.Queue, heartbeat, handle: Callable[[Dict[str, Any]], Awaitable[Any]],
+                          max_pending: int = 1000, heartbeat_interval: float = 1.0):
+    """
+    Цикл рабочего процесса: берет обновления из очереди и передает их в handle.
+
+    Каждое обновление обрабатывается в отдельной задаче; задачи создаются в
+    порядке очереди, а очередность внутри чата и число одновременно
+    обрабатываемых обновлений обеспечивает handle (ChatSerializer в
+    диспетчере). Пока в обработке max_pending обновлений, новые из очереди не
+    забираются, и фронт-процесс ждет. Цикл завершается, получив None,
+    или если завершился фронт-процесс.
+    """
+    loop = asyncio.get_event_loop()
+    pending_slots = asyncio.Semaphore(max_pending)
+    pending: Set[asyncio.Task] = set()
+    parent = multiprocessing.parent_process()
+
+    async def beat():
+        while True:
+            heartbeat.value = time.time()
+            if parent is not None and not parent.is_alive():
+                logger.error("Фронт-процесс завершился, рабочий процесс останавливается")
+                update_queue.put(None)
+                return
+            await asyncio.sleep(heartbeat_interval)
+
+    async def process(update: Dict[str, Any]):
+        try:
+            await handle(update)
+        except Exception as e:
+            logger.error(f"Ошибка обработки обновления {update.get('update_id')}: {e}", exc_info=True)
+        finally:
+            pending_slots.release()
+
+    beat_task = loop.create_task(beat())
+    try:
+        running = True
+        while running:
+            batch = await loop.run_in_executor(None, _get_batch, update_queue, max_pending)
+            for update in batch:
+                if update is None:
+                    running = False
+                    break
+                await pending_slots.acquire()
+                task = loop.create_task(process(update))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+        if pending:
+            await asyncio.wait(list(pending))
+    finally:
+        beat_task.cancel()
+
+
+class _ChatTurn:
+    """Очередь одного чата: занят ли чат и кто ждет своей очереди"""
+    __slots__ = ("busy", "waiters")
+
+    def __init__(self):
+        self.busy = False
+        self.waiters: Deque[asyncio.Future] = deque()
+
+
+class ChatSerializer:
+    """
+    Очередность обработки обновлений внутри процесса.
+
+    Обновления одного чата выполняются по одному в порядке вызова acquire,
+    разных чатов — параллельно, но не больше max_concurrency одновременно
+    (0 — без ограничения). Очередь чата удаляется, как только в ней никого
+    не остается, поэтому память занимают только активные чаты.
+    """
+
+    def __init__(self, max_concurrency: int = 64):
+        self._slots = asyncio.Semaphore(max_concurrency) if max_concurrency > 0 else None
+        self._chats: Dict[int, _ChatTurn] = {}
+
+    @property
+    def active_chats(self) -> int:
+        return len(self._chats)
+
+    async def acquire(self, chat_id: int):
+        """Ждет очереди чата, затем общего слота"""
+        turn = self._chats.get(chat_id)
+        if turn is None:
+            turn = self._chats[chat_id] = _ChatTurn()
+        if turn.busy:
+            waiter = asyncio.get_event_loop().create_future()
+            turn.waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    # Очередь уже передана этому обновлению — передаем ее дальше
+                    self._pass_turn(chat_id, turn)
+                else:
+                    turn.waiters.remove(waiter)
+                raise
+        turn.busy = True
+
+        if self._slots is not None:
+            try:
+                await self._slots.acquire()
+            except asyncio.CancelledError:
+                self._pass_turn(chat_id, turn)
+                raise
+
+    def release(self, chat_id: int):
+        """Освобождает общий слот и передает очередь чата следующему обновлению"""
+        if self._slots is not None:
+            self._slots.release()
+        turn = self._chats.get(chat_id)
+        if turn is not None:
+            self._pass_turn(chat_id, turn)
+
+    def _pass_turn(self, chat_id: int, turn: _ChatTurn):
+        while turn.waiters:
+            waiter = turn.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        turn.busy = False
+        del self._chats[chat_id]
@@ -0,0 +1,480 @@
+# -*- coding: utf-8 -*-
+"""
+Хранилище данных пользователей и состояний FSM.
+
+Двухуровневое хранилище: ограниченный LRU/TTL-кэш в памяти процесса и
+SQLite-файл на диске. Изменения копятся в памяти и записываются на диск
+пачками в фоне, поэтому обработчики не ждут диска, а прогресс калькулятора
+переживает перезапуск.
+
+UnitOfWorkStorage поверх любого хранилища FSM читает состояние один раз за
+обновление, копит все изменения обработчика и записывает их одной операцией
+после обработки обновления.
+"""
+import asyncio
+import copy
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from aiogram.dispatcher.storage import BaseStorage
+
+logger = logging.getLogger(__name__)
+
+Key = Tuple[int, int]
+
+# Сколько ждать, пока файл занят записью другого процесса или Analytics (busy_timeout), секунды
+BUSY_TIMEOUT = 30.0
+
+
+class UserData:
+    """Компактная запись пользователя: язык, выбор для сравнения и состояние FSM"""
+    __slots__ = ("language", "compare_selection", "state", "data", "bucket", "touched")
+
+    def __init__(self, language: str = 'ru', compare_selection: Optional[List[str]] = None,
+                 state: Optional[str] = None, data: Optional[Dict[str, Any]] = None,
+                 bucket: Optional[Dict[str, Any]] = None):
+        self.language = language
+        self.compare_selection: List[str] = compare_selection or []
+        self.state = state
+        self.data: Dict[str, Any] = data or {}
+        self.bucket: Dict[str, Any] = bucket or {}
+        self.touched = 0.0
+
+
+class UserStateStorage(BaseStorage):
+    """
+    Хранилище UserData и состояний FSM под одним ключом (chat_id, user_id).
+
+    :param path: путь к файлу SQLite
+    :param capacity: максимальное число записей в памяти
+    :param ttl: время жизни неиспользуемой записи в памяти, секунды
+    :param flush_interval: период фоновой записи изменений на диск, секунды
+    """
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS users ("
+        " chat INTEGER NOT NULL,"
+        " user INTEGER NOT NULL,"
+        " language TEXT NOT NULL,"
+        " compare_selection TEXT NOT NULL,"
+        " state TEXT,"
+        " data TEXT NOT NULL,"
+        " bucket TEXT NOT NULL,"
+        " updated REAL NOT NULL,"
+        " PRIMARY KEY (chat, user))"
+    )
+    UPSERT = (
+        "INSERT INTO users (chat, user, language, compare_selection, state, data, bucket, updated)"
+        " VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+        " ON CONFLICT (chat, user) DO UPDATE SET"
+        " language = excluded.language, compare_selection = excluded.compare_selection,"
+        " state = excluded.state, data = excluded.data, bucket = excluded.bucket,"
+        " updated = excluded.updated"
+    )
+    SELECT = (
+        "SELECT language, compare_selection, state, data, bucket FROM users"
+        " WHERE chat = ? AND user = ?"
+    )
+
+    def __init__(self, path: str, capacity: int = 10000, ttl: float = 3600.0,
+                 flush_interval: float = 2.0):
+        self.path = path
+        self.capacity = capacity
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+
+        self._cache: "OrderedDict[Key, UserData]" = OrderedDict()
+        self._dirty: Dict[Key, UserData] = {}
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._write_lock = threading.Lock()
+        self._read_lock = threading.Lock()
+
+        # Вызывается при смене состояния FSM: on_state_change(старое, новое)
+        self.on_state_change: Optional[Callable[[Optional[str], Optional[str]], None]] = None
+
+        # Соединения открываются не при импорте, а в start() или при первом обращении к диску
+        self._writer: Optional[sqlite3.Connection] = None
+        self._reader: Optional[sqlite3.Connection] = None
+        self._connect_lock = threading.Lock()
+
+        # Число пользователей с незавершенным сценарием FSM (с диска добавляется при подключении)
+        self.active_sessions: int = 0
+
+    def _connect(self):
+        """Открывает соединения с файлом; вызывается из цикла событий или из потока пула"""
+        with self._connect_lock:
+            if self._reader is not None:
+                return
+            # Отдельные соединения для чтения и записи (оба из потоков пула), WAL не блокирует чтение
+            writer = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+            writer.execute("PRAGMA journal_mode=WAL")
+            writer.execute("PRAGMA synchronous=NORMAL")
+            writer.execute(self.SCHEMA)
+            writer.commit()
+            reader = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+            self.active_sessions += reader.execute("SELECT COUNT(*) FROM users WHERE state IS NOT NULL").fetchone()[0]
+            self._writer = writer
+            self._reader = reader
+
+    # ---------- Работа с записями ----------
+
+    def get_record(self, chat: int, user: int) -> UserData:
+        """
+        Возвращает запись из памяти, при промахе читает её с диска или создает новую.
+        Промах читается синхронно, поэтому в цикле событий запись сначала
+        загружается через load_record.
+        """
+        key = (int(chat), int(user))
+        record = self._cache.get(key)
+        if record is None:
+            record = self._remember(key, self._dirty.get(key) or self._read(key))
+        else:
+            self._cache.move_to_end(key)
+        record.touched = time.monotonic()
+        return record
+
+    async def load_record(self, chat: int, user: int) -> UserData:
+        """Как get_record, но при промахе читает запись с диска в потоке пула"""
+        key = (int(chat), int(user))
+        if key in self._cache or key in self._dirty:
+            return self.get_record(*key)
+        loaded = await asyncio.get_event_loop().run_in_executor(None, self._read, key)
+        # За время чтения запись могла появиться в памяти: она новее прочитанной
+        if key in self._cache or key in self._dirty:
+            return self.get_record(*key)
+        record = self._remember(key, loaded)
+        record.touched = time.monotonic()
+        return record
+
+    def _remember(self, key: Key, record: Optional[UserData]) -> UserData:
+        record = record or UserData()
+        self._cache[key] = record
+        self._evict_overflow()
+        return record
+
+    def mark_dirty(self, chat: int, user: int):
+        """Помечает запись для записи на диск при следующем сбросе"""
+        key = (int(chat), int(user))
+        record = self._cache.get(key) or self._dirty.get(key)
+        if record is not None:
+            self._dirty[key] = record
+
+    def _read(self, key: Key) -> Optional[UserData]:
+        if self._reader is None:
+            self._connect()
+        with self._read_lock:
+            row = self._reader.execute(self.SELECT, key).fetchone()
+        if row is None:
+            return None
+        language, compare_selection, state, data, bucket = row
+        return UserData(language, json.loads(compare_selection), state, json.loads(data), json.loads(bucket))
+
+    def _evict_overflow(self):
+        # Вытесненные несохраненные записи остаются в _dirty до ближайшего сброса
+        while len(self._cache) > self.capacity:
+            self._cache.popitem(last=False)
+
+    def _evict_expired(self):
+        deadline = time.monotonic() - self.ttl
+        while self._cache:
+            key, record = next(iter(self._cache.items()))
+            if record.touched > deadline:
+                break
+            del self._cache[key]
+
+    @property
+    def cached_count(self) -> int:
+        return len(self._cache)
+
+    # ---------- Фоновая запись на диск ----------
+
+    def start(self):
+        """Открывает файл в фоновом потоке и запускает задачу периодического сброса изменений"""
+        if self._flush_task is None:
+            loop = asyncio.get_event_loop()
+            loop.run_in_executor(None, self._connect)
+            self._flush_task = loop.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка записи состояний на диск: {e}", exc_info=True)
+            self._evict_expired()
+
+    async def flush(self):
+        """Записывает накопленные изменения одной транзакцией"""
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            batch, self._dirty = self._dirty, {}
+            now = time.time()
+            rows = [
+                (chat, user, record.language, json.dumps(record.compare_selection, ensure_ascii=False),
+                 record.state, json.dumps(record.data, ensure_ascii=False),
+                 json.dumps(record.bucket, ensure_ascii=False), now)
+                for (chat, user), record in batch.items()
+            ]
+            try:
+                await asyncio.get_event_loop().run_in_executor(None, self._write, rows)
+            except Exception:
+                # Возвращаем в очередь все, что не было изменено повторно за время записи
+                for key, record in batch.items():
+                    self._dirty.setdefault(key, record)
+                raise
+
+    def _write(self, rows: List[tuple]):
+        if self._writer is None:
+            self._connect()
+        with self._write_lock:
+            with self._writer:
+                self._writer.executemany(self.UPSERT, rows)
+
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush()
+
+    async def wait_closed(self):
+        with self._connect_lock:
+            if self._reader is None:
+                return
+        with self._write_lock:
+            self._writer.close()
+        with self._read_lock:
+            self._reader.close()
+
+    # ---------- Интерфейс BaseStorage ----------
+
+    async def _record(self, chat, user) -> Tuple[int, int, UserData]:
+        chat, user = self.check_address(chat=chat, user=user)
+        return chat, user, await self.load_record(chat, user)
+
+    async def get_state(self, *, chat=None, user=None, default: Optional[str] = None) -> Optional[str]:
+        _, _, record = await self._record(chat, user)
+        return record.state if record.state is not None else self.resolve_state(default)
+
+    async def get_data(self, *, chat=None, user=None, default: Optional[dict] = None) -> Dict:
+        _, _, record = await self._record(chat, user)
+        return copy.deepcopy(record.data)
+
+    def _change_state(self, record: UserData, state):
+        old_state, record.state = record.state, self.resolve_state(state)
+        if (old_state is None) != (record.state is None):
+            self.active_sessions += 1 if old_state is None else -1
+        if self.on_state_change is not None:
+            self.on_state_change(old_state, record.state)
+
+    async def set_state(self, *, chat=None, user=None, state=None):
+        chat, user, record = await self._record(chat, user)
+        self._change_state(record, state)
+        self.mark_dirty(chat, user)
+
+    async def set_data(self, *, chat=None, user=None, data: Dict = None):
+        chat, user, record = await self._record(chat, user)
+        record.data = copy.deepcopy(data or {})
+        self.mark_dirty(chat, user)
+
+    async def apply_changes(self, *, chat=None, user=None, changes: Dict[str, Any]):
+        """
+        Записывает изменения FSM одной операцией: state — новое состояние,
+        data — новые данные, data_update — ключи, которые нужно обновить в данных
+        """
+        chat, user, record = await self._record(chat, user)
+        if "state" in changes:
+            self._change_state(record, changes["state"])
+        # Словари из changes переходят во владение хранилища без копирования
+        if "data" in changes:
+            record.data = changes["data"]
+        if "data_update" in changes:
+            record.data.update(changes["data_update"])
+        self.mark_dirty(chat, user)
+
+    async def update_data(self, *, chat=None, user=None, data: Dict = None, **kwargs):
+        chat, user, record = await self._record(chat, user)
+        record.data.update(data or {}, **kwargs)
+        self.mark_dirty(chat, user)
+
+    def has_bucket(self):
+        return True
+
+    async def get_bucket(self, *, chat=None, user=None, default: Optional[dict] = None) -> Dict:
+        _, _, record = await self._record(chat, user)
+        return copy.deepcopy(record.bucket)
+
+    async def set_bucket(self, *, chat=None, user=None, bucket: Dict = None):
+        chat, user, record = await self._record(chat, user)
+        record.bucket = copy.deepcopy(bucket or {})
+        self.mark_dirty(chat, user)
+
+    async def update_bucket(self, *, chat=None, user=None, bucket: Dict = None, **kwargs):
+        chat, user, record = await self._record(chat, user)
+        record.bucket.update(bucket or {}, **kwargs)
+        self.mark_dirty(chat, user)
+
+
+class _PendingRecord:
+    """Состояние и данные FSM одного ключа, прочитанные и измененные за время единицы работы"""
+    __slots__ = ("state", "data", "data_update", "state_loaded", "data_loaded", "changed")
+
+    def __init__(self):
+        self.state: Optional[str] = None
+        self.data: Dict[str, Any] = {}
+        # Обновления данных, которые еще не читались: записываются без чтения
+        self.data_update: Dict[str, Any] = {}
+        self.state_loaded = False
+        self.data_loaded = False
+        self.changed: set = set()
+
+
+# Единица работы текущего обновления: ключ (chat, user) → буфер изменений
+_unit: ContextVar[Optional[Dict[Key, _PendingRecord]]] = ContextVar("fsm_unit_of_work", default=None)
+
+
+class UnitOfWorkStorage(BaseStorage):
+    """
+    Буферизующая обертка над хранилищем FSM.
+
+    Между begin() и commit() состояние и данные каждого ключа читаются из
+    хранилища не больше одного раза, а изменения копятся в памяти и
+    записываются при commit(): apply_changes хранилища, если оно его
+    поддерживает, иначе set_state, set_data и update_data. update_data
+    без предшествующего чтения данных не читает их из хранилища.
+    rollback() отбрасывает
+    изменения. Вне единицы работы (begin не вызван в текущем контексте)
+    запросы передаются хранилищу напрямую. Bucket не буферизуется.
+
+    :param storage: хранилище, в которое записываются изменения
+    """
+
+    def __init__(self, storage: BaseStorage):
+        self.storage = storage
+
+    # ---------- Единица работы ----------
+
+    def begin(self):
+        """Начинает единицу работы в текущем контексте (задаче asyncio)"""
+        _unit.set({})
+
+    async def commit(self):
+        """Записывает накопленные изменения и завершает единицу работы"""
+        pending = _unit.get()
+        _unit.set(None)
+        if not pending:
+            return
+        apply_changes = getattr(self.storage, "apply_changes", None)
+        for (chat, user), record in pending.items():
+            if not record.changed:
+                continue
+            changes = {name: getattr(record, name) for name in record.changed}
+            if apply_changes is not None:
+                await apply_changes(chat=chat, user=user, changes=changes)
+                continue
+            if "state" in changes:
+                await self.storage.set_state(chat=chat, user=user, state=changes["state"])
+            if "data" in changes:
+                await self.storage.set_data(chat=chat, user=user, data=changes["data"])
+            if "data_update" in changes:
+                await self.storage.update_data(chat=chat, user=user, data=changes["data_update"])
+
+    def rollback(self):
+        """Отбрасывает накопленные изменения и завершает единицу работы"""
+        _unit.set(None)
+
+    def _pending(self, chat, user) -> Tuple[Optional[_PendingRecord], Optional[int], Optional[int]]:
+        chat, user = self.check_address(chat=chat, user=user)
+        pending = _unit.get()
+        if pending is None:
+            return None, chat, user
+        record = pending.get((chat, user))
+        if record is None:
+            record = pending[(chat, user)] = _PendingRecord()
+        return record, chat, user
+
+    async def _load_data(self, record: _PendingRecord, chat, user) -> Dict[str, Any]:
+        if not record.data_loaded:
+            record.data = await self.storage.get_data(chat=chat, user=user)
+            record.data.update(record.data_update)
+            record.data_loaded = True
+            if record.data_update:
+                record.data_update = {}
+                record.changed.discard("data_update")
+                record.changed.add("data")
+        return record.data
+
+    # ---------- Интерфейс BaseStorage ----------
+
+    async def get_state(self, *, chat=None, user=None, default: Optional[str] = None) -> Optional[str]:
+        record, chat, user = self._pending(chat, user)
+        if record is None:
+            return await self.storage.get_state(chat=chat, user=user, default=default)
+        if not record.state_loaded:
+            record.state = await self.storage.get_state(chat=chat, user=user)
+            record.state_loaded = True
+        return record.state if record.state is not None else self.resolve_state(default)
+
+    async def get_data(self, *, chat=None, user=None, default: Optional[dict] = None) -> Dict:
+        record, chat, user = self._pending(chat, user)
+        if record is None:
+            return await self.storage.get_data(chat=chat, user=user, default=default)
+        return copy.deepcopy(await self._load_data(record, chat, user))
+
+    async def set_state(self, *, chat=None, user=None, state=None):
+        record, chat, user = self._pending(chat, user)
+        if record is None:
+            return await self.storage.set_state(chat=chat, user=user, state=state)
+        state = self.resolve_state(state)
+        if record.state_loaded and state == record.state and "state" not in record.changed:
+            return
+        record.state = state
+        record.state_loaded = True
+        record.changed.add("state")
+
+    async def set_data(self, *, chat=None, user=None, data: Dict = None):
+        record, chat, user = self._pending(chat, user)
+        if record is None:
+            return await self.storage.set_data(chat=chat, user=user, data=data)
+        record.data = copy.deepcopy(data or {})
+        record.data_loaded = True
+        record.data_update = {}
+        record.changed.discard("data_update")
+        record.changed.add("data")
+
+    async def update_data(self, *, chat=None, user=None, data: Dict = None, **kwargs):
+        record, chat, user = self._pending(chat, user)
+        if record is None:
+            return await self.storage.update_data(chat=chat, user=user, data=data, **kwargs)
+        if record.data_loaded:
+            record.data.update(copy.deepcopy(dict(data or {}, **kwargs)))
+            record.changed.add("data")
+        else:
+            record.data_update.update(copy.deepcopy(dict(data or {}, **kwargs)))
+            record.changed.add("data_update")
+
+    def has_bucket(self):
+        return self.storage.has_bucket()
+
+    async def get_bucket(self, *, chat=None, user=None, default: Optional[dict] = None) -> Dict:
+        return await self.storage.get_bucket(chat=chat, user=user, default=default)
+
+    async def set_bucket(self, *, chat=None, user=None, bucket: Dict = None):
+        await self.storage.set_bucket(chat=chat, user=user, bucket=bucket)
+
+    async def update_bucket(self, *, chat=None, user=None, bucket: Dict = None, **kwargs):
+        await self.storage.update_bucket(chat=chat, user=user, bucket=bucket, **kwargs)
+
+    async def close(self):
+        await self.storage.close()
+
+    async def wait_closed(self):
+        await self.storage.wait_closed()
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+Общие настройки тестов.
+
+main читает Config из окружения при импорте, поэтому окружение задается
+здесь, до импорта тестовых модулей: тестовый токен, журнал только в
+консоль, файлы состояний во временном каталоге, без перезагрузки данных.
+Все асинхронные тесты выполняются в одном цикле событий.
+
+Запуск из корня репозитория:
+    python -m pytest -q
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Файлы с данными main открывает по относительным путям
+os.chdir(ROOT)
+sys.path.insert(0, ROOT)
+
+_TMP_DIR = tempfile.mkdtemp(prefix="uhm_tests_")
+os.environ.update({
+    "BOT_TOKEN": "123456:tests",
+    "LOG_FILE": "",
+    "ADMIN_IDS": "",
+    "RELOAD_INTERVAL": "0",
+    "METRICS_PORT": "0",
+    "STATE_DB_PATH": os.path.join(_TMP_DIR, "state.sqlite3"),
+    "PHOTO_CACHE_FILE": os.path.join(_TMP_DIR, "photo_cache.json"),
+})
+
+LOOP = asyncio.new_event_loop()
+asyncio.set_event_loop(LOOP)
+
+
+@pytest.fixture
+def run():
+    """Выполняет корутину в общем цикле событий тестов"""
+    return LOOP.run_until_complete
+
+
+@pytest.fixture
+def bot():
+    """
+    Заглушка Bot из benchmarks.replay, подключенная к main.dp; запоминает
+    вызовы API (метод, параметры), а для методов из failures выбрасывает
+    заданное исключение
+    """
+    from benchmarks import replay
+    from outbound import SendScheduler
+
+    class RecordingBot(replay.StubBot):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.calls = []
+            self.failures = {}
+
+        async def perform_request(self, method, data=None, files=None, **kwargs):
+            self.calls.append((method, dict(data or {})))
+            if method in self.failures:
+                raise self.failures[method]
+            return await super().perform_request(method, data, files, **kwargs)
+
+        def methods(self):
+            return [method for method, _ in self.calls]
+
+    recording = RecordingBot(token=replay.main.Config.BOT_TOKEN, parse_mode="HTML",
+                             scheduler=SendScheduler(global_rate=1e9, chat_rate=1e9, chat_burst=1e9))
+    replay.install_bot(replay.main.dp, recording)
+    return recording
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""Разбор накопившихся обновлений: обрабатываются только подтвержденные offset пачки"""
+import time
+
+import pytest
+from aiogram.utils.exceptions import NetworkError
+
+import main
+
+
+class FakeTelegram:
+    """
+    Очередь getUpdates: запрос с offset подтверждает (удаляет) обновления до
+    него; failures — номера вызовов (с 1), которые завершаются ошибкой
+    """
+
+    def __init__(self, updates, failures=()):
+        self.pending = list(updates)
+        self.failures = set(failures)
+        self.offsets = []
+
+    async def request(self, method, data=None, files=None, **kwargs):
+        assert method == "getUpdates"
+        self.offsets.append(data.get("offset"))
+        if len(self.offsets) in self.failures:
+            raise NetworkError("Bad Gateway")
+        if "offset" in data:
+            self.pending = [raw for raw in self.pending if raw["update_id"] >= data["offset"]]
+        return self.pending[:data["limit"]]
+
+
+def make_updates(count, first_id=1, date=None):
+    date = int(time.time()) if date is None else date
+    return [{"update_id": update_id, "message": {
+        "message_id": update_id, "date": date, "text": "/start",
+        "chat": {"id": update_id, "type": "private"}, "from": {"id": update_id, "is_bot": False, "first_name": "u"},
+    }} for update_id in range(first_id, first_id + count)]
+
+
+@pytest.fixture
+def drain(run, monkeypatch):
+    """Запускает drain_backlog с заданной очередью; возвращает (offset, отчет, обработанные id, паузы)"""
+    monkeypatch.setattr(main, "BACKLOG_BATCH_SIZE", 10)
+    sleeps = []
+
+    async def sleep(delay):
+        sleeps.append(delay)
+
+    monkeypatch.setattr(main.asyncio, "sleep", sleep)
+
+    def drain_with(telegram):
+        monkeypatch.setattr(main.bot, "request", telegram.request)
+        handled = []
+
+        async def handle_batch(updates):
+            handled.extend(raw["update_id"] for raw in updates)
+
+        offset, report = run(main.drain_backlog(handle_batch))
+        return offset, report, handled, sleeps
+
+    return drain_with
+
+
+def test_empty_queue(drain):
+    telegram = FakeTelegram([])
+    assert drain(telegram) == (None, None, [], [])
+    assert telegram.offsets == [None]
+
+
+def test_all_batches_confirmed(drain):
+    telegram = FakeTelegram(make_updates(25))
+    offset, report, handled, _ = drain(telegram)
+    assert telegram.offsets == [None, 11, 21, 26]
+    assert offset == 26
+    assert handled == list(range(1, 26))
+    assert report.startswith("Накопилось обновлений: 25, устаревших пропущено: 0")
+
+
+def test_transient_error_is_retried(drain):
+    telegram = FakeTelegram(make_updates(15), failures={2})
+    offset, _, handled, sleeps = drain(telegram)
+    assert telegram.offsets == [None, 11, 11, 16]
+    assert offset == 16
+    assert handled == list(range(1, 16))
+    assert sleeps == [1]
+
+
+def test_unconfirmed_batch_is_not_handled(drain):
+    retries = main.BACKLOG_RETRIES
+    telegram = FakeTelegram(make_updates(25), failures=range(3, 3 + retries))
+    offset, report, handled, sleeps = drain(telegram)
+    assert telegram.offsets == [None, 11] + [21] * retries
+    assert offset == 11
+    assert handled == list(range(1, 11))
+    assert sleeps == list(range(1, retries))
+    # Неподтвержденная пачка осталась в очереди Telegram
+    assert [raw["update_id"] for raw in telegram.pending] == list(range(11, 26))
+
+
+def test_first_batch_unconfirmed(drain):
+    telegram = FakeTelegram(make_updates(5), failures=range(2, 2 + main.BACKLOG_RETRIES))
+    assert drain(telegram)[:3] == (None, None, [])
+
+
+def test_stale_updates_skipped(drain, monkeypatch):
+    monkeypatch.setattr(main.Config, "BACKLOG_MAX_AGE", 900.0)
+    old = int(time.time()) - 3600
+    telegram = FakeTelegram(make_updates(4, date=old) + make_updates(3, first_id=5))
+    offset, report, handled, _ = drain(telegram)
+    assert offset == 8
+    assert handled == [5, 6, 7]
+    assert "устаревших пропущено: 4" in report
+
+
+def test_callback_without_date_is_not_stale(monkeypatch):
+    monkeypatch.setattr(main.Config, "BACKLOG_MAX_AGE", 900.0)
+    raw = {"update_id": 1, "callback_query": {"id": "1", "data": "x"}}
+    assert not main.is_stale(raw, time.time())
+    monkeypatch.setattr(main.Config, "BACKLOG_MAX_AGE", 0.0)
+    assert not main.is_stale(make_updates(1, date=0)[0], time.time())
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""Разбор чисел и ввода всех значений калькулятора одной строкой"""
+import pytest
+
+import main
+from main import is_one_shot_input, join_digit_groups, parse_calculator_input, parse_number
+
+FULL = {
+    "hours_per_day": 10, "days_per_month": 22, "months_total": 12, "rent_per_month": 15e6,
+    "operator_salary": 5e6, "fuel_per_day": 60, "fuel_price": 12500, "service_cost": 10e6,
+}
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ("10", 10),
+    ("7,5", 7.5),
+    ("7.5", 7.5),
+    ("15млн", 15e6),
+    ("900к", 900e3),
+    ("900K", 900e3),
+    ("2тыс", 2e3),
+    ("1_000", 1000),
+    ("десять", None),
+    ("-5", None),
+    ("10 часов", None),
+    ("", None),
+])
+def test_parse_number(raw, expected):
+    assert parse_number(raw) == expected
+
+
+def test_join_digit_groups():
+    assert join_digit_groups("аренда 15 000 000, зп 5 000 000") == "аренда 15000000, зп 5000000"
+    assert join_digit_groups("10 22") == "10 22"
+    assert join_digit_groups("1.5 000") == "1.5 000"
+    assert join_digit_groups("1 000,5") == "1 000,5"
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("10", False),
+    ("10 часов", False),
+    ("10:30", False),
+    ("15 000 000", False),
+    ("15млн", False),
+    ("10 22", True),
+    ("10 22 12 15млн 5млн 60 12500 10млн", True),
+    ("часы=10", True),
+    ("зп: 5млн", True),
+    ("Аренда = 15 000 000", True),
+])
+def test_is_one_shot_input(text, expected):
+    assert is_one_shot_input(text) is expected
+
+
+@pytest.mark.parametrize("text", [
+    "10 22 12 15млн 5млн 60 12500 10млн",
+    "10; 22; 12; 15000000; 5000000; 60; 12 500; 10 000 000",
+    "часы=10 дни=22 мес=12 аренда=15млн зп=5млн топливо=60 цена=12500 сервис=10млн",
+    "зп: 5млн аренда = 15 000 000 10 22 12 60 12500 10млн",
+    "10 22 12 15 000 000 5 000 000 60 12 500 10 000 000",
+])
+def test_parse_calculator_input(text):
+    values, errors = parse_calculator_input(text)
+    assert errors == []
+    assert values == FULL
+
+
+def test_parse_calculator_input_errors():
+    values, errors = parse_calculator_input("часы=25 дни=22 дни=20 скорость=5 12 15млн 5млн 60 12500")
+    assert errors == [
+        "дни: указано дважды",
+        "«скорость»: неизвестное поле",
+        "часы: «25» — нужно число от 0 до 24",
+        "обслуживание: не указано",
+    ]
+    assert "hours_per_day" not in values and values["days_per_month"] == 22
+
+
+def test_parse_calculator_input_extra_values():
+    _, errors = parse_calculator_input("10 22 12 15млн 5млн 60 12500 10млн 7")
+    assert errors == ["лишние значения: 7"]
+
+
+def test_every_field_has_unique_aliases():
+    aliases = [alias for field in main.CALCULATOR_FIELDS for alias in field.aliases]
+    assert len(aliases) == len(set(aliases))
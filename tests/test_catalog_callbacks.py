@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""Проверка данных кнопок карточек каталога и замены карточки"""
+import itertools
+
+import pytest
+from aiogram import types
+from aiogram.utils.exceptions import BadRequest
+
+import main
+
+USER_ID = 5
+_update_ids = itertools.count(1000)
+
+
+def callback_update(data: str, photo: bool = True) -> types.Update:
+    message = {"message_id": 1, "date": 0, "chat": {"id": USER_ID, "type": "private"}}
+    if photo:
+        message["photo"] = [{"file_id": "card", "file_unique_id": "card", "width": 800, "height": 600}]
+    else:
+        message["text"] = "карточка"
+    update_id = next(_update_ids)
+    return types.Update(**{"update_id": update_id, "callback_query": {
+        "id": str(update_id), "chat_instance": "1", "data": data, "message": message,
+        "from": {"id": USER_ID, "is_bot": False, "first_name": "u"},
+    }})
+
+
+def card_data(category, index, action: str = "show", version: str = None) -> str:
+    version = version or main.current_data().catalog.version[:main.CATALOG_VERSION_LENGTH]
+    return f"cat:{version}:{category}:{index}:{action}"
+
+
+def answers(bot):
+    return [data.get("text") for method, data in bot.calls if method == "answerCallbackQuery"]
+
+
+@pytest.mark.parametrize("category, index", [
+    ("0", "999"),
+    ("999", "0"),
+    ("0", "-1"),
+    ("x", "0"),
+    ("0", "1e3"),
+    ("", "0"),
+])
+def test_forged_card_is_rejected(bot, run, category, index):
+    run(main.dp.process_updates([callback_update(card_data(category, index))]))
+    assert answers(bot) == ["Модель не найдена, откройте категорию заново."]
+    assert not [method for method in bot.methods() if method.startswith(("send", "edit", "delete"))]
+
+
+def test_stale_catalog_version(bot, run):
+    run(main.dp.process_updates([callback_update(card_data(0, 0, version="00000000"))]))
+    assert answers(bot) == ["Каталог обновился, откройте категорию заново."]
+    assert "editMessageMedia" not in bot.methods()
+
+
+def test_unknown_action_only_answers(bot, run):
+    run(main.dp.process_updates([callback_update(card_data(0, 0, action="bogus"))]))
+    assert bot.methods() == ["answerCallbackQuery"]
+
+
+def test_show_edits_card_photo(bot, run):
+    run(main.dp.process_updates([callback_update(card_data(0, 0))]))
+    assert "editMessageMedia" in bot.methods()
+    assert "sendPhoto" not in bot.methods()
+
+
+def test_show_replaces_card_without_photo(bot, run):
+    run(main.dp.process_updates([callback_update(card_data(0, 0), photo=False)]))
+    methods = bot.methods()
+    assert "editMessageMedia" not in methods
+    assert methods.index("deleteMessage") < methods.index("sendPhoto")
+
+
+def test_show_replaces_card_when_edit_fails(bot, run):
+    bot.failures["editMessageMedia"] = BadRequest("Wrong file identifier/http url specified")
+    run(main.dp.process_updates([callback_update(card_data(0, 0))]))
+    methods = bot.methods()
+    assert "editMessageMedia" in methods
+    assert methods.index("deleteMessage") < methods.index("sendPhoto")
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""Очередность обновлений внутри чата и отмена ожидающих обновлений"""
+import asyncio
+
+import pytest
+
+from sharding import ChatSerializer
+
+
+async def settle():
+    """Дает выполниться всем задачам, готовым к запуску"""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_order_within_chat_parallel_across_chats(run):
+    serializer = ChatSerializer(max_concurrency=0)
+    events = []
+    running = set()
+    overlapped = []
+
+    async def handle(chat_id, n):
+        await serializer.acquire(chat_id)
+        try:
+            running.add(chat_id)
+            overlapped.append(len(running))
+            events.append((chat_id, n))
+            await asyncio.sleep(0.001 * (3 - n))
+        finally:
+            running.discard(chat_id)
+            serializer.release(chat_id)
+
+    async def scenario():
+        await asyncio.gather(*(handle(chat_id, n) for n in range(3) for chat_id in (1, 2)))
+
+    run(scenario())
+    assert [n for chat_id, n in events if chat_id == 1] == [0, 1, 2]
+    assert [n for chat_id, n in events if chat_id == 2] == [0, 1, 2]
+    assert max(overlapped) == 2
+    assert serializer.active_chats == 0
+
+
+def test_max_concurrency(run):
+    serializer = ChatSerializer(max_concurrency=2)
+    running = []
+    peak = []
+
+    async def handle(chat_id):
+        await serializer.acquire(chat_id)
+        running.append(chat_id)
+        peak.append(len(running))
+        await asyncio.sleep(0.001)
+        running.remove(chat_id)
+        serializer.release(chat_id)
+
+    run(asyncio.gather(*(handle(chat_id) for chat_id in range(6))))
+    assert max(peak) == 2
+    assert serializer.active_chats == 0
+
+
+def test_cancel_waiter(run):
+    serializer = ChatSerializer()
+    order = []
+
+    async def handle(n):
+        await serializer.acquire(1)
+        order.append(n)
+        serializer.release(1)
+
+    async def scenario():
+        await serializer.acquire(1)
+        waiting = [asyncio.ensure_future(handle(n)) for n in range(3)]
+        await settle()
+        waiting[1].cancel()
+        await settle()
+        serializer.release(1)
+        await asyncio.wait(waiting, timeout=1)
+        return waiting[1].cancelled()
+
+    assert run(scenario())
+    assert order == [0, 2]
+    assert serializer.active_chats == 0
+
+
+def test_cancel_after_turn_is_passed(run):
+    serializer = ChatSerializer()
+    order = []
+
+    async def handle(n):
+        await serializer.acquire(1)
+        order.append(n)
+        serializer.release(1)
+
+    async def scenario():
+        await serializer.acquire(1)
+        first, second = asyncio.ensure_future(handle(1)), asyncio.ensure_future(handle(2))
+        await settle()
+        # Очередь передана first, но отмена приходит раньше, чем он успевает продолжить
+        serializer.release(1)
+        first.cancel()
+        # Если очередь не передана дальше, second ждет вечно
+        await asyncio.wait([first, second], timeout=1)
+        return first.cancelled()
+
+    assert run(scenario())
+    assert order == [2]
+    assert serializer.active_chats == 0
+
+
+def test_cancel_while_waiting_for_slot(run):
+    serializer = ChatSerializer(max_concurrency=1)
+
+    async def scenario():
+        await serializer.acquire(1)
+        blocked = asyncio.ensure_future(serializer.acquire(2))
+        await settle()
+        assert serializer.active_chats == 2
+        blocked.cancel()
+        await settle()
+        assert serializer.active_chats == 1
+        serializer.release(1)
+        # Слот не потерян: другой чат получает его сразу
+        await asyncio.wait_for(serializer.acquire(3), 1)
+        serializer.release(3)
+        return blocked.cancelled()
+
+    assert run(scenario())
+    assert serializer.active_chats == 0
+
+
+@pytest.mark.parametrize("max_concurrency", [0, 4])
+def test_release_without_waiters_forgets_chat(run, max_concurrency):
+    serializer = ChatSerializer(max_concurrency=max_concurrency)
+
+    async def scenario():
+        await serializer.acquire(1)
+        assert serializer.active_chats == 1
+        serializer.release(1)
+
+    run(scenario())
+    assert serializer.active_chats == 0
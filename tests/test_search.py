@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""Нечеткий поиск по триграммам: опечатки, похожие буквы, ранжирование и векторный подсчет"""
+import random
+
+import pytest
+
+import search
+from search import SearchIndex
+
+NAMES = ("JCB 3CX Eco", "JCB 3CX PRO", "JCB 3CX PLUS", "JCB 3DX PRO", "JCB 4CX Sitemaster",
+         "JCB 19C-1", "JCB 36С-1", "JCB SSL 155")
+
+
+@pytest.fixture(scope="module")
+def index():
+    return SearchIndex([(name, [(name, 1.0), ("экскаватор-погрузчик", 0.3)]) for name in NAMES])
+
+
+def test_tokens_split_letters_and_digits():
+    assert search.tokens("JS220 Pro") == ["js220", "js", "220", "pro"]
+
+
+def test_normalize_cyrillic_lookalikes():
+    assert search.normalize("JCB 36С-1") == search.normalize("jcb 36c-1")
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("3cx pro", "JCB 3CX PRO"),
+    ("3cxpro", "JCB 3CX PRO"),
+    ("3СХ PRO", "JCB 3CX PRO"),
+    ("4cx sitemastr", "JCB 4CX Sitemaster"),
+    ("36c", "JCB 36С-1"),
+    ("ssl155", "JCB SSL 155"),
+])
+def test_best_match(index, query, expected):
+    assert index.search(query)[0] == expected
+
+
+def test_no_match(index):
+    assert index.search("трактор беларус") == ()
+
+
+def test_limit(index):
+    assert len(index.search("jcb 3cx", limit=2)) == 2
+
+
+def test_result_is_cached(index):
+    first = index.search("3cx   eco")
+    assert index.search("3CX eco") is first
+
+
+def make_documents(size: int, seed: int = 1):
+    rng = random.Random(seed)
+    documents = []
+    for i in range(size):
+        name = f"JCB {rng.choice(('CX', 'DX', 'JS', 'SSL'))}{rng.randint(10, 999)} {rng.choice(('Eco', 'PRO'))} {i}"
+        documents.append((name, [(name, 1.0), (rng.choice(("экскаватор", "погрузчик")), 0.3)]))
+    return documents
+
+
+@pytest.mark.parametrize("query", ["cx120 pro", "js 220", "cx pro", "ssl", "zzz"])
+def test_vectorized_ranking_matches_python(query):
+    index = SearchIndex(make_documents(search.VECTORIZE_MIN_DOCUMENTS + 200))
+    weighted = sorted(((index._idf.get(gram, index._missing_idf), gram) for gram in search.trigrams(query)),
+                      reverse=True)
+    for limit in (1, 5, 50):
+        assert index._rank_vectorized(weighted, limit, 0.35) == index._rank(weighted, limit, 0.35)
+
+
+def test_small_index_is_not_vectorized(monkeypatch):
+    index = SearchIndex(make_documents(50))
+    monkeypatch.setattr(SearchIndex, "_rank_vectorized", None)
+    assert index.search("cx pro")
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""Разбор характеристик моделей (parse_spec) и выбор лучших значений при сравнении"""
+import pytest
+
+import main
+from main import SpecValue, best_values, parse_spec
+
+
+@pytest.mark.parametrize("raw, quantities", [
+    ("76 л.с. / 55 кВт", ((76.0, "л.с."), (55.0, "кВт"))),
+    ("1,1 м³", ((1.1, "м³"),)),
+    ("0,03-0,21 м³", ((0.21, "м³"),)),
+    ("2500 мм", ((2.5, "м"),)),
+    ("8 т", ((8000.0, "кг"),)),
+    ("55 кВт (при 2200 об/мин)", ((55.0, "кВт"),)),
+    (12, ((12.0, ""),)),
+])
+def test_numeric_values(raw, quantities):
+    parsed = parse_spec(raw).quantities
+    assert [unit for _, unit in parsed] == [unit for _, unit in quantities]
+    assert [number for number, _ in parsed] == pytest.approx([number for number, _ in quantities])
+
+
+def test_text_is_kept_with_normalized_spaces():
+    assert parse_spec("  76 л.с.  /  55 кВт ").text == "76 л.с. / 55 кВт"
+
+
+@pytest.mark.parametrize("raw", ["Perkins", "", "до 55 кВт"])
+def test_non_numeric_values_have_no_quantities(raw):
+    assert parse_spec(raw) == SpecValue(" ".join(raw.split()), ())
+
+
+def test_best_value_compares_common_units():
+    values = [parse_spec("76 л.с. / 55 кВт"), parse_spec("74 кВт"), None]
+    assert best_values(values, "max") == {1}
+
+
+def test_best_value_converts_units():
+    assert best_values([parse_spec("8 т"), parse_spec("7500 кг")], "min") == {1}
+
+
+def test_no_best_value_for_equal_values_or_without_preference():
+    assert best_values([parse_spec("5 т"), parse_spec("5000 кг")], "max") == set()
+    assert best_values([parse_spec("5 т"), parse_spec("6 т")], None) == set()
+
+
+def test_catalog_specs_are_parsed():
+    catalog = main.DATA.catalog
+    for name, specs in catalog.specs.items():
+        for key, value in specs.items():
+            assert value.text == " ".join(str(catalog.by_name[name]["specs"][key]).split())
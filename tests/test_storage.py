@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""Единица работы FSM поверх MemoryStorage и UserStateStorage"""
+from collections import Counter
+
+import pytest
+from aiogram.contrib.fsm_storage.memory import MemoryStorage
+
+from storage import UnitOfWorkStorage, UserStateStorage
+
+CHAT = USER = 7
+
+
+class CountingStorage(MemoryStorage):
+    """MemoryStorage, считающий обращения к себе"""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = Counter()
+
+    async def get_state(self, **kwargs):
+        self.calls["get_state"] += 1
+        return await super().get_state(**kwargs)
+
+    async def get_data(self, **kwargs):
+        self.calls["get_data"] += 1
+        return await super().get_data(**kwargs)
+
+    async def set_state(self, **kwargs):
+        self.calls["set_state"] += 1
+        return await super().set_state(**kwargs)
+
+    async def set_data(self, **kwargs):
+        self.calls["set_data"] += 1
+        return await super().set_data(**kwargs)
+
+    async def update_data(self, **kwargs):
+        self.calls["update_data"] += 1
+        return await super().update_data(**kwargs)
+
+
+@pytest.fixture
+def memory():
+    return CountingStorage()
+
+
+def test_commit_writes_changes(run, memory):
+    unit = UnitOfWorkStorage(memory)
+
+    async def scenario():
+        unit.begin()
+        await unit.set_state(chat=CHAT, user=USER, state="Calc:hours")
+        await unit.update_data(chat=CHAT, user=USER, model="JCB 3CX")
+        assert await unit.get_state(chat=CHAT, user=USER) == "Calc:hours"
+        assert memory.calls["set_state"] == memory.calls["update_data"] == 0
+        await unit.commit()
+
+    run(scenario())
+    assert run(memory.get_state(chat=CHAT, user=USER)) == "Calc:hours"
+    assert run(memory.get_data(chat=CHAT, user=USER)) == {"model": "JCB 3CX"}
+
+
+def test_rollback_discards_changes(run, memory):
+    run(memory.set_state(chat=CHAT, user=USER, state="Calc:hours"))
+    unit = UnitOfWorkStorage(memory)
+
+    async def scenario():
+        unit.begin()
+        await unit.set_state(chat=CHAT, user=USER, state=None)
+        await unit.set_data(chat=CHAT, user=USER, data={"model": "JCB 3CX"})
+        unit.rollback()
+
+    run(scenario())
+    assert run(memory.get_state(chat=CHAT, user=USER)) == "Calc:hours"
+    assert run(memory.get_data(chat=CHAT, user=USER)) == {}
+
+
+def test_reads_once_per_unit(run, memory):
+    run(memory.set_data(chat=CHAT, user=USER, data={"hours": 10}))
+    memory.calls.clear()
+    unit = UnitOfWorkStorage(memory)
+
+    async def scenario():
+        unit.begin()
+        for _ in range(3):
+            await unit.get_state(chat=CHAT, user=USER)
+            data = await unit.get_data(chat=CHAT, user=USER)
+        data["hours"] = 99
+        assert await unit.get_data(chat=CHAT, user=USER) == {"hours": 10}
+        await unit.commit()
+
+    run(scenario())
+    assert memory.calls == {"get_state": 1, "get_data": 1}
+
+
+def test_update_without_read(run, memory):
+    run(memory.set_data(chat=CHAT, user=USER, data={"hours": 10}))
+    memory.calls.clear()
+    unit = UnitOfWorkStorage(memory)
+
+    async def scenario():
+        unit.begin()
+        await unit.update_data(chat=CHAT, user=USER, days=22)
+        await unit.update_data(chat=CHAT, user=USER, data={"months": 12})
+        await unit.commit()
+
+    run(scenario())
+    assert memory.calls == {"update_data": 1}
+    assert run(memory.get_data(chat=CHAT, user=USER)) == {"hours": 10, "days": 22, "months": 12}
+
+
+def test_read_after_update_merges(run, memory):
+    run(memory.set_data(chat=CHAT, user=USER, data={"hours": 10}))
+    unit = UnitOfWorkStorage(memory)
+
+    async def scenario():
+        unit.begin()
+        await unit.update_data(chat=CHAT, user=USER, days=22)
+        assert await unit.get_data(chat=CHAT, user=USER) == {"hours": 10, "days": 22}
+        await unit.commit()
+
+    run(scenario())
+    assert run(memory.get_data(chat=CHAT, user=USER)) == {"hours": 10, "days": 22}
+
+
+def test_unchanged_state_is_not_written(run, memory):
+    run(memory.set_state(chat=CHAT, user=USER, state="Calc:hours"))
+    memory.calls.clear()
+    unit = UnitOfWorkStorage(memory)
+
+    async def scenario():
+        unit.begin()
+        state = await unit.get_state(chat=CHAT, user=USER)
+        await unit.set_state(chat=CHAT, user=USER, state=state)
+        await unit.commit()
+
+    run(scenario())
+    assert memory.calls == {"get_state": 1}
+
+
+def test_pass_through_outside_unit(run, memory):
+    unit = UnitOfWorkStorage(memory)
+    run(unit.set_state(chat=CHAT, user=USER, state="Calc:days"))
+    assert memory.calls["set_state"] == 1
+    assert run(unit.get_state(chat=CHAT, user=USER)) == "Calc:days"
+
+
+def test_user_state_storage_commit_and_reopen(run, tmp_path):
+    path = str(tmp_path / "state.sqlite3")
+    storage = UserStateStorage(path)
+    unit = UnitOfWorkStorage(storage)
+
+    async def scenario():
+        unit.begin()
+        await unit.set_state(chat=CHAT, user=USER, state="Calc:hours")
+        await unit.update_data(chat=CHAT, user=USER, model="JCB 3CX")
+        await unit.commit()
+        unit.begin()
+        await unit.set_state(chat=CHAT, user=USER, state=None)
+        unit.rollback()
+
+    run(scenario())
+    assert storage.active_sessions == 1
+    run(storage.close())
+    run(storage.wait_closed())
+
+    reopened = UserStateStorage(path)
+    assert run(reopened.get_state(chat=CHAT, user=USER)) == "Calc:hours"
+    assert run(reopened.get_data(chat=CHAT, user=USER)) == {"model": "JCB 3CX"}
+    assert reopened.active_sessions == 1
+    run(reopened.wait_closed())